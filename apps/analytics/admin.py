@@ -0,0 +1,56 @@
+from django.contrib import admin
+from . import reports
+from .models import DailySales, DailyProductColorSales, DailyCategorySales, RollupWatermark
+
+
+class ReadOnlyRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'status', 'orders', 'units', 'revenue')
+    list_filter = ('status',)
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailySales)
+class DailySalesAdmin(ReadOnlyRollupAdmin):
+    """Sales dashboard, built from the rollup tables only"""
+    change_list_template = 'admin/analytics/dashboard.html'
+    ordering = ('-date', 'status')
+
+    def changelist_view(self, request, extra_context=None):
+        # The range parameters are not changelist lookups, take them out
+        request.GET = request.GET.copy()
+        date_from, date_to = request.GET.pop('from', [None])[0], request.GET.pop('to', [None])[0]
+        try:
+            start, end = reports.date_range(date_from, date_to)
+        except ValueError:
+            start, end = reports.date_range()
+        extra_context = {
+            **(extra_context or {}),
+            'range_start': start,
+            'range_end': end,
+            'totals': reports.totals(start, end),
+            'by_status': reports.by_status(start, end),
+            'top_product_colors': reports.top_product_colors(start, end, limit=10),
+            'top_categories': reports.top_categories(start, end, limit=10),
+            'watermark': RollupWatermark.objects.filter(name='sales').values_list('watermark', flat=True).first(),
+        }
+        return super().changelist_view(request, extra_context)
+
+
+@admin.register(DailyProductColorSales)
+class DailyProductColorSalesAdmin(ReadOnlyRollupAdmin):
+    list_display = ('date', 'product_color', 'status', 'orders', 'units', 'revenue')
+    list_select_related = ('product_color__product',)
+    ordering = ('-date', '-revenue')
+
+
+@admin.register(DailyCategorySales)
+class DailyCategorySalesAdmin(ReadOnlyRollupAdmin):
+    list_display = ('date', 'category', 'status', 'orders', 'units', 'revenue')
+    list_select_related = ('category',)
+    ordering = ('-date', '-revenue')
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.analytics.rollup import run_rollup
+
+
+class Command(BaseCommand):
+    help = 'Update the daily sales rollups from orders changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild every day instead of only changed ones')
+        parser.add_argument('--interval', type=int, default=0, help='Keep running, every N seconds')
+
+    def handle(self, *args, **options):
+        full = options['full']
+        while True:
+            days = run_rollup(full=full)
+            self.stdout.write(f"Rebuilt {days} day(s) of sales rollups")
+            if not options['interval']:
+                break
+            full = False
+            time.sleep(options['interval'])
@@ -0,0 +1,78 @@
+from django.db import models
+from apps.orders.models import STATUS_CHOICES
+from apps.products.models import Category, ProductColor
+
+
+class SalesRollup(models.Model):
+    date = models.DateField(verbose_name="Date")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, verbose_name="Order Status")
+    orders = models.PositiveIntegerField(default=0, verbose_name="Orders")
+    units = models.PositiveIntegerField(default=0, verbose_name="Units")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Revenue")
+
+    class Meta:
+        abstract = True
+        ordering = ['-date']
+
+
+class DailySales(SalesRollup):
+    class Meta(SalesRollup.Meta):
+        db_table = 'analytics_daily_sales'
+        verbose_name = "Daily Sales"
+        verbose_name_plural = "Daily Sales"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'status'], name='daily_sales_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.status}: {self.revenue}"
+
+
+class DailyProductColorSales(SalesRollup):
+    product_color = models.ForeignKey(
+        ProductColor, on_delete=models.CASCADE, related_name='daily_sales', verbose_name="Product Color"
+    )
+
+    class Meta(SalesRollup.Meta):
+        db_table = 'analytics_daily_product_color_sales'
+        verbose_name = "Daily Product Color Sales"
+        verbose_name_plural = "Daily Product Color Sales"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'status', 'product_color'], name='daily_color_sales_unique'),
+        ]
+        indexes = [models.Index(fields=['product_color', 'date'])]
+
+    def __str__(self):
+        return f"{self.date} {self.product_color_id} {self.status}: {self.revenue}"
+
+
+class DailyCategorySales(SalesRollup):
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, related_name='daily_sales', verbose_name="Category"
+    )
+
+    class Meta(SalesRollup.Meta):
+        db_table = 'analytics_daily_category_sales'
+        verbose_name = "Daily Category Sales"
+        verbose_name_plural = "Daily Category Sales"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'status', 'category'], name='daily_category_sales_unique'),
+        ]
+        indexes = [models.Index(fields=['category', 'date'])]
+
+    def __str__(self):
+        return f"{self.date} {self.category_id} {self.status}: {self.revenue}"
+
+
+class RollupWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True, verbose_name="Name")
+    watermark = models.DateTimeField(null=True, blank=True, verbose_name="Processed Up To")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated At")
+
+    class Meta:
+        db_table = 'analytics_rollup_watermark'
+        verbose_name = "Rollup Watermark"
+        verbose_name_plural = "Rollup Watermarks"
+
+    def __str__(self):
+        return f"{self.name}: {self.watermark}"
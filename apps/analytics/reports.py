@@ -0,0 +1,61 @@
+"""Read-side queries over the rollup tables, shared by the API and the admin"""
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import DailySales, DailyProductColorSales, DailyCategorySales
+
+DEFAULT_DAYS = 30
+
+
+def _sums():
+    return {'orders': Sum('orders'), 'units': Sum('units'), 'revenue': Sum('revenue')}
+
+
+def date_range(date_from=None, date_to=None):
+    """Parse an inclusive date range, defaulting to the last DEFAULT_DAYS days"""
+    end = parse_date(date_to) if date_to else timezone.localdate()
+    start = parse_date(date_from) if date_from else end - timedelta(days=DEFAULT_DAYS - 1)
+    if start is None or end is None:
+        raise ValueError('Dates must be YYYY-MM-DD')
+    return start, end
+
+
+def _filter(queryset, start, end, statuses):
+    queryset = queryset.filter(date__gte=start, date__lte=end)
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+    return queryset.order_by()
+
+
+def totals(start, end, statuses=None):
+    row = _filter(DailySales.objects, start, end, statuses).aggregate(**_sums())
+    return {key: value or 0 for key, value in row.items()}
+
+
+def by_status(start, end, statuses=None):
+    return list(_filter(DailySales.objects, start, end, statuses).values('status').annotate(**_sums()).order_by('status'))
+
+
+def daily(start, end, statuses=None):
+    return list(_filter(DailySales.objects, start, end, statuses).values('date').annotate(**_sums()).order_by('date'))
+
+
+def top_product_colors(start, end, statuses=None, limit=20):
+    return list(
+        _filter(DailyProductColorSales.objects, start, end, statuses)
+        .values('product_color_id', 'product_color__name', 'product_color__product__name')
+        .annotate(**_sums())
+        .order_by('-revenue')[:limit]
+    )
+
+
+def top_categories(start, end, statuses=None, limit=20):
+    return list(
+        _filter(DailyCategorySales.objects, start, end, statuses)
+        .values('category_id', 'category__name')
+        .annotate(**_sums())
+        .order_by('-revenue')[:limit]
+    )
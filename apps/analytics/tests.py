@@ -0,0 +1,80 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.orders.models import Order, OrderItem
+from apps.products.models import Category, Product, ProductColor
+from apps.users.models import User
+
+from .models import DailyCategorySales, DailyProductColorSales, DailySales, RollupWatermark
+from .rollup import WATERMARK, run_rollup
+
+
+@override_settings(ANALYTICS_ROLLUP_LAG=0, ANALYTICS_ROLLUP_RECHECK_DAYS=7)
+class RollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Mebel')
+        product = Product.objects.create(name='Divan')
+        product.categories.add(cls.category)
+        cls.color = ProductColor.objects.create(product=product, name='Kulrang', price=Decimal('1000'))
+        cls.user = User.objects.create(username='buyer', telegram_id=1)
+
+    def order(self, quantity, status='pending', days_ago=0):
+        order = Order.objects.create(user=self.user, status=status, total_amount=Decimal(1000 * quantity),
+                                     phone_number='+998901234567', address='Toshkent')
+        OrderItem.objects.create(order=order, product_color=self.color, quantity=quantity, price=Decimal('1000'))
+        if days_ago:
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return order
+
+    def totals(self):
+        return {(row.date, row.status): (row.orders, row.units, row.revenue) for row in DailySales.objects.all()}
+
+    def test_incremental_run_adds_new_orders(self):
+        self.order(2)
+        self.assertEqual(run_rollup(), 1)
+        self.order(3)
+        run_rollup()
+        today = timezone.localdate()
+        self.assertEqual(self.totals(), {(today, 'pending'): (2, 5, Decimal('5000'))})
+        self.assertEqual(DailyProductColorSales.objects.get().units, 5)
+        self.assertEqual(DailyCategorySales.objects.get(category=self.category).revenue, Decimal('5000'))
+        self.assertIsNotNone(RollupWatermark.objects.get(name=WATERMARK).watermark)
+
+    def test_status_change_moves_revenue(self):
+        order = self.order(2)
+        run_rollup()
+        order.status = 'cancelled'
+        order.save()
+        run_rollup()
+        self.assertEqual(self.totals(), {(timezone.localdate(), 'cancelled'): (1, 2, Decimal('2000'))})
+
+    def test_deleted_orders_drop_out_of_recent_days(self):
+        kept, deleted = self.order(1, days_ago=3), self.order(4, days_ago=3)
+        run_rollup()
+        deleted.delete()
+        run_rollup()
+        kept.refresh_from_db()
+        day = timezone.localdate(kept.created_at)
+        self.assertEqual(self.totals(), {(day, 'pending'): (1, 1, Decimal('1000'))})
+
+    def test_bulk_updates_in_recent_days_are_picked_up(self):
+        order = self.order(2)
+        run_rollup()
+        # Skips updated_at, so only the recheck can see it
+        Order.objects.filter(pk=order.pk).update(status='delivered')
+        run_rollup()
+        self.assertEqual(list(self.totals()), [(timezone.localdate(), 'delivered')])
+
+    def test_older_days_need_a_full_run(self):
+        self.order(1, days_ago=30)
+        deleted = self.order(2, days_ago=30)
+        run_rollup()
+        deleted.delete()
+        run_rollup()
+        self.assertEqual(DailySales.objects.get().units, 3)
+        run_rollup(full=True)
+        self.assertEqual(DailySales.objects.get().units, 1)
@@ -0,0 +1,60 @@
+"""
+Conditional GET for catalog endpoints.
+
+ETag and Last-Modified come from the catalog (and stock) version counters
+in the cache, so a request whose If-None-Match still matches is answered
+with 304 before the view runs a query or serializes anything.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.translation import get_language
+
+from apps.products.cache import catalog_state
+
+
+def catalog_etag(versions):
+    return 'W/"{}-{}"'.format('.'.join(map(str, versions)), get_language())
+
+
+def _cache_headers(response, public):
+    if public:
+        # The same for every client, so shared caches may keep it too
+        patch_cache_control(
+            response, public=True, max_age=settings.PUBLIC_CATALOG_MAX_AGE,
+            s_maxage=settings.PUBLIC_CATALOG_SHARED_MAX_AGE,
+            stale_while_revalidate=settings.PUBLIC_CATALOG_SHARED_MAX_AGE,
+        )
+    else:
+        patch_cache_control(response, private=True, max_age=settings.CATALOG_API_MAX_AGE, must_revalidate=True)
+        patch_vary_headers(response, ('Cookie', 'Accept-Language'))
+
+
+def conditional(stock=False, public=False):
+    """
+    Answer GET/HEAD with 304 while the catalog is unchanged; ``stock`` when
+    the response also shows stock levels, ``public`` when it is the same
+    for every client.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(self, request, *args, **kwargs)
+            versions, changed_at = catalog_state(stock=stock)
+            etag = catalog_etag(versions)
+            last_modified = int(changed_at) if changed_at is not None else None
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response.headers.setdefault('ETag', etag)
+            if last_modified is not None:
+                response.headers.setdefault('Last-Modified', http_date(last_modified))
+            _cache_headers(response, public)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,65 @@
+"""
+Anonymous, read-only catalog API for storefronts and the Telegram Mini App.
+
+The language is part of the URL, so responses vary by nothing else and can
+be stored by a CDN. Bodies come pre-encoded from apps.products.storefront.
+"""
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import re_path
+from django.utils import translation
+from rest_framework import viewsets
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.throttling import AnonRateThrottle
+
+from apps.products.storefront import document
+from .caching import conditional
+
+
+class PublicCatalogThrottle(AnonRateThrottle):
+    scope = 'public_catalog'
+
+
+class PublicCatalogViewSet(viewsets.ViewSet):
+    # No session lookup, so responses carry no Vary: Cookie
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    throttle_classes = [PublicCatalogThrottle]
+
+    def dispatch(self, request, *args, **kwargs):
+        with translation.override(kwargs['language']):
+            return super().dispatch(request, *args, **kwargs)
+
+    def _document(self, kind, pk=None):
+        data = document(kind, self.kwargs['language'], pk)
+        if data is None:
+            return Response({'error': 'Not found'}, status=404)
+        return HttpResponse(data, content_type='application/json')
+
+    @conditional(public=True)
+    def categories(self, request, language):
+        """Active category tree"""
+        return self._document('categories')
+
+    @conditional(public=True)
+    def category(self, request, language, pk):
+        """One category with its subcategories and orderable products"""
+        return self._document('category', int(pk))
+
+    @conditional(public=True)
+    def product(self, request, language, pk):
+        """One product with its active colors and their images"""
+        return self._document('product', int(pk))
+
+
+LANGUAGE_PATTERN = '|'.join(code for code, _ in settings.LANGUAGES)
+
+urlpatterns = [
+    re_path(rf'^(?P<language>{LANGUAGE_PATTERN})/categories/$',
+            PublicCatalogViewSet.as_view({'get': 'categories'}), name='public-categories'),
+    re_path(rf'^(?P<language>{LANGUAGE_PATTERN})/categories/(?P<pk>[0-9]+)/$',
+            PublicCatalogViewSet.as_view({'get': 'category'}), name='public-category'),
+    re_path(rf'^(?P<language>{LANGUAGE_PATTERN})/products/(?P<pk>[0-9]+)/$',
+            PublicCatalogViewSet.as_view({'get': 'product'}), name='public-product'),
+]
@@ -0,0 +1,49 @@
+"""
+orjson-based JSON renderer and parser for the API.
+
+With COERCE_DECIMAL_TO_STRING off, serializers hand Decimal values through
+as they are, and the renderer writes them as JSON numbers directly instead
+of formatting them to strings first. Amounts in this project have at most
+14 significant digits, so the float conversion is exact when read back.
+"""
+from decimal import Decimal
+
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_fallback = JSONEncoder()
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    # Lazy translations, timedeltas, querysets and the like, as DRF's encoder renders them
+    return _fallback.default(obj)
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        option = orjson.OPT_NON_STR_KEYS
+        if 'indent' in (accepted_media_type or '') or (renderer_context or {}).get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_default, option=option)
+
+
+class ORJSONParser(BaseParser):
+    media_type = 'application/json'
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -1,3 +1,5 @@
+from functools import cached_property
+
 from rest_framework import serializers
 from apps.products.models import Category, Product, ProductColor, Cart, CartItem
 from apps.orders.models import Order, OrderItem
@@ -5,9 +7,36 @@ from apps.users.models import User
 from decimal import Decimal
 
 
+class CategoryTree:
+    """
+    Every category from one query, loaded on first use. Views pass it in the
+    serializer context as ``category_tree`` so nested subcategories, parent
+    names and full paths cost no query per category.
+    """
+
+    @cached_property
+    def by_id(self):
+        return {category.id: category for category in Category.objects.order_by('order', 'name')}
+
+    @cached_property
+    def children(self):
+        children = {}
+        for category in self.by_id.values():
+            children.setdefault(category.parent_id, []).append(category)
+        return children
+
+    def path(self, category):
+        names = []
+        while category is not None:
+            names.append(category.name)
+            category = self.by_id.get(category.parent_id)
+        return ' > '.join(reversed(names))
+
+
 class CategorySerializer(serializers.ModelSerializer):
     subcategories = serializers.SerializerMethodField()
-    parent_name = serializers.CharField(source='parent.name', read_only=True)
+    parent_name = serializers.SerializerMethodField()
+    full_path = serializers.SerializerMethodField()
 
     class Meta:
         model = Category
@@ -31,10 +60,25 @@ class CategorySerializer(serializers.ModelSerializer):
 
     def get_subcategories(self, obj):
         # Recursively get all subcategories
-        subcategories = obj.subcategories.all().order_by('order', 'name')
+        tree = self.context.get('category_tree')
+        if tree is not None:
+            subcategories = tree.children.get(obj.id, [])
+        else:
+            subcategories = obj.subcategories.all().order_by('order', 'name')
         serializer = CategorySerializer(subcategories, many=True, context=self.context)
         return serializer.data
 
+    def get_parent_name(self, obj):
+        if obj.parent_id is None:
+            return None
+        tree = self.context.get('category_tree')
+        parent = tree.by_id.get(obj.parent_id) if tree is not None else None
+        return (parent or obj.parent).name
+
+    def get_full_path(self, obj):
+        tree = self.context.get('category_tree')
+        return tree.path(obj) if tree is not None else obj.full_path
+
 
 class CategoryCreateUpdateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -63,12 +107,14 @@ class ProductColorSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ProductColor
-        fields = ['id', 'name', 'price', 'is_active', 'images', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'price', 'stock', 'reserved', 'is_active', 'images', 'created_at', 'updated_at']
+        read_only_fields = ['reserved']
 
     def get_images(self, obj):
         return [
             {"id": img.id, "image": img.image.url, "order": img.order}
-            for img in obj.images.all().order_by('order', 'id')
+            # Sorted here so a prefetched images list is reused
+            for img in sorted(obj.images.all(), key=lambda img: (img.order, img.id))
         ]
 
 
@@ -85,8 +131,8 @@ class ProductSerializer(serializers.ModelSerializer):
         ]
 
     def get_min_price(self, obj):
-        colors = obj.colors.filter(is_active=True)
-        return min((color.price for color in colors), default=0)
+        # Filtered here so the prefetched colors are reused
+        return min((color.price for color in obj.colors.all() if color.is_active), default=0)
 
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -113,6 +159,20 @@ class CartSerializer(serializers.ModelSerializer):
         return sum(item.total_price for item in obj.items.all())
 
 
+class AbandonedCartSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True)
+    telegram_id = serializers.IntegerField(source='user.telegram_id', read_only=True)
+    item_count = serializers.IntegerField(read_only=True)
+    total_amount = serializers.DecimalField(source='items_total', max_digits=14, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Cart
+        fields = [
+            'id', 'user', 'username', 'telegram_id', 'item_count', 'total_amount',
+            'last_item_activity_at', 'reminder_sent_at'
+        ]
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     product_color = ProductColorSerializer(read_only=True)
     total_price = serializers.SerializerMethodField()
@@ -1,3 +1,448 @@
-from django.test import TestCase
+"""
+API performance suite.
 
-# Create your tests here.
+Seeds a large catalog with bulk_create and times the heavy admin API
+endpoints. The size is controlled by API_BENCH_SCALE: 1.0 is the full
+data set (thousands of categories five levels deep, 100k products, three
+colors with two images each per product, 1M order items); the default
+0.01 keeps a regular test run fast.
+
+Results are written as JSON to API_BENCH_REPORT. Each endpoint must run
+the same number of queries on every repeat. Against the committed
+baseline for the same scale (benchmark_baseline.json), an endpoint fails
+when it runs more queries than recorded. Timings depend on the machine,
+so they are only compared with API_BENCH_TIMING=1 (make bench-api): an
+endpoint then also fails when its median time exceeds the baseline by
+more than API_BENCH_TOLERANCE plus API_BENCH_SLACK_MS. The slack keeps
+millisecond endpoints from failing on noise. Record a new baseline with
+API_BENCH_UPDATE_BASELINE=1.
+
+The wire tests request /api/products/ and /api/orders/ once with DRF's
+stdlib JSON renderer and string-coerced decimals, and once with the
+configured orjson renderer. They record time and body size for both,
+plus the compressed sizes with gzip and Brotli.
+
+QueryBudgetTests request every listing endpoint over a small catalog
+under query_budget(), so an N+1 fails the suite instead of only being
+logged.
+
+PublicCatalogTests cover the anonymous storefront API and
+ConditionalGetTests the catalog ETags.
+"""
+import json
+import os
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.settings import api_settings
+
+from apps.monitoring.queries import count_queries, query_budget
+from apps.orders.models import Order, OrderItem
+from apps.products.inventory import decrement_stock
+from apps.products.models import Category, Product, ProductColor, ProductColorImage, Cart, CartItem
+
+User = get_user_model()
+
+SCALE = float(os.environ.get('API_BENCH_SCALE', '0.01'))
+REPEAT = int(os.environ.get('API_BENCH_REPEAT', '5'))
+TOLERANCE = float(os.environ.get('API_BENCH_TOLERANCE', '1.5'))
+SLACK_MS = float(os.environ.get('API_BENCH_SLACK_MS', '20'))
+REPORT_PATH = Path(os.environ.get('API_BENCH_REPORT', settings.BASE_DIR / 'api_benchmark_report.json'))
+BASELINE_PATH = Path(os.environ.get('API_BENCH_BASELINE', Path(__file__).with_name('benchmark_baseline.json')))
+UPDATE_BASELINE = os.environ.get('API_BENCH_UPDATE_BASELINE') == '1'
+COMPARE_TIMINGS = os.environ.get('API_BENCH_TIMING') == '1'
+
+# Full-scale sizes
+CATEGORY_LEVELS = (10, 40, 200, 800, 2000)
+PRODUCTS = 100_000
+COLORS_PER_PRODUCT = 3
+IMAGES_PER_COLOR = 2
+ORDER_ITEMS = 1_000_000
+ITEMS_PER_ORDER = 5
+CART_USERS = 5_000
+BATCH_SIZE = 5_000
+
+# The suite runs without Redis; version keys and documents live in memory
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'api-tests'},
+    'catalog': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'api-tests-catalog'},
+}
+
+# DRF's defaults, for comparison with the configured renderer
+STDLIB_JSON = {
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_PARSER_CLASSES': ['rest_framework.parsers.JSONParser'],
+    'COERCE_DECIMAL_TO_STRING': True,
+}
+
+
+def scaled(count, minimum=1):
+    return max(minimum, int(count * SCALE))
+
+
+def batches(objects, size=BATCH_SIZE):
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed_catalog(rng):
+    """Categories up to five levels deep and products with colors and images"""
+    parents = [None]
+    leaves = []
+    for depth, size in enumerate(CATEGORY_LEVELS, start=1):
+        level = Category.objects.bulk_create([
+            Category(name=f"Category {depth}.{i}", parent=rng.choice(parents), order=i + 1)
+            for i in range(scaled(size))
+        ])
+        parents = level
+        leaves = level
+
+    product_ids = []
+    for batch in batches(
+        Product(name=f"Product {i}", description=f"Description of product {i}", product_image='products/bench.jpg')
+        for i in range(scaled(PRODUCTS, 10))
+    ):
+        product_ids.extend(product.id for product in Product.objects.bulk_create(batch))
+
+    through = Product.categories.through
+    for batch in batches(through(product_id=pid, category_id=rng.choice(leaves).id) for pid in product_ids):
+        through.objects.bulk_create(batch)
+
+    color_ids = []
+    for batch in batches(
+        ProductColor(product_id=pid, name=f"Color {c}", price=Decimal(rng.randrange(10_000, 5_000_000)))
+        for pid in product_ids for c in range(COLORS_PER_PRODUCT)
+    ):
+        color_ids.extend(color.id for color in ProductColor.objects.bulk_create(batch))
+
+    for batch in batches(
+        ProductColorImage(color_id=cid, image=f'products/colors/{cid}_{n}.jpg', order=n + 1)
+        for cid in color_ids for n in range(IMAGES_PER_COLOR)
+    ):
+        ProductColorImage.objects.bulk_create(batch)
+
+    return leaves, color_ids
+
+
+def seed_orders(rng, color_ids):
+    """Users with carts, and orders totalling ORDER_ITEMS lines"""
+    users = User.objects.bulk_create([
+        User(username=f"bench_{i}", telegram_id=8_000_000_000 + i, phone_number='+998901234567')
+        for i in range(scaled(CART_USERS, 10))
+    ])
+    now = timezone.now()
+    carts = Cart.objects.bulk_create([
+        Cart(user=user, last_item_activity_at=now - timedelta(hours=rng.randint(1, 72)) if i % 2 == 0 else None)
+        for i, user in enumerate(users)
+    ])
+    CartItem.objects.bulk_create([
+        CartItem(cart=cart, product_color_id=color_id, quantity=rng.randint(1, 3))
+        for cart in carts[::2] for color_id in rng.sample(color_ids, 3)
+    ])
+
+    order_count = scaled(ORDER_ITEMS // ITEMS_PER_ORDER)
+    order_ids = []
+    for batch in batches(
+        Order(user=rng.choice(users), status='pending', total_amount=Decimal('100000.00'),
+              phone_number='+998901234567', address='Toshkent')
+        for _ in range(order_count)
+    ):
+        order_ids.extend(order.id for order in Order.objects.bulk_create(batch))
+
+    for batch in batches(
+        OrderItem(order_id=oid, product_color_id=rng.choice(color_ids), quantity=1, price=Decimal('20000.00'))
+        for oid in order_ids for _ in range(ITEMS_PER_ORDER)
+    ):
+        OrderItem.objects.bulk_create(batch)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class APIBenchmarkTests(TestCase):
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(42)
+        started = time.perf_counter()
+        leaves, color_ids = seed_catalog(rng)
+        seed_orders(rng, color_ids)
+        cls.seed_seconds = time.perf_counter() - started
+        cls.busiest_category = max(leaves, key=lambda category: category.products.count())
+        cls.admin = User.objects.create_superuser('bench_admin', 'bench@example.com', 'bench')
+
+    @classmethod
+    def tearDownClass(cls):
+        report = {
+            'scale': SCALE,
+            'seed_seconds': round(getattr(cls, 'seed_seconds', 0), 2),
+            'endpoints': cls.results,
+        }
+        REPORT_PATH.write_text(json.dumps(report, indent=2))
+        if UPDATE_BASELINE:
+            BASELINE_PATH.write_text(json.dumps(report, indent=2))
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def baseline(self, name):
+        if UPDATE_BASELINE or not BASELINE_PATH.exists():
+            return None
+        baseline = json.loads(BASELINE_PATH.read_text())
+        if baseline.get('scale') != SCALE:
+            return None
+        return baseline['endpoints'].get(name)
+
+    def measure(self, name, url):
+        timings, query_counts = [], []
+        for _ in range(REPEAT):
+            started = time.perf_counter()
+            with count_queries() as queries:
+                response = self.client.get(url)
+            timings.append(time.perf_counter() - started)
+            query_counts.append(queries.count)
+            self.assertEqual(response.status_code, 200, url)
+
+        result = {
+            'url': url,
+            'median_ms': round(statistics.median(timings) * 1000, 2),
+            'max_ms': round(max(timings) * 1000, 2),
+            'queries': max(query_counts),
+            'bytes': len(response.content),
+        }
+        self.results[name] = result
+        self.assertEqual(len(set(query_counts)), 1, f"{name} ran {query_counts} queries across repeats")
+
+        baseline = self.baseline(name)
+        if baseline:
+            self.assertLessEqual(
+                result['queries'], baseline['queries'],
+                f"{name} regressed: {result['queries']} queries vs baseline {baseline['queries']}"
+            )
+        if baseline and COMPARE_TIMINGS:
+            self.assertLessEqual(
+                result['median_ms'], baseline['median_ms'] * TOLERANCE + SLACK_MS,
+                f"{name} regressed: {result['median_ms']} ms vs baseline {baseline['median_ms']} ms"
+            )
+
+    def measure_wire(self, name, url):
+        result = {'url': url}
+        for variant, rest_framework in (('stdlib', STDLIB_JSON), ('orjson', settings.REST_FRAMEWORK)):
+            timings = []
+            with override_settings(REST_FRAMEWORK=rest_framework):
+                for _ in range(REPEAT):
+                    started = time.perf_counter()
+                    response = self.client.get(url)
+                    timings.append(time.perf_counter() - started)
+                self.assertEqual(response.status_code, 200, url)
+                # Rendering alone, without the queries and serializers around it
+                renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+                render_timings = []
+                for _ in range(REPEAT):
+                    started = time.perf_counter()
+                    renderer.render(response.data)
+                    render_timings.append(time.perf_counter() - started)
+            result[variant] = {
+                'median_ms': round(statistics.median(timings) * 1000, 2),
+                'render_ms': round(statistics.median(render_timings) * 1000, 3),
+                'bytes': len(response.content),
+            }
+
+        for encoding in ('gzip', 'br'):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+            result[encoding] = {'encoding': response.get('Content-Encoding'), 'bytes': len(response.content)}
+        self.assertEqual(result['gzip']['encoding'], 'gzip', url)
+        self.results[name] = result
+
+    def test_products_wire(self):
+        self.measure_wire('products_wire', '/api/products/')
+
+    def test_orders_wire(self):
+        self.measure_wire('orders_wire', '/api/orders/')
+
+    def test_category_tree(self):
+        self.measure('categories_tree', '/api/categories/tree/')
+
+    def test_category_flat(self):
+        self.measure('categories_flat', '/api/categories/flat/')
+
+    def test_products_by_category(self):
+        self.measure('products_by_category', f'/api/products/by_category/?category_id={self.busiest_category.id}')
+
+    def test_orders(self):
+        self.measure('orders', '/api/orders/')
+
+    def test_active_carts(self):
+        self.measure('carts_active', '/api/carts/active_carts/')
+
+    def test_abandoned_carts(self):
+        self.measure('carts_abandoned', '/api/carts/abandoned/')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QueryBudgetTests(TestCase):
+    """Each endpoint stays within its QUERY_BUDGETS entry, whatever the number of rows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        roots = [Category.objects.create(name=f"Root {i}") for i in range(3)]
+        middle = [Category.objects.create(name=f"Middle {i}", parent=roots[i % 3]) for i in range(6)]
+        leaves = [Category.objects.create(name=f"Leaf {i}", parent=middle[i % 6]) for i in range(12)]
+
+        colors = []
+        for i in range(30):
+            product = Product.objects.create(name=f"Product {i}", product_image='products/bench.jpg')
+            product.categories.add(leaves[i % 12], leaves[(i + 1) % 12])
+            for c in range(2):
+                color = ProductColor.objects.create(product=product, name=f"Color {c}", price=Decimal(10_000 + i))
+                ProductColorImage.objects.bulk_create([
+                    ProductColorImage(color=color, image=f'products/colors/{color.id}_{n}.jpg', order=n + 1)
+                    for n in range(2)
+                ])
+                colors.append(color)
+
+        now = timezone.now()
+        for i in range(5):
+            user = User.objects.create(username=f"budget_{i}", telegram_id=9_000_000_000 + i)
+            cart = Cart.objects.create(user=user, last_item_activity_at=now - timedelta(days=2))
+            CartItem.objects.bulk_create([CartItem(cart=cart, product_color=color) for color in colors[i::10]])
+            for _ in range(4):
+                order = Order.objects.create(user=user, status='pending', total_amount=Decimal('60000.00'),
+                                             phone_number='+998901234567', address='Toshkent')
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=order, product_color=color, quantity=1, price=color.price) for color in colors[:3]
+                ])
+        cls.category = roots[0]
+        cls.leaf = leaves[0]
+        cls.product = Product.objects.first()
+        cls.admin = User.objects.create_superuser('budget_admin', 'budget@example.com', 'budget')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def assertWithinBudget(self, name, url):
+        with query_budget(name):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+
+    def test_categories(self):
+        self.assertWithinBudget('category-list', '/api/categories/')
+        self.assertWithinBudget('category-tree', '/api/categories/tree/')
+        self.assertWithinBudget('category-flat', '/api/categories/flat/')
+        self.assertWithinBudget('category-detail', f'/api/categories/{self.category.id}/')
+        self.assertWithinBudget('category-children', f'/api/categories/{self.category.id}/children/')
+
+    def test_products(self):
+        self.assertWithinBudget('product-list', '/api/products/')
+        self.assertWithinBudget('product-detail', f'/api/products/{self.product.id}/')
+        self.assertWithinBudget('product-by-category', f'/api/products/by_category/?category_id={self.leaf.id}')
+
+    def test_orders(self):
+        self.assertWithinBudget('order-list', '/api/orders/')
+
+    def test_carts(self):
+        self.assertWithinBudget('cart-list', '/api/carts/')
+        self.assertWithinBudget('cart-active-carts', '/api/carts/active_carts/')
+        self.assertWithinBudget('cart-abandoned', '/api/carts/abandoned/')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PublicCatalogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Mebel')
+        cls.product = Product.objects.create(name='Divan', product_image='products/divan.jpg')
+        cls.product.categories.add(cls.category)
+        ProductColor.objects.create(product=cls.product, name='Kulrang', price=Decimal('1500000.00'))
+        ProductColor.objects.create(product=cls.product, name='Yashil', price=Decimal('1499.50'))
+        cls.admin = User.objects.create_superuser('public_admin', 'public@example.com', 'public')
+
+    def test_prices_match_the_api(self):
+        public = self.client.get(f'/api/public/uz/products/{self.product.id}/').json()
+        self.client.force_login(self.admin)
+        private = self.client.get(f'/api/products/{self.product.id}/').json()
+        self.assertEqual([color['price'] for color in public['colors']], [1499.5, 1500000])
+        self.assertEqual(sorted(color['price'] for color in public['colors']),
+                         sorted(color['price'] for color in private['colors']))
+        category = self.client.get(f'/api/public/uz/categories/{self.category.id}/').json()
+        self.assertEqual(category['products'][0]['price_from'], 1499.5)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Mebel')
+        cls.product = Product.objects.create(name='Divan', product_image='products/divan.jpg')
+        cls.product.categories.add(cls.category)
+        cls.color = ProductColor.objects.create(product=cls.product, name='Kulrang', price=Decimal('1000'), stock=5)
+        cls.admin = User.objects.create_superuser('etag_admin', 'etag@example.com', 'etag')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def revalidate(self, url, etag):
+        with count_queries() as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        return response, queries.count
+
+    def test_unchanged_catalog_is_answered_with_304(self):
+        response = self.client.get('/api/categories/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('Last-Modified', response)
+
+        revalidated, queries = self.revalidate('/api/categories/', etag)
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], etag)
+        # Only the session and user lookups, the view does not run
+        self.assertLessEqual(queries, 2)
+
+    def test_catalog_change_invalidates(self):
+        etag = self.client.get('/api/categories/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Uy mebeli'
+            self.category.save()
+        response, _ = self.revalidate('/api/categories/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'Uy mebeli')
+
+    def test_stock_change_invalidates_stock_views_only(self):
+        product_url = f'/api/products/{self.product.id}/'
+        product_etag = self.client.get(product_url)['ETag']
+        category_etag = self.client.get('/api/categories/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            decrement_stock([(self.color.id, 2)])
+
+        response, _ = self.revalidate(product_url, product_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['colors'][0]['stock'], 3)
+        self.assertEqual(self.revalidate('/api/categories/', category_etag)[0].status_code, 304)
+
+    def test_public_responses_are_shared_and_per_language(self):
+        self.client.logout()
+        response = self.client.get('/api/public/uz/categories/')
+        self.assertIn('public', response['Cache-Control'])
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        self.assertEqual(self.revalidate('/api/public/uz/categories/', response['ETag'])[0].status_code, 304)
+        other = self.client.get('/api/public/ru/categories/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(other.status_code, 200)
+        self.assertNotEqual(other['ETag'], response['ETag'])
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CategoryViewSet, ProductViewSet, CartViewSet, OrderViewSet, UserViewSet
+from .views import CategoryViewSet, ProductViewSet, CartViewSet, OrderViewSet, UserViewSet, AnalyticsViewSet
 
 router = DefaultRouter()
 router.register(r'categories', CategoryViewSet, basename='category')
@@ -8,8 +8,10 @@ router.register(r'products', ProductViewSet)
 router.register(r'carts', CartViewSet, basename='cart')
 router.register(r'orders', OrderViewSet)
 router.register(r'users', UserViewSet)
+router.register(r'analytics', AnalyticsViewSet, basename='analytics')
 
 urlpatterns = [
+    path('api/public/', include('apps.api.public')),
     path('api/', include(router.urls)),
     path('api-auth/', include('rest_framework.urls')),
 ]
\ No newline at end of file
@@ -2,16 +2,63 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.parsers import MultiPartParser
+from rest_framework.pagination import CursorPagination
 from django.contrib.auth import get_user_model
-from apps.products.models import Category, Product, ProductColor, Cart, CartItem
+from django.db.models import Count, DecimalField, F, Prefetch, Sum
+from django.http import StreamingHttpResponse
+from apps.products.models import Category, Product, ProductColor, ProductColorImage, Cart, CartItem
+from apps.products import bulk, ordering
+from apps.products.search import search_products
+from apps.products.catalog_io import stream_export, import_catalog, text_stream, FORMATS
 from apps.orders.models import Order, STATUS_CHOICES
+from apps.orders import export as order_export
+from apps.analytics import reports
+from .caching import conditional
 from .serializers import (
-    CategorySerializer, ProductSerializer, CartSerializer,
-    OrderSerializer, UserSerializer, CategoryCreateUpdateSerializer
+    CategorySerializer, ProductSerializer, CartSerializer, CategoryTree,
+    OrderSerializer, UserSerializer, CategoryCreateUpdateSerializer, AbandonedCartSerializer
 )
 
 User = get_user_model()
 
+# Colors with their images, as the product and order serializers read them
+COLORS_WITH_IMAGES = ProductColor.objects.prefetch_related('images')
+
+
+def _id_list(data, key):
+    """A list of integer ids from the request body, or ValueError"""
+    ids = data.get(key) or []
+    if not isinstance(ids, list):
+        raise ValueError(f'{key} must be a list of ids')
+    return [int(pk) for pk in ids]
+
+
+def _is_active(data):
+    value = data.get('is_active')
+    if not isinstance(value, bool):
+        raise ValueError('is_active must be true or false')
+    return value
+
+
+def _move(model, data):
+    """Move {"id": x} to {"before": y} or {"after": y}, returning the response"""
+    try:
+        pk = int(data.get('id'))
+        anchors = {key: int(data[key]) for key in ('before', 'after') if data.get(key) is not None}
+        if len(anchors) != 1:
+            raise ValueError('Give exactly one of before or after')
+    except (TypeError, ValueError) as e:
+        return Response({'error': str(e)}, status=400)
+    rows = model.objects.in_bulk([pk, *anchors.values()])
+    if pk not in rows or any(anchor not in rows for anchor in anchors.values()):
+        return Response({'error': 'Not found'}, status=404)
+    try:
+        position = ordering.move(rows[pk], **{key: rows[anchor] for key, anchor in anchors.items()})
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+    return Response({'id': pk, 'order': position})
+
 
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.filter(parent__isnull=True).order_by('order', 'name')
@@ -23,11 +70,16 @@ class CategoryViewSet(viewsets.ModelViewSet):
             return CategoryCreateUpdateSerializer
         return super().get_serializer_class()
 
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'category_tree': CategoryTree()}
+
+    @conditional()
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @conditional()
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance)
@@ -60,6 +112,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
         )
 
     @action(detail=True, methods=['get'])
+    @conditional()
     def children(self, request, pk=None):
         category = self.get_object()
         children = category.subcategories.all().order_by('order', 'name')
@@ -67,6 +120,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @conditional()
     def tree(self, request):
         """Get full category tree"""
         root_categories = self.filter_queryset(self.get_queryset())
@@ -74,23 +128,72 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @conditional()
     def flat(self, request):
         """Get all categories as a flat list with full path"""
         categories = Category.objects.all().order_by('order', 'name')
         serializer = self.get_serializer(categories, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'])
+    def set_active(self, request):
+        """Activate or deactivate {"ids": [...], "is_active": bool}, with their subtrees if "subtree" is true"""
+        try:
+            ids = _id_list(request.data, 'ids')
+            is_active = _is_active(request.data)
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=400)
+        if request.data.get('subtree'):
+            ids = bulk.category_subtree_ids(ids)
+        return Response({'updated': bulk.set_active({Category: ids}, is_active)[Category]})
+
+    @action(detail=False, methods=['post'])
+    def change_prices(self, request):
+        """Change prices by {"percent": n} for every product under {"ids": [...]}"""
+        try:
+            ids = _id_list(request.data, 'ids')
+            updated = bulk.change_prices(request.data.get('percent'), category_ids=ids)
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=400)
+        return Response({'updated': updated})
+
+    @action(detail=False, methods=['post'])
+    def reorder(self, request):
+        """Set the display order to the sequence of {"ids": [...]}"""
+        try:
+            ids = _id_list(request.data, 'ids')
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=400)
+        return Response({'updated': bulk.reorder(Category, ids)})
+
+    @action(detail=False, methods=['post'])
+    def move(self, request):
+        """Move {"id": x} right before {"before": y} or after {"after": y}, a sibling category"""
+        return _move(Category, request.data)
+
 
 class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+    queryset = Product.objects.prefetch_related(Prefetch('colors', queryset=COLORS_WITH_IMAGES), 'categories')
     serializer_class = ProductSerializer
     permission_classes = [IsAdminUser]
 
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'category_tree': CategoryTree()}
+
+    @conditional(stock=True)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional(stock=True)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=False, methods=['get'])
+    @conditional(stock=True)
     def by_category(self, request):
         category_id = request.query_params.get('category_id')
         if category_id:
-            products = Product.objects.filter(
+            products = self.get_queryset().filter(
                 categories__id=category_id,
                 is_active=True
             ).distinct()
@@ -98,24 +201,131 @@ class ProductViewSet(viewsets.ModelViewSet):
             return Response(serializer.data)
         return Response({'error': 'category_id required'}, status=400)
 
+    @action(detail=False, methods=['get'])
+    @conditional(stock=True)
+    def search(self, request):
+        """Full-text search over translated names and descriptions"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q required'}, status=400)
+        products = search_products(
+            query,
+            queryset=self.get_queryset()
+        )
+        serializer = self.get_serializer(products, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the whole catalog as CSV or JSON Lines (?file_format=jsonl)"""
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in FORMATS:
+            return Response({'error': f'file_format must be one of {FORMATS}'}, status=400)
+        content_type = 'application/x-ndjson' if file_format == 'jsonl' else 'text/csv'
+        response = StreamingHttpResponse(stream_export(file_format), content_type=f'{content_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="catalog.{file_format}"'
+        return response
+
+    @action(detail=False, methods=['post'])
+    def set_active(self, request):
+        """Activate or deactivate {"product_ids": [...], "color_ids": [...], "is_active": bool}"""
+        try:
+            product_ids = _id_list(request.data, 'product_ids')
+            color_ids = _id_list(request.data, 'color_ids')
+            is_active = _is_active(request.data)
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=400)
+        updated = bulk.set_active({Product: product_ids, ProductColor: color_ids}, is_active)
+        return Response({'products_updated': updated[Product], 'colors_updated': updated[ProductColor]})
+
+    @action(detail=False, methods=['post'])
+    def change_prices(self, request):
+        """Change prices by {"percent": n} for {"product_ids": [...]} and {"color_ids": [...]}"""
+        try:
+            product_ids = _id_list(request.data, 'product_ids')
+            color_ids = _id_list(request.data, 'color_ids')
+            if not product_ids and not color_ids:
+                raise ValueError('product_ids or color_ids required')
+            updated = bulk.change_prices(request.data.get('percent'), color_ids=color_ids, product_ids=product_ids)
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=400)
+        return Response({'updated': updated})
+
+    @action(detail=False, methods=['post'], url_path='images/reorder')
+    def reorder_images(self, request):
+        """Set the order of one color's images to the sequence of {"ids": [...]}"""
+        try:
+            ids = _id_list(request.data, 'ids')
+            color_id = int(request.data.get('color_id'))
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=400)
+        return Response({'updated': bulk.reorder(ProductColorImage, ids, color_id=color_id)})
+
+    @action(detail=False, methods=['post'], url_path='images/move')
+    def move_image(self, request):
+        """Move image {"id": x} right before {"before": y} or after {"after": y} of the same color"""
+        return _move(ProductColorImage, request.data)
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_catalog(self, request):
+        """Create or update products and colors from an uploaded CSV or JSONL file"""
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'file required'}, status=400)
+        file_format = 'jsonl' if upload.name.endswith(('.jsonl', '.ndjson')) else 'csv'
+        try:
+            stats = import_catalog(text_stream(upload.file), file_format)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        return Response(stats)
+
+
+class AbandonedCartPagination(CursorPagination):
+    # Keyset pagination on the indexed column, no COUNT over all carts
+    ordering = ('last_item_activity_at', 'id')
+    page_size = 50
+
 
 class CartViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = CartSerializer
     permission_classes = [IsAdminUser]
 
     def get_queryset(self):
-        return Cart.objects.all().select_related('user').prefetch_related('items__product_color')
+        return Cart.objects.all().select_related('user').prefetch_related(
+            Prefetch('items__product_color', queryset=COLORS_WITH_IMAGES)
+        )
 
     @action(detail=False, methods=['get'])
     def active_carts(self, request):
         """Get carts with items"""
-        carts = Cart.objects.filter(items__isnull=False).distinct()
+        carts = Cart.objects.filter(last_item_activity_at__isnull=False).prefetch_related(
+            Prefetch('items', queryset=CartItem.objects.select_related('product_color').prefetch_related('product_color__images'))
+        )
         serializer = self.get_serializer(carts, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], pagination_class=AbandonedCartPagination)
+    def abandoned(self, request):
+        """Carts idle for ?hours (ABANDONED_CART_HOURS by default), longest idle first"""
+        try:
+            hours = int(request.query_params.get('hours', 0)) or None
+        except ValueError:
+            return Response({'error': 'hours must be an integer'}, status=400)
+        carts = Cart.objects.abandoned(hours, include_reminded=True).select_related('user').annotate(
+            item_count=Count('items'),
+            items_total=Sum(
+                F('items__quantity') * F('items__product_color__price'),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+        page = self.paginate_queryset(carts)
+        return self.get_paginated_response(AbandonedCartSerializer(page, many=True).data)
+
 
 class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
+    queryset = Order.objects.select_related('user').prefetch_related(
+        Prefetch('items__product_color', queryset=COLORS_WITH_IMAGES)
+    )
     serializer_class = OrderSerializer
     permission_classes = [IsAdminUser]
 
@@ -131,6 +341,31 @@ class OrderViewSet(viewsets.ModelViewSet):
 
         return Response({'error': 'Invalid status'}, status=400)
 
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream order items as CSV or XLSX, filtered by ?date_from, ?date_to and ?status=a,b"""
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in order_export.FORMATS:
+            return Response({'error': f'file_format must be one of {order_export.FORMATS}'}, status=400)
+        statuses = [value for value in request.query_params.get('status', '').split(',') if value]
+        try:
+            stream = order_export.stream_export(
+                file_format,
+                date_from=request.query_params.get('date_from'),
+                date_to=request.query_params.get('date_to'),
+                statuses=statuses,
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+
+        if file_format == 'xlsx':
+            content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        else:
+            content_type = 'text/csv; charset=utf-8'
+        response = StreamingHttpResponse(stream, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="orders.{file_format}"'
+        return response
+
 
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = User.objects.filter(telegram_id__isnull=False)
@@ -143,3 +378,45 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
         user.is_active_telegram = not user.is_active_telegram
         user.save()
         return Response({'is_active': user.is_active_telegram})
+
+
+class AnalyticsViewSet(viewsets.ViewSet):
+    """Sales figures read from the daily rollups, never from order_item"""
+    permission_classes = [IsAdminUser]
+
+    def _params(self, request):
+        start, end = reports.date_range(request.query_params.get('date_from'), request.query_params.get('date_to'))
+        statuses = [value for value in request.query_params.get('status', '').split(',') if value]
+        return start, end, statuses
+
+    def list(self, request):
+        """Totals, per-status and per-day figures for ?date_from..?date_to (last 30 days by default)"""
+        try:
+            start, end, statuses = self._params(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        return Response({
+            'date_from': start,
+            'date_to': end,
+            'totals': reports.totals(start, end, statuses),
+            'by_status': reports.by_status(start, end, statuses),
+            'daily': reports.daily(start, end, statuses),
+        })
+
+    def _top(self, request, report):
+        try:
+            start, end, statuses = self._params(request)
+            limit = min(int(request.query_params.get('limit', 20)), 500)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        return Response(report(start, end, statuses, limit))
+
+    @action(detail=False, methods=['get'])
+    def products(self, request):
+        """Best-selling product colors"""
+        return self._top(request, reports.top_product_colors)
+
+    @action(detail=False, methods=['get'])
+    def categories(self, request):
+        """Best-selling categories"""
+        return self._top(request, reports.top_categories)
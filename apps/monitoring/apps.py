@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class MonitoringConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.monitoring'
+
+    def ready(self):
+        from . import checks  # noqa: F401
+        from .queries import install_query_counter
+
+        connection_created.connect(install_query_counter)
@@ -0,0 +1,40 @@
+"""
+Deployment checks run by scripts/serve-web.sh before gunicorn starts
+(``manage.py check --deploy``), so a misconfigured web service fails at
+startup instead of on its first requests.
+"""
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import caches
+from django.core.checks import Error, Warning, register
+from django.db import connections
+from django.db.utils import OperationalError
+
+
+@register(deploy=True)
+def check_serving(app_configs, **kwargs):
+    errors = []
+    if settings.DEBUG:
+        errors.append(Error(
+            'DEBUG is on.', hint='Set DEBUG=0 for production serving.', id='monitoring.E001'
+        ))
+    manifest = getattr(staticfiles_storage, 'manifest_name', None)
+    if manifest and not staticfiles_storage.exists(manifest):
+        errors.append(Error(
+            'No static files manifest in STATIC_ROOT.', hint='Run manage.py collectstatic.', id='monitoring.E002'
+        ))
+    if not settings.METRICS_TOKEN and not settings.METRICS_ALLOWED_IPS:
+        errors.append(Warning(
+            'Nobody may scrape /metrics.', hint='Set METRICS_TOKEN or METRICS_ALLOWED_IPS.', id='monitoring.W001'
+        ))
+    for alias in settings.CACHES:
+        try:
+            caches[alias].set('monitoring:check', 1, timeout=10)
+        except Exception as e:
+            errors.append(Error(f"Cache '{alias}' is unreachable: {e}", id='monitoring.E003'))
+    for alias in settings.DATABASES:
+        try:
+            connections[alias].ensure_connection()
+        except OperationalError as e:
+            errors.append(Error(f"Database '{alias}' is unreachable: {e}", id='monitoring.E004'))
+    return errors
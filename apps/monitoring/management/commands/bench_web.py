@@ -0,0 +1,27 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.monitoring.serving_benchmark import run_serving_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Compare requests per second of runserver and gunicorn with uvicorn workers on one path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=f'/api/public/{settings.LANGUAGE_CODE}/categories/')
+        parser.add_argument('--servers', default='runserver,gunicorn')
+        parser.add_argument('--seconds', type=int, default=10)
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--workers', type=int, default=None, help='Gunicorn workers, 2 x CPUs + 1 by default')
+
+    def handle(self, *args, **options):
+        try:
+            report = run_serving_benchmark(
+                options['path'], servers=options['servers'].split(','), seconds=options['seconds'],
+                concurrency=options['concurrency'], workers=options['workers'],
+            )
+        except (RuntimeError, ValueError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(json.dumps(report, indent=2))
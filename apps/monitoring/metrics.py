@@ -0,0 +1,35 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Django view latency', ['view', 'method', 'status']
+)
+HTTP_REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per request', ['view'], buckets=QUERY_BUCKETS
+)
+
+BOT_HANDLER_DURATION = Histogram(
+    'bot_handler_duration_seconds', 'Bot handler latency', ['router', 'handler']
+)
+BOT_HANDLER_ERRORS = Counter(
+    'bot_handler_errors_total', 'Exceptions raised by bot handlers', ['router', 'handler']
+)
+BOT_HANDLER_QUERIES = Histogram(
+    'bot_handler_db_queries', 'Database queries per bot update', ['router', 'handler'], buckets=QUERY_BUCKETS
+)
+BOT_DUPLICATE_UPDATES = Counter(
+    'bot_duplicate_updates_total',
+    'Redelivered updates dropped before the handlers: memory for confirmed filter hits, redis for refused claims',
+    ['layer']
+)
+
+TELEGRAM_SEND_QUEUE_DEPTH = Gauge('telegram_send_queue_depth', 'Outbound requests waiting to be sent')
+TELEGRAM_SEND_LATENCY = Histogram(
+    'telegram_send_latency_seconds', 'Time from queueing to completion of an outbound request'
+)
+TELEGRAM_SEND_FAILURES = Counter('telegram_send_failures_total', 'Outbound requests that failed')
+TELEGRAM_SEND_RETRIES = Counter('telegram_send_retries_total', 'Outbound requests retried after RetryAfter')
+
+BOT_SHARDS_OWNED = Gauge('bot_shards_owned', 'Update shards this bot worker currently owns')
+BOT_SHARD_HANDOFFS = Counter('bot_shard_handoffs_total', 'Update shards handed to another worker after rebalancing')
@@ -0,0 +1,25 @@
+import time
+
+from .metrics import HTTP_REQUEST_DURATION, HTTP_REQUEST_QUERIES
+from .queries import count_queries, should_track_shapes, check_profile
+
+
+class MetricsMiddleware:
+    """Per-view latency and query count histograms, plus query budget checks"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with count_queries(track_shapes=should_track_shapes()) as queries:
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        HTTP_REQUEST_DURATION.labels(view, request.method, response.status_code).observe(
+            time.perf_counter() - started
+        )
+        HTTP_REQUEST_QUERIES.labels(view).observe(queries.count)
+        check_profile(view, queries)
+        return response
@@ -0,0 +1,131 @@
+"""
+Per-context query accounting.
+
+Every database connection gets an execute wrapper that reports into the
+QueryProfile active in the current context (one API request or one bot
+update). Profiles can also record normalized SQL shapes with their call
+sites, which is how repeated identical queries (N+1) are spotted, and
+are checked against the QUERY_BUDGETS settings.
+"""
+import logging
+import os
+import random
+import re
+import traceback
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_profile = ContextVar('query_profile', default=None)
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+NUMBER_RE = re.compile(r'\b\d+\b')
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+MONITORING_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def sql_shape(sql):
+    """SQL with literals and IN lists collapsed, so repeats compare equal"""
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    sql = STRING_RE.sub('?', sql)
+    return NUMBER_RE.sub('?', sql)
+
+
+def call_site():
+    """Innermost project frame that led to the query"""
+    base_dir = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(base_dir) and not filename.startswith(MONITORING_DIR) and 'site-packages' not in filename:
+            return f"{os.path.relpath(filename, base_dir)}:{frame.lineno} in {frame.name}"
+    return 'unknown'
+
+
+class QueryProfile:
+    def __init__(self, track_shapes=False, parent=None):
+        self.parent = parent
+        self.count = 0
+        self.track_shapes = track_shapes
+        self.shapes = Counter()
+        self.call_sites = defaultdict(Counter)
+
+    def record(self, sql):
+        self.count += 1
+        if self.track_shapes:
+            shape = sql_shape(sql)
+            self.shapes[shape] += 1
+            self.call_sites[shape][call_site()] += 1
+
+    def repeated(self, threshold=None):
+        """Shapes run at least ``threshold`` times, most frequent first"""
+        threshold = threshold or settings.N_PLUS_ONE_THRESHOLD
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+def should_track_shapes():
+    return settings.DEBUG or random.random() < settings.QUERY_PROFILE_SAMPLE_RATE
+
+
+@contextmanager
+def count_queries(track_shapes=False):
+    """Profile the queries run in this context, including sync_to_async calls"""
+    profile = QueryProfile(track_shapes, parent=_profile.get())
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+
+
+def query_counter_wrapper(execute, sql, params, many, context):
+    profile = _profile.get()
+    while profile is not None:
+        profile.record(sql)
+        profile = profile.parent
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    if query_counter_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_counter_wrapper)
+
+
+def budget_for(name):
+    return settings.QUERY_BUDGETS.get(name, settings.QUERY_BUDGET_DEFAULT)
+
+
+def check_profile(name, profile, budget=None, strict=None):
+    """Log likely N+1 patterns and enforce the query budget for ``name``"""
+    for shape, count in profile.repeated():
+        sites = ', '.join(f"{site} ({n}x)" for site, n in profile.call_sites[shape].most_common(3))
+        logger.warning("Possible N+1 in %s: %d x %s at %s", name, count, shape, sites)
+
+    budget = budget_for(name) if budget is None else budget
+    if budget is None or profile.count <= budget:
+        return
+    message = f"{name} ran {profile.count} queries, budget is {budget}"
+    if settings.QUERY_BUDGET_STRICT if strict is None else strict:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+@contextmanager
+def query_budget(name, budget=None):
+    """
+    Fail with QueryBudgetExceeded when the block runs more queries than
+    allowed for ``name``, e.g. in tests::
+
+        with query_budget('product-list'):
+            self.client.get('/api/products/')
+    """
+    with count_queries(track_shapes=True) as profile:
+        yield profile
+    check_profile(name, profile, budget=budget, strict=True)
@@ -0,0 +1,118 @@
+"""
+HTTP serving benchmark.
+
+Starts the site under each server in turn (``runserver`` and gunicorn with
+uvicorn workers) on a free local port, drives the same path with
+concurrent keep-alive clients for a fixed time and reports requests per
+second and latency percentiles per server. The load generator shares the
+machine with the server, so compare the servers with each other rather
+than reading the numbers as absolute capacity.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import aiohttp
+from django.conf import settings
+
+
+# One client address sends every request, so lift the public API throttle
+SERVER_ENV = dict(os.environ, PUBLIC_CATALOG_THROTTLE_RATE='1000000/s')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(server, port, workers):
+    manage = [sys.executable, str(settings.BASE_DIR / 'manage.py')]
+    if server == 'runserver':
+        return manage + ['runserver', '--noreload', f'127.0.0.1:{port}']
+    if server == 'gunicorn':
+        return [
+            sys.executable, '-m', 'gunicorn', '-c', str(settings.BASE_DIR / 'config' / 'gunicorn.conf.py'),
+            '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+        ]
+    raise ValueError(f'Unknown server: {server}')
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+async def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as response:
+                    await response.read()
+                    return
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f'Server did not come up at {url}')
+
+
+async def drive(url, seconds, concurrency):
+    latencies, errors = [], 0
+    deadline = time.monotonic() + seconds
+
+    async def client(session):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                async with session.get(url) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.5) * 1000, 2),
+            'p95': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99': round(percentile(latencies, 0.99) * 1000, 2),
+        },
+    }
+
+
+def run_serving_benchmark(path, servers=('runserver', 'gunicorn'), seconds=10, concurrency=64, workers=None):
+    """Benchmark ``path`` under each server and return the report"""
+    workers = workers or (os.cpu_count() or 1) * 2 + 1
+    report = {'path': path, 'seconds': seconds, 'concurrency': concurrency, 'servers': {}}
+    for server in servers:
+        port = free_port()
+        url = f'http://127.0.0.1:{port}{path}'
+        process = subprocess.Popen(
+            server_command(server, port, workers), cwd=settings.BASE_DIR, env=SERVER_ENV,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            asyncio.run(wait_until_up(url))
+            # A short warm-up fills per-process caches before measuring
+            asyncio.run(drive(url, 1, concurrency))
+            report['servers'][server] = asyncio.run(drive(url, seconds, concurrency))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+    if 'gunicorn' in report['servers']:
+        report['servers']['gunicorn']['workers'] = workers
+    return report
@@ -0,0 +1,39 @@
+import hmac
+import ipaddress
+import os
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+from prometheus_client import multiprocess
+
+
+def _allowed_networks():
+    return [ipaddress.ip_network(value, strict=False) for value in settings.METRICS_ALLOWED_IPS]
+
+
+def may_scrape(request):
+    """Open under DEBUG, otherwise only to METRICS_ALLOWED_IPS or the METRICS_TOKEN bearer"""
+    if settings.DEBUG:
+        return True
+    token = settings.METRICS_TOKEN
+    if token and hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in network for network in _allowed_networks())
+
+
+def metrics(request):
+    """Prometheus exposition of this process (or all workers in multiprocess mode)"""
+    # Unknown clients see no endpoint at all
+    if not may_scrape(request):
+        raise Http404
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -7,13 +7,24 @@ class OrderItemInline(admin.TabularInline):
     extra = 0
     readonly_fields = ('total_price',)
     fields = ('product_color', 'quantity', 'price', 'total_price')
+    autocomplete_fields = ('product_color',)
     ordering = ('-id',)
 
+    @admin.display(description='Total price')
+    def total_price(self, obj):
+        # The blank "add another" row has no price to multiply yet
+        return obj.total_price if obj.pk else '-'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product_color__product')
+
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'status', 'total_amount', 'created_at')
     list_filter = ('status', 'created_at')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
     search_fields = ('user__username', 'user__telegram_id', 'phone_number')
     readonly_fields = ('total_amount', 'created_at', 'updated_at')
     inlines = [OrderItemInline]
@@ -0,0 +1,39 @@
+"""Turning a bot cart into an order"""
+from django.db import transaction
+
+from apps.products.inventory import commit_cart
+from apps.products.models import Cart
+from .models import Order, OrderItem
+
+
+class EmptyCart(Exception):
+    pass
+
+
+def place_order(cart, address, notes=''):
+    """
+    Create the order for everything in ``cart`` and take its stock in one
+    statement; raises OutOfStock and leaves the cart alone when any line
+    is short, and EmptyCart when there is nothing to order.
+    """
+    items = list(cart.items.select_related('product_color'))
+    if not items:
+        # Emptied between start_order and confirm_order
+        raise EmptyCart(f"Cart {cart.id} is empty")
+    with transaction.atomic():
+        commit_cart(cart.id, [(item.product_color_id, item.quantity) for item in items])
+        order = Order.objects.create(
+            user=cart.user,
+            total_amount=sum(item.total_price for item in items),
+            phone_number=cart.user.phone_number,
+            address=address,
+            notes=notes,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_color=item.product_color, quantity=item.quantity,
+                      price=item.product_color.price)
+            for item in items
+        ])
+        cart.items.all().delete()
+        Cart.touch(cart.id)
+    return order
@@ -27,6 +27,7 @@ class Order(models.Model):
     class Meta:
         db_table = 'order'
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['updated_at'])]
         verbose_name = "Order"
         verbose_name_plural = "Orders"
 
@@ -47,6 +48,7 @@ class OrderItem(models.Model):
         verbose_name = "Order Item"
         verbose_name_plural = "Order Items"
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['updated_at'])]
 
     def __str__(self):
         return f"{self.product_color} x {self.quantity}"
@@ -1,3 +1,95 @@
-from django.test import TestCase
+import csv
+import io
+import zipfile
+from decimal import Decimal
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+
+from apps.products.models import Cart, CartItem, Product, ProductColor
+from apps.users.models import User
+
+from . import export
+from .checkout import EmptyCart, place_order
+from .models import Order, OrderItem
+
+# The suite runs without Redis; version keys live in memory
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'orders-tests'},
+    'catalog': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'orders-tests-catalog'},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        product = Product.objects.create(name='Shirt', description='Shirt')
+        cls.color = ProductColor.objects.create(product=product, name='Red', price=Decimal('1000'), stock=5)
+        cls.cart = Cart.objects.create(user=User.objects.create(username='buyer', telegram_id=1))
+
+    def test_place_order(self):
+        CartItem.objects.create(cart=self.cart, product_color=self.color, quantity=2)
+        order = place_order(self.cart, 'Tashkent')
+        self.assertEqual(order.total_amount, Decimal('2000'))
+        self.assertEqual(list(order.items.values_list('quantity', flat=True)), [2])
+        self.assertFalse(self.cart.items.exists())
+        self.color.refresh_from_db()
+        self.assertEqual(self.color.stock, 3)
+
+    def test_empty_cart_is_refused(self):
+        with self.assertRaises(EmptyCart):
+            place_order(self.cart, 'Tashkent')
+        self.assertFalse(Order.objects.exists())
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        product = Product.objects.create(name='=HYPERLINK("http://example.com")', description='Shirt')
+        color = ProductColor.objects.create(product=product, name='Red', price=Decimal('1000'))
+        user = User.objects.create(username='buyer\x01', telegram_id=1)
+        order = Order.objects.create(user=user, total_amount=Decimal('2000'), phone_number='+998901234567',
+                                     address='Tashkent\x0b street', status='confirmed')
+        OrderItem.objects.create(order=order, product_color=color, quantity=2, price=Decimal('1000'))
+
+    def export(self, file_format, **filters):
+        return b''.join(
+            chunk if isinstance(chunk, bytes) else chunk.encode()
+            for chunk in export.stream_export(file_format, **filters)
+        )
+
+    def test_csv_neutralises_formulas(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('csv').decode())))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['product_name'], '\'=HYPERLINK("http://example.com")')
+        self.assertEqual(rows[0]['phone_number'], "'+998901234567")
+        self.assertEqual(rows[0]['line_total'], '2000.00')
+
+    def test_xlsx_is_valid_xml(self):
+        with zipfile.ZipFile(io.BytesIO(self.export('xlsx'))) as archive:
+            sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        namespace = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = sheet.findall('.//s:row', namespace)
+        self.assertEqual(len(rows), 2)
+        cells = [cell.findtext('.//s:t', namespaces=namespace) or cell.findtext('s:v', namespaces=namespace)
+                 for cell in rows[1]]
+        self.assertIn('buyer', cells)
+        self.assertIn('Tashkent street', cells)
+
+    def test_filters(self):
+        self.assertEqual(self.export('csv', statuses=['pending']).count(b'\n'), 1)
+        self.assertEqual(self.export('csv', statuses=['confirmed'], date_to='2999-01-01').count(b'\n'), 2)
+        self.assertEqual(self.export('csv', date_from='2999-01-01').count(b'\n'), 1)
+
+    def test_invalid_filters(self):
+        with self.assertRaisesMessage(ValueError, 'Invalid date: yesterday'):
+            export.stream_export('csv', date_from='yesterday')
+        with self.assertRaisesMessage(ValueError, 'Invalid status: lost'):
+            export.stream_export('csv', statuses=['confirmed', 'lost'])
+
+    def test_date_bounds_cover_the_day(self):
+        start, end = export._bound('2024-05-01'), export._bound('2024-05-01', end=True)
+        self.assertEqual((start.hour, start.minute), (0, 0))
+        self.assertEqual((end.hour, end.minute, end.second), (23, 59, 59))
+        self.assertEqual(export._bound('2024-05-01T10:30:00').hour, 10)
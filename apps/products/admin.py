@@ -1,57 +1,279 @@
-from django.contrib import admin
-from .models import Category, Product, ProductColor, ProductColorImage, Cart, CartItem
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.exceptions import PermissionDenied
+from django.db.models import DecimalField, F, Min, OuterRef, Subquery, Sum
+from django.http import HttpResponseNotAllowed, HttpResponseRedirect
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from . import bulk, ordering
+from .models import Category, Product, ProductColor, ProductColorImage, Cart, CartItem, StockReservation
+
+# Category names render through the cached full_path (see Category.full_path)
+# and related rows are joined or annotated up front, so changelists run a
+# fixed number of queries however many rows they page through.
+
+
+class CatalogActionForm(ActionForm):
+    percent = forms.DecimalField(required=False, label='Price change, %', max_digits=6, decimal_places=2)
+
+
+class CatalogBulkActions:
+    """Bulk actions that run as one UPDATE and bump the catalog version once"""
+    action_form = CatalogActionForm
+    actions = ['activate', 'deactivate', 'change_prices']
+    # bulk.change_prices argument the selected ids are passed as
+    price_filter_field = None
+
+    @admin.action(description='Activate selected')
+    def activate(self, request, queryset):
+        updated = bulk.set_active({self.model: list(queryset.values_list('pk', flat=True))}, True)[self.model]
+        self.message_user(request, f"Activated {updated} row(s).")
+
+    @admin.action(description='Deactivate selected')
+    def deactivate(self, request, queryset):
+        updated = bulk.set_active({self.model: list(queryset.values_list('pk', flat=True))}, False)[self.model]
+        self.message_user(request, f"Deactivated {updated} row(s).")
+
+    @admin.action(description='Change prices by the given percent')
+    def change_prices(self, request, queryset):
+        try:
+            percent = forms.DecimalField().clean(request.POST.get('percent'))
+            ids = list(queryset.values_list('pk', flat=True))
+            updated = bulk.change_prices(percent, **{self.price_filter_field: ids})
+        except (forms.ValidationError, ValueError) as e:
+            self.message_user(request, f"Prices not changed: {e}", messages.ERROR)
+            return
+        self.message_user(request, f"Changed the price of {updated} product color(s) by {percent}%.")
+
+
+class MoveButtons:
+    """
+    Up/down buttons moving a ``movable_model`` row past its neighbour with
+    apps.products.ordering, one row written per click. They are plain
+    buttons, so neither a click nor Enter in a field submits the admin form
+    around them; move_buttons.js posts just the CSRF token to the move view.
+    """
+    movable_model = None
+
+    class Media:
+        js = ('products/admin/move_buttons.js',)
+
+    def get_urls(self):
+        name = f'{self.model._meta.app_label}_{self.model._meta.model_name}_move'
+        return [
+            path('move/<int:pk>/<str:direction>/', self.admin_site.admin_view(self.move_view), name=name),
+        ] + super().get_urls()
+
+    def move_view(self, request, pk, direction):
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        obj = get_object_or_404(self.movable_model, pk=pk)
+        try:
+            ordering.step(obj, direction)
+        except ValueError as e:
+            self.message_user(request, str(e), messages.ERROR)
+        info = (self.model._meta.app_label, self.model._meta.model_name)
+        return HttpResponseRedirect(request.META.get('HTTP_REFERER') or reverse('admin:%s_%s_changelist' % info))
+
+
+def move_buttons(admin_model, obj):
+    if not obj.pk:
+        return '-'
+    name = f'admin:{admin_model._meta.app_label}_{admin_model._meta.model_name}_move'
+    return format_html(
+        '<button type="button" data-move-url="{}" title="Move up">&uarr;</button> '
+        '<button type="button" data-move-url="{}" title="Move down">&darr;</button>',
+        reverse(name, args=[obj.pk, 'up']), reverse(name, args=[obj.pk, 'down']),
+    )
 
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'parent', 'is_active', 'order', 'created_at')
-    list_filter = ('is_active', 'parent')
+class CategoryAdmin(MoveButtons, CatalogBulkActions, admin.ModelAdmin):
+    list_display = ('name', 'parent', 'is_active', 'order', 'move', 'created_at')
+    list_filter = ('is_active', ('parent', admin.EmptyFieldListFilter))
+    list_select_related = ('parent',)
     search_fields = ('name',)
+    autocomplete_fields = ('parent',)
     ordering = ('order', 'name')
+    movable_model = Category
+    price_filter_field = 'category_ids'
+
+    actions = CatalogBulkActions.actions + ['renumber']
+
+    @admin.display(description='Move')
+    def move(self, obj):
+        return move_buttons(Category, obj)
+
+    @admin.action(description='Renumber selected in their current order')
+    def renumber(self, request, queryset):
+        updated = bulk.reorder(Category, list(queryset.order_by('order', 'name').values_list('pk', flat=True)))
+        self.message_user(request, f"Renumbered {updated} categories.")
 
 
 class ProductColorImageInline(admin.TabularInline):
     model = ProductColorImage
     extra = 1
-    ordering = ('order',)
+    ordering = ('order', 'id')
+    readonly_fields = ('move',)
+
+    @admin.display(description='Move')
+    def move(self, obj):
+        return move_buttons(ProductColor, obj)
+
+
+class ProductColorForm(forms.ModelForm):
+    def clean(self):
+        cleaned_data = super().clean()
+        stock = cleaned_data.get('stock')
+        if stock is not None and self.instance.pk:
+            # Read afresh: checkouts reserve units while the form is open
+            reserved = ProductColor.objects.filter(pk=self.instance.pk).values_list('reserved', flat=True).first() or 0
+            if stock < reserved:
+                self.add_error('stock', f"{reserved} unit(s) are reserved by checkouts; stock cannot go below that.")
+        return cleaned_data
 
 
 @admin.register(ProductColor)
-class ProductColorAdmin(admin.ModelAdmin):
-    list_display = ('product', 'name', 'price', 'is_active', 'created_at')
+class ProductColorAdmin(MoveButtons, CatalogBulkActions, admin.ModelAdmin):
+    form = ProductColorForm
+    list_display = ('product', 'name', 'price', 'stock', 'reserved', 'is_active', 'created_at')
     list_filter = ('is_active',)
+    list_select_related = ('product',)
+    readonly_fields = ('reserved',)
     search_fields = ('name', 'product__name')
+    autocomplete_fields = ('product',)
     ordering = ('product__name', 'name')
     inlines = [ProductColorImageInline]
+    movable_model = ProductColorImage
+    price_filter_field = 'color_ids'
+
+    def get_queryset(self, request):
+        # Also used by autocomplete, whose labels include the product name
+        return super().get_queryset(request).select_related('product')
+
+    actions = CatalogBulkActions.actions + ['renumber_images']
+
+    @admin.action(description='Renumber images of selected colors')
+    def renumber_images(self, request, queryset):
+        updated = bulk.renumber_images(list(queryset.values_list('pk', flat=True)))
+        self.message_user(request, f"Renumbered {updated} image(s).")
 
 
 class ProductColorInline(admin.TabularInline):
     model = ProductColor
+    form = ProductColorForm
     extra = 1
+    readonly_fields = ('reserved',)
     ordering = ('name',)
     show_change_link = True
 
 
+class CategoryListFilter(admin.SimpleListFilter):
+    """
+    Categories one level at a time: the top level, then the parent, the
+    selected category and its children, so the sidebar stays short however
+    large the tree grows.
+    """
+    title = 'category'
+    parameter_name = 'category'
+
+    def selected(self):
+        if not hasattr(self, '_selected'):
+            value = self.value()
+            self._selected = (
+                Category.objects.select_related('parent').filter(pk=value).first() if value and value.isdigit() else None
+            )
+        return self._selected
+
+    def lookups(self, request, model_admin):
+        selected = self.selected()
+        choices = []
+        if selected is not None:
+            if selected.parent_id:
+                choices.append((selected.parent_id, f'↑ {selected.parent.name}'))
+            choices.append((selected.pk, selected.full_path))
+        children = Category.objects.filter(parent=selected).order_by('order', 'name').values_list('pk', 'name')
+        prefix = '↳ ' if selected is not None else ''
+        choices.extend((pk, f'{prefix}{name}') for pk, name in children)
+        return choices
+
+    def queryset(self, request, queryset):
+        if self.selected() is not None:
+            return queryset.filter(categories=self.selected())
+        return queryset
+
+
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(CatalogBulkActions, admin.ModelAdmin):
     list_display = ('name', 'min_price', 'is_active', 'created_at', 'updated_at')
-    list_filter = ('is_active', 'categories')
+    list_filter = ('is_active', CategoryListFilter)
     search_fields = ('name',)
-    filter_horizontal = ('categories',)
+    autocomplete_fields = ('categories',)
     ordering = ('-created_at',)
     inlines = [ProductColorInline]
+    price_filter_field = 'product_ids'
+
+    def get_queryset(self, request):
+        # Correlated subqueries are only evaluated for the rows on the page
+        prices = ProductColor.objects.filter(product=OuterRef('pk'), is_active=True).order_by().values('product')
+        return super().get_queryset(request).annotate(
+            active_min_price=Subquery(prices.annotate(value=Min('price')).values('value'))
+        )
+
+    @admin.display(description='Min price', ordering='active_min_price')
+    def min_price(self, obj):
+        return obj.active_min_price or 0
 
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 0
     readonly_fields = ('total_price',)
+    autocomplete_fields = ('product_color',)
     ordering = ('-created_at',)
 
+    @admin.display(description='Total price')
+    def total_price(self, obj):
+        # The blank "add another" row has no price to multiply yet
+        return obj.total_price if obj.pk else '-'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product_color__product')
+
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'total_amount', 'created_at', 'updated_at')
+    list_display = ('user', 'total_amount', 'last_item_activity_at', 'created_at', 'updated_at')
+    list_select_related = ('user',)
     search_fields = ('user__username', 'user__telegram_id')
+    autocomplete_fields = ('user',)
     inlines = [CartItemInline]
     ordering = ('-created_at',)
+
+    def get_queryset(self, request):
+        totals = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart').annotate(
+            value=Sum(F('quantity') * F('product_color__price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+        )
+        return super().get_queryset(request).annotate(items_total=Subquery(totals.values('value')))
+
+    @admin.display(description='Total amount', ordering='items_total')
+    def total_amount(self, obj):
+        return obj.items_total or 0
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Item edits here count as activity, like adds and removes in the bot
+        if any(formset.has_changed() for formset in formsets):
+            Cart.touch(form.instance.pk)
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('cart', 'product_color', 'quantity', 'expires_at')
+    list_select_related = ('cart__user', 'product_color__product')
+    raw_id_fields = ('cart', 'product_color')
+    ordering = ('expires_at',)
@@ -0,0 +1,120 @@
+"""
+Set-based catalog edits for the admin and the API.
+
+Each operation is one UPDATE (or one bulk_update for reordering) and bumps
+the catalog version once when its transaction commits, instead of saving
+row by row and firing a signal per row.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Round
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .models import Category, Product, ProductColor, ProductColorImage
+from .ordering import STEP, raise_counters
+
+
+def _changed():
+    transaction.on_commit(bump_catalog_version)
+
+
+def category_subtree_ids(category_ids):
+    """The given categories and all their descendants, from one query"""
+    children = {}
+    for pk, parent_id in Category.objects.values_list('id', 'parent_id'):
+        children.setdefault(parent_id, []).append(pk)
+    found, stack = set(), list(category_ids)
+    while stack:
+        pk = stack.pop()
+        if pk not in found:
+            found.add(pk)
+            stack.extend(children.get(pk, ()))
+    return found
+
+
+@transaction.atomic
+def set_active(targets, is_active):
+    """
+    Activate or deactivate rows given as {model: ids}, e.g. products and
+    colors together, and return how many changed per model.
+    """
+    now = timezone.now()
+    updated = {}
+    for model, ids in targets.items():
+        assert model in (Category, Product, ProductColor)
+        updated[model] = model.objects.filter(pk__in=ids).exclude(is_active=is_active).update(
+            is_active=is_active, updated_at=now
+        )
+    if any(updated.values()):
+        _changed()
+    return updated
+
+
+@transaction.atomic
+def change_prices(percent, color_ids=None, product_ids=None, category_ids=None):
+    """
+    Raise (or with a negative ``percent`` lower) the price of the given
+    colors, the colors of the given products, and the colors of products
+    anywhere under the given categories. Prices are rounded to 2 places.
+    """
+    try:
+        factor = 1 + Decimal(str(percent)) / 100
+    except ArithmeticError:
+        raise ValueError('percent must be a number') from None
+    if not factor.is_finite() or factor <= 0:
+        raise ValueError('percent must be greater than -100')
+
+    colors = ProductColor.objects.none()
+    if color_ids:
+        colors |= ProductColor.objects.filter(pk__in=color_ids)
+    if product_ids:
+        colors |= ProductColor.objects.filter(product_id__in=product_ids)
+    if category_ids:
+        products = Product.categories.through.objects.filter(
+            category_id__in=category_subtree_ids(category_ids)
+        ).values('product_id')
+        colors |= ProductColor.objects.filter(product_id__in=products)
+
+    # modeltranslation cannot rewrite Round(); price is not translated anyway
+    updated = ProductColor.objects.rewrite(False).filter(pk__in=colors.values('pk')).update(
+        price=Round(F('price') * factor, 2), updated_at=timezone.now()
+    )
+    if updated:
+        _changed()
+    return updated
+
+
+def _save_order(model, rows):
+    now = timezone.now()
+    changed = []
+    for position, obj in rows:
+        if obj.order != position * STEP:
+            obj.order, obj.updated_at = position * STEP, now
+            changed.append(obj)
+    model.objects.bulk_update(changed, ['order', 'updated_at'])
+    if changed:
+        raise_counters(changed)
+        _changed()
+    return len(changed)
+
+
+@transaction.atomic
+def reorder(model, ids, **scope):
+    """Space ``ids`` out in the given order with a single bulk_update; ids outside ``scope`` are skipped"""
+    assert model in (Category, ProductColorImage)
+    objects = model.objects.filter(**scope).in_bulk(ids)
+    return _save_order(model, [(position, objects[pk]) for position, pk in enumerate(ids, start=1) if pk in objects])
+
+
+@transaction.atomic
+def renumber_images(color_ids):
+    """Respace the image order of each color evenly, keeping the current sequence"""
+    rows, position, color_id = [], 0, None
+    for image in ProductColorImage.objects.filter(color_id__in=color_ids).order_by('color_id', 'order', 'id'):
+        position = position + 1 if image.color_id == color_id else 1
+        color_id = image.color_id
+        rows.append((position, image))
+    return _save_order(ProductColorImage, rows)
@@ -0,0 +1,122 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.cache import cache
+from django.utils.translation import get_language
+
+CATALOG_VERSION_KEY = 'catalog:version'
+# Stock and reservations change by UPDATE far more often than the rest of
+# the catalog, so they have a version of their own
+STOCK_VERSION_KEY = 'catalog:stock_version'
+
+# {language: (catalog version, {category id: full path})} for this process
+_category_paths = {}
+# The catalog version as first read inside catalog_snapshot(), if any
+_snapshot = ContextVar('catalog_snapshot', default=None)
+
+
+def _changed_at_key(key):
+    return f'{key}:changed_at'
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a flushed cache never reuses an old version
+        now = time.time_ns()
+        cache.add(key, now, timeout=None)
+        cache.add(_changed_at_key(key), now / 1e9, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        _get_version(key)
+        version = cache.incr(key)
+    cache.set(_changed_at_key(key), time.time(), timeout=None)
+    return version
+
+
+def get_catalog_version() -> int:
+    """Current catalog version, shared by the web and bot processes"""
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version() -> int:
+    """Invalidate every cache keyed on the catalog version"""
+    version = _bump_version(CATALOG_VERSION_KEY)
+    snapshot = _snapshot.get()
+    if snapshot is not None:
+        # What the block writes, it reads back
+        snapshot['version'] = version
+    return version
+
+
+def get_stock_version() -> int:
+    return _get_version(STOCK_VERSION_KEY)
+
+
+def bump_stock_version() -> int:
+    """Invalidate caches of anything showing stock levels"""
+    return _bump_version(STOCK_VERSION_KEY)
+
+
+def catalog_state(stock=False):
+    """
+    The catalog version (and stock version with ``stock``) as a tuple, and
+    the Unix time of the latest change among them, in one cache round trip.
+    """
+    keys = [CATALOG_VERSION_KEY, STOCK_VERSION_KEY] if stock else [CATALOG_VERSION_KEY]
+    found = cache.get_many([*keys, *map(_changed_at_key, keys)])
+    versions = tuple(found[key] if found.get(key) is not None else _get_version(key) for key in keys)
+    changed = [found[_changed_at_key(key)] for key in keys if found.get(_changed_at_key(key)) is not None]
+    return versions, max(changed, default=None)
+
+
+@contextmanager
+def catalog_snapshot():
+    """Read the catalog version at most once for everything inside the block"""
+    token = _snapshot.set({})
+    try:
+        yield
+    finally:
+        _snapshot.reset(token)
+
+
+def _snapshot_version():
+    snapshot = _snapshot.get()
+    if snapshot is None:
+        return get_catalog_version()
+    if 'version' not in snapshot:
+        snapshot['version'] = get_catalog_version()
+    return snapshot['version']
+
+
+def category_paths():
+    """
+    Full path of every category by id in the active language, rebuilt once
+    per catalog version and language
+    """
+    language = get_language()
+    version = _snapshot_version()
+    cached = _category_paths.get(language)
+    if cached is None or cached[0] != version:
+        from .catalog_io import category_paths as build_paths
+
+        cached = _category_paths[language] = (version, build_paths())
+    return cached[1]
+
+
+class CatalogSnapshotMiddleware:
+    """One catalog version read per request, however many categories render"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with catalog_snapshot():
+            return self.get_response(request)
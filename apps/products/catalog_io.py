@@ -0,0 +1,346 @@
+"""
+Streaming catalog import and export.
+
+One row per product color (or per product without colors) carrying the
+product and color translations, price, flags and category paths such as
+``Mebel > Divanlar`` separated by ``|``. Rows with ``product_id`` or
+``color_id`` update that record, rows without create one; any column may
+be omitted, so a price update only needs ``color_id,price``. Files are
+processed in fixed-size chunks, each in its own transaction, so memory
+stays flat regardless of file size. Each row is converted and validated
+against the model fields first; bad rows, and rows naming a product or
+color that does not exist, are skipped and reported by line.
+"""
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone, translation
+from modeltranslation.utils import build_localized_fieldname
+
+from .cache import bump_catalog_version
+from .models import Category, Product, ProductColor
+
+PATH_SEPARATOR = ' > '
+CATEGORY_SEPARATOR = '|'
+FORMATS = ('csv', 'jsonl')
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+# bulk_update builds a CASE per batch whose cost grows with its size
+UPDATE_BATCH_SIZE = 250
+# Bad rows listed in the result; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+def _localized(field):
+    return [build_localized_fieldname(field, code) for code, _ in settings.LANGUAGES]
+
+
+# Column name -> model field, for the product and the color part of a row
+PRODUCT_COLUMNS = {
+    **{f'product_{name}': name for name in _localized('name')},
+    **{f'product_{name}': name for name in _localized('description')},
+    'product_is_active': 'is_active',
+}
+COLOR_COLUMNS = {
+    **{f'color_{name}': name for name in _localized('name')},
+    'price': 'price',
+    'color_is_active': 'is_active',
+}
+COLUMNS = ['product_id', *PRODUCT_COLUMNS, 'categories', 'color_id', *COLOR_COLUMNS]
+
+
+def category_paths():
+    """Full path of every category, built from one query"""
+    rows = {pk: (name, parent_id) for pk, name, parent_id in Category.objects.values_list('id', 'name', 'parent_id')}
+    paths = {}
+
+    def path(pk):
+        if pk not in paths:
+            name, parent_id = rows[pk]
+            paths[pk] = f"{path(parent_id)}{PATH_SEPARATOR}{name}" if parent_id else name
+        return paths[pk]
+
+    for pk in rows:
+        path(pk)
+    return paths
+
+
+# Export
+
+def export_rows(chunk_size=1000):
+    paths = category_paths()
+    products = Product.objects.order_by('id').prefetch_related(
+        Prefetch('colors', queryset=ProductColor.objects.order_by('id')),
+        Prefetch('categories', queryset=Category.objects.only('id')),
+    )
+    for product in products.iterator(chunk_size=chunk_size):
+        base = {'product_id': product.id}
+        for column, field in PRODUCT_COLUMNS.items():
+            base[column] = getattr(product, field)
+        base['categories'] = CATEGORY_SEPARATOR.join(paths[category.id] for category in product.categories.all())
+
+        colors = product.colors.all() or [None]
+        for color in colors:
+            row = dict(base, color_id=color.id if color else None)
+            for column, field in COLOR_COLUMNS.items():
+                row[column] = getattr(color, field) if color else None
+            yield row
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def stream_export(file_format='csv', chunk_size=1000):
+    """Yield the export as encoded text chunks, one per row"""
+    if file_format == 'jsonl':
+        for row in export_rows(chunk_size):
+            yield json.dumps(row, ensure_ascii=False, default=str) + '\n'
+        return
+
+    writer = csv.DictWriter(_Echo(), fieldnames=COLUMNS)
+    yield writer.writeheader()
+    for row in export_rows(chunk_size):
+        yield writer.writerow({key: '' if value is None else value for key, value in row.items()})
+
+
+# Import
+
+def read_rows(stream, file_format='csv'):
+    """
+    Lazily parse ``(line number, row)`` pairs from a text stream. A line
+    that is not valid JSON comes through as the ValueError it raised, to be
+    reported with the other bad rows.
+    """
+    if file_format == 'jsonl':
+        for number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError as e:
+                    yield number, ValueError(f'invalid JSON: {e}')
+    else:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _present(row, column):
+    return column in row and row[column] not in (None, '')
+
+
+def _value(field, value):
+    """``value`` converted and validated for the model ``field``"""
+    if field.name == 'is_active' and not isinstance(value, bool):
+        return str(value).strip().lower() in TRUE_VALUES
+    return field.clean(value, None)
+
+
+def clean_row(row):
+    """
+    The row with ids and values converted (Decimal prices and so on), and
+    only the columns to apply; ValueError names the first bad column
+    """
+    if not isinstance(row, dict):
+        raise ValueError('not an object')
+    cleaned = {}
+    for column in ('product_id', 'color_id'):
+        if _present(row, column):
+            try:
+                cleaned[column] = int(row[column])
+            except (TypeError, ValueError):
+                raise ValueError(f'{column}: not an id: {row[column]!r}')
+    for model, columns in ((Product, PRODUCT_COLUMNS), (ProductColor, COLOR_COLUMNS)):
+        for column, field in columns.items():
+            value = row.get(column)
+            if value is None or (value == '' and field in ('price', 'is_active')):
+                continue
+            try:
+                cleaned[column] = _value(model._meta.get_field(field), value)
+            except ValidationError as e:
+                raise ValueError(f"{column}: {' '.join(e.messages)}")
+    if 'color_id' not in cleaned and 'price' not in cleaned and any(_present(cleaned, column) for column in COLOR_COLUMNS):
+        raise ValueError('price: required for a new color')
+    if row.get('categories') is not None:
+        cleaned['categories'] = str(row['categories'])
+    return cleaned
+
+
+def _default_language_fields(fields):
+    """Keep the untranslated column in step with the default language"""
+    extra = set()
+    for field in fields:
+        for base in ('name', 'description'):
+            if field == build_localized_fieldname(base, settings.LANGUAGE_CODE):
+                extra.add(base)
+    return fields | extra
+
+
+def _pk(product):
+    return product if isinstance(product, int) else product.pk
+
+
+class CatalogImporter:
+    def __init__(self, chunk_size=2000):
+        self.chunk_size = chunk_size
+        self.name_column = f"product_{build_localized_fieldname('name', settings.LANGUAGE_CODE)}"
+        self.paths = {path: pk for pk, path in category_paths().items()}
+        # Ids of products created in this run by name, so later rows can add colors
+        self.created_products = {}
+        self.stats = {'rows': 0, 'rows_skipped': 0, 'products_created': 0, 'products_updated': 0,
+                      'colors_created': 0, 'colors_updated': 0, 'errors': []}
+
+    def category_id(self, path):
+        """Resolve a category path, creating missing levels"""
+        path = PATH_SEPARATOR.join(part.strip() for part in path.split(PATH_SEPARATOR.strip()))
+        if path not in self.paths:
+            parent_path, _, name = path.rpartition(PATH_SEPARATOR)
+            parent_id = self.category_id(parent_path) if parent_path else None
+            self.paths[path] = Category.objects.create(name=name, parent_id=parent_id).id
+        return self.paths[path]
+
+    def skip(self, number, error):
+        self.stats['rows_skipped'] += 1
+        if len(self.stats['errors']) < MAX_REPORTED_ERRORS:
+            self.stats['errors'].append({'line': number, 'error': error})
+
+    def valid_rows(self, numbered_rows):
+        """``(line number, cleaned row)`` pairs, with bad rows counted and reported"""
+        for number, row in numbered_rows:
+            try:
+                if isinstance(row, ValueError):
+                    raise row
+                yield number, clean_row(row)
+            except ValueError as e:
+                self.skip(number, str(e))
+
+    def run(self, numbered_rows):
+        committed = False
+        try:
+            with translation.override(settings.LANGUAGE_CODE):
+                for chunk in _chunks(self.valid_rows(numbered_rows), self.chunk_size):
+                    with transaction.atomic():
+                        self.import_chunk(chunk)
+                    committed = True
+        finally:
+            # Chunks committed before a failure are live and must be seen
+            if committed:
+                bump_catalog_version()
+        return self.stats
+
+    @staticmethod
+    def _apply(obj, row, columns):
+        changed = set()
+        for column, field in columns.items():
+            if column in row:
+                setattr(obj, field, row[column])
+                changed.add(field)
+        return changed
+
+    def import_chunk(self, numbered_rows):
+        """Apply ``(line number, cleaned row)`` pairs; rows naming a missing record are skipped"""
+        now = timezone.now()
+        products = Product.objects.in_bulk({row['product_id'] for _, row in numbered_rows if 'product_id' in row})
+        colors = ProductColor.objects.in_bulk({row['color_id'] for _, row in numbered_rows if 'color_id' in row})
+        rows = []
+        for number, row in numbered_rows:
+            if 'product_id' in row and row['product_id'] not in products:
+                self.skip(number, f"product_id: no product {row['product_id']}")
+            elif 'color_id' in row and row['color_id'] not in colors:
+                self.skip(number, f"color_id: no color {row['color_id']}")
+            else:
+                rows.append(row)
+        self.stats['rows'] += len(rows)
+
+        # Products: update by id, create by name when neither id is given.
+        # Color-only rows (e.g. price updates) leave the product alone.
+        new_products, updated_products, product_fields = {}, {}, set()
+        owners = []
+        for row in rows:
+            owner = None
+            if 'product_id' in row:
+                owner = products[row['product_id']]
+                fields = self._apply(owner, row, PRODUCT_COLUMNS)
+                if fields:
+                    owner.updated_at = now
+                    product_fields |= fields
+                    updated_products[owner.pk] = owner
+            elif 'color_id' not in row and _present(row, self.name_column):
+                key = row[self.name_column]
+                owner = self.created_products.get(key) or new_products.get(key)
+                if owner is None:
+                    owner = Product()
+                    self._apply(owner, row, PRODUCT_COLUMNS)
+                    new_products[key] = owner
+            owners.append(owner)
+
+        Product.objects.bulk_create(new_products.values())
+        self.created_products.update({key: product.pk for key, product in new_products.items()})
+        if updated_products:
+            fields = _default_language_fields(product_fields) | {'updated_at'}
+            Product.objects.bulk_update(updated_products.values(), fields, batch_size=UPDATE_BATCH_SIZE)
+        self.stats['products_created'] += len(new_products)
+        self.stats['products_updated'] += len(updated_products)
+
+        # Category membership is replaced whenever the column is given
+        memberships = {}
+        for row, owner in zip(rows, owners):
+            if owner is not None and 'categories' in row:
+                memberships[_pk(owner)] = {
+                    self.category_id(path) for path in row['categories'].split(CATEGORY_SEPARATOR) if path.strip()
+                }
+        if memberships:
+            through = Product.categories.through
+            through.objects.filter(product_id__in=memberships).delete()
+            through.objects.bulk_create([
+                through(product_id=product_id, category_id=category_id)
+                for product_id, category_ids in memberships.items() for category_id in category_ids
+            ])
+
+        # Colors: update by id, otherwise create under the row's product
+        new_colors, updated_colors, color_fields = [], {}, set()
+        for row, owner in zip(rows, owners):
+            if 'color_id' in row:
+                color = colors[row['color_id']]
+                fields = self._apply(color, row, COLOR_COLUMNS)
+                if fields:
+                    color.updated_at = now
+                    color_fields |= fields
+                    updated_colors[color.pk] = color
+            elif owner is not None and any(_present(row, column) for column in COLOR_COLUMNS):
+                color = ProductColor(product_id=_pk(owner))
+                self._apply(color, row, COLOR_COLUMNS)
+                new_colors.append(color)
+
+        ProductColor.objects.bulk_create(new_colors)
+        if updated_colors:
+            fields = _default_language_fields(color_fields) | {'updated_at'}
+            ProductColor.objects.bulk_update(updated_colors.values(), fields, batch_size=UPDATE_BATCH_SIZE)
+        self.stats['colors_created'] += len(new_colors)
+        self.stats['colors_updated'] += len(updated_colors)
+
+
+def import_catalog(stream, file_format='csv', chunk_size=2000):
+    """Import rows from a text stream and return counts of what changed"""
+    return CatalogImporter(chunk_size).run(read_rows(stream, file_format))
+
+
+def text_stream(uploaded_file):
+    """Decode an uploaded file lazily"""
+    return io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline='')
@@ -0,0 +1,145 @@
+"""
+Stock levels and checkout reservations.
+
+Every change is one conditional UPDATE over all lines of an order,
+``... WHERE stock >= reserved + n``, run in a transaction and rolled back
+when any line falls short, so concurrent checkouts can never take the same
+units twice. Carts entering checkout reserve their items for
+STOCK_RESERVATION_MINUTES; placing the order turns the reservation into a
+stock decrement. Colors whose ``stock`` is null are not tracked.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, Value, When
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .cache import bump_stock_version
+from .models import ProductColor, StockReservation
+
+# Sent with ``color_ids`` when colors drop to LOW_STOCK_THRESHOLD available units or below
+stock_low = Signal()
+
+
+class OutOfStock(Exception):
+    def __init__(self, color_ids):
+        self.color_ids = color_ids
+        super().__init__(f"Not enough stock for product colors {sorted(color_ids)}")
+
+
+def _quantities(lines):
+    """Sum (color_id, quantity) pairs per color"""
+    totals = defaultdict(int)
+    for color_id, quantity in lines:
+        totals[color_id] += quantity
+    return dict(totals)
+
+
+def _per_color(quantities):
+    return Case(
+        *(When(id=color_id, then=Value(quantity)) for color_id, quantity in quantities.items()),
+        output_field=PositiveIntegerField(),
+    )
+
+
+def _tracked(quantities):
+    ids = ProductColor.objects.filter(id__in=quantities, stock__isnull=False).values_list('id', flat=True)
+    return {color_id: quantities[color_id] for color_id in ids}
+
+
+class _Short(Exception):
+    pass
+
+
+def _take(quantities, field):
+    """
+    Take units for every color in ``quantities`` (tracked ones only), all
+    or nothing: 'stock' sells them, 'reserved' holds them.
+    """
+    if not quantities:
+        return
+    enough = reduce(or_, (Q(id=color_id, stock__gte=F('reserved') + n) for color_id, n in quantities.items()))
+    change = F(field) - _per_color(quantities) if field == 'stock' else F(field) + _per_color(quantities)
+    try:
+        with transaction.atomic():
+            if ProductColor.objects.filter(enough).update(**{field: change}) != len(quantities):
+                raise _Short
+    except _Short:
+        # Rolled back to before the UPDATE, so the short lines can be read
+        rows = ProductColor.objects.filter(id__in=quantities).values_list('id', 'stock', 'reserved')
+        raise OutOfStock({pk for pk, stock, reserved in rows if stock - reserved < quantities[pk]}) from None
+    transaction.on_commit(bump_stock_version)
+    _notify_low_stock(quantities)
+
+
+def _notify_low_stock(quantities):
+    """Signal the colors this change pushed to the threshold or below"""
+    threshold = settings.LOW_STOCK_THRESHOLD
+    rows = ProductColor.objects.filter(id__in=quantities).values_list('id', 'stock', 'reserved')
+    crossed = {
+        pk for pk, stock, reserved in rows
+        if stock - reserved <= threshold < stock - reserved + quantities[pk]
+    }
+    if crossed:
+        transaction.on_commit(lambda: stock_low.send(sender=ProductColor, color_ids=crossed))
+
+
+def decrement_stock(lines):
+    """Take stock for an order's (color_id, quantity) lines or raise OutOfStock"""
+    with transaction.atomic():
+        _take(_tracked(_quantities(lines)), 'stock')
+
+
+def _release(reservations):
+    quantities = _quantities((r.product_color_id, r.quantity) for r in reservations)
+    if quantities:
+        ProductColor.objects.filter(id__in=quantities).update(reserved=F('reserved') - _per_color(quantities))
+        StockReservation.objects.filter(id__in=[r.id for r in reservations]).delete()
+        transaction.on_commit(bump_stock_version)
+
+
+def release_cart(cart_id):
+    """Give back whatever the cart holds"""
+    with transaction.atomic():
+        _release(list(StockReservation.objects.select_for_update().filter(cart_id=cart_id)))
+
+
+def reserve_cart(cart):
+    """Hold the cart's items for STOCK_RESERVATION_MINUTES or raise OutOfStock"""
+    lines = list(cart.items.values_list('product_color_id', 'quantity'))
+    expires_at = timezone.now() + timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+    with transaction.atomic():
+        _release(list(StockReservation.objects.select_for_update().filter(cart_id=cart.id)))
+        quantities = _tracked(_quantities(lines))
+        _take(quantities, 'reserved')
+        StockReservation.objects.bulk_create([
+            StockReservation(cart_id=cart.id, product_color_id=color_id, quantity=quantity, expires_at=expires_at)
+            for color_id, quantity in quantities.items()
+        ])
+
+
+def commit_cart(cart_id, lines):
+    """Turn the cart's reservation into a stock decrement for ``lines``"""
+    with transaction.atomic():
+        release_cart(cart_id)
+        decrement_stock(lines)
+
+
+def expire_reservations(batch_size=1000):
+    """Release reservations past their expiry, returning how many"""
+    expired = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                StockReservation.objects.select_for_update(skip_locked=True)
+                .filter(expires_at__lte=timezone.now())[:batch_size]
+            )
+            _release(batch)
+        expired += len(batch)
+        if len(batch) < batch_size:
+            return expired
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from apps.products.models import Cart
+
+
+class Command(BaseCommand):
+    help = 'Set the item activity time of carts filled before it was tracked'
+
+    def handle(self, *args, **options):
+        updated = Cart.objects.backfill_activity()
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {updated} cart(s)"))
@@ -0,0 +1,21 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.products.stock_benchmark import run_stock_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Sell out a few colors from many threads at once and check nothing was oversold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=64)
+        parser.add_argument('--colors', type=int, default=5)
+        parser.add_argument('--stock', type=int, default=500, help='Initial stock per color')
+
+    def handle(self, *args, **options):
+        report = run_stock_benchmark(
+            workers=options['workers'], colors=options['colors'], stock=options['stock']
+        )
+        self.stdout.write(json.dumps(report, indent=2))
+        if report['oversold'] or not report['consistent']:
+            raise CommandError('Stock went out of sync under concurrency')
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.products.cache import get_catalog_version
+from apps.products.snapshot import write_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Write the Mini App storefront snapshot of the current catalog version'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=2, help='Catalog versions to keep on disk')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running, rebuilding every N seconds when the catalog changed')
+
+    def handle(self, *args, **options):
+        built = None
+        while True:
+            if get_catalog_version() != built:
+                result = write_snapshot(keep=options['keep'])
+                built = result['version']
+                self.stdout.write(
+                    f"Wrote catalog version {built} in {len(result['files'])} language(s), "
+                    f"{result['thumbnails']} new thumbnail(s)"
+                )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,22 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from apps.products.catalog_io import stream_export, FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Stream the catalog as CSV or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='csv', dest='file_format')
+        parser.add_argument('--output', help='File to write, stdout by default')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        out = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            for chunk in stream_export(options['file_format'], options['chunk_size']):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
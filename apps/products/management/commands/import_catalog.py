@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.products.catalog_io import import_catalog, FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Create or update products and colors from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, dest='file_format',
+                            help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        started = time.perf_counter()
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as stream:
+                stats = import_catalog(stream, file_format, options['chunk_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        elapsed = time.perf_counter() - started
+        errors = stats.pop('errors')
+        for error in errors:
+            self.stderr.write(f"Line {error['line']}: {error['error']}")
+        summary = ', '.join(f'{key}={value}' for key, value in stats.items())
+        self.stdout.write(self.style.SUCCESS(f'Imported in {elapsed:.1f}s: {summary}'))
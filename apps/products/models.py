@@ -1,5 +1,9 @@
+from datetime import timedelta
 from decimal import Decimal
+from django.conf import settings
 from django.db import models
+from django.db.models import Case, Exists, F, Max, OuterRef, Q, Subquery, Value, When
+from django.utils import timezone
 from apps.users.models import User
 
 
@@ -19,20 +23,28 @@ class Category(models.Model):
         verbose_name_plural = "Categories"
         ordering = ['order', 'name']
         db_table = 'category'
+        indexes = [models.Index(fields=['parent', 'order'], name='category_parent_order_idx')]
 
     def __str__(self):
         return self.full_path
 
     @property
     def full_path(self):
+        # Served from the per-version path map, so listing categories costs
+        # no query per parent; categories not in it yet are walked up
+        from .cache import category_paths
+
+        path = category_paths().get(self.pk) if self.pk else None
+        if path is not None and path.rpartition(' > ')[2] == self.name:
+            return path
         if self.parent:
             return f"{self.parent.full_path} > {self.name}"
         return self.name
 
     def save(self, *args, **kwargs):
-        if not self.order or self.order == 0:
-            max_order = Category.objects.aggregate(models.Max('order'))['order__max'] or 0
-            self.order = max_order + 1
+        if self._state.adding and not self.order:
+            from .ordering import next_position
+            self.order = next_position(self)
         super().save(*args, **kwargs)
 
 
@@ -57,14 +69,18 @@ class Product(models.Model):
 
     @property
     def min_price(self):
-        colors = self.colors.filter(is_active=True)
-        return min((color.price for color in colors), default=0)
+        # Filtered in Python so prefetched colors are reused
+        return min((color.price for color in self.colors.all() if color.is_active), default=0)
 
 
 class ProductColor(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='colors', verbose_name="Product")
     name = models.CharField(max_length=100, verbose_name="Color Name")
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Price")
+    # Units on hand, null when stock is not tracked for this color
+    stock = models.PositiveIntegerField(null=True, blank=True, verbose_name="Stock")
+    # Units held by carts in checkout, see apps.products.inventory
+    reserved = models.PositiveIntegerField(default=0, editable=False, verbose_name="Reserved")
     is_active = models.BooleanField(default=True, verbose_name="Is Active")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated At")
@@ -74,10 +90,21 @@ class ProductColor(models.Model):
         verbose_name_plural = "Product Colors"
         db_table = 'product_color'
         ordering = ['name']
+        constraints = [
+            models.CheckConstraint(
+                check=Q(stock__isnull=True) | Q(stock__gte=F('reserved')),
+                name='product_color_stock_covers_reserved',
+            )
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.name}"
 
+    @property
+    def available(self):
+        """Units that can still be ordered, None when not tracked"""
+        return None if self.stock is None else self.stock - self.reserved
+
 
 class ProductColorImage(models.Model):
     color = models.ForeignKey(ProductColor, on_delete=models.CASCADE, related_name='images',
@@ -92,25 +119,66 @@ class ProductColorImage(models.Model):
         verbose_name_plural = "Product Color Images"
         ordering = ['order', 'id']
         db_table = 'product_color_image'
+        indexes = [models.Index(fields=['color', 'order'], name='color_image_color_order_idx')]
 
     def __str__(self):
         return f"{self.color} - Image {self.order}"
 
     def save(self, *args, **kwargs):
-        if self.order == 0:
-            last_order = ProductColorImage.objects.filter(color=self.color).aggregate(
-                models.Max('order')
-            )['order__max'] or 0
-            self.order = last_order + 1
+        if self._state.adding and self.order == 0:
+            from .ordering import next_position
+            self.order = next_position(self)
         super().save(*args, **kwargs)
 
 
+class OrderingCounter(models.Model):
+    """Last position handed out in one ordering scope, see apps.products.ordering"""
+    scope = models.CharField(max_length=64, unique=True, verbose_name="Scope")
+    value = models.PositiveBigIntegerField(default=0, verbose_name="Last Position")
+
+    class Meta:
+        verbose_name = "Ordering Counter"
+        verbose_name_plural = "Ordering Counters"
+        db_table = 'ordering_counter'
+
+    def __str__(self):
+        return f"{self.scope}: {self.value}"
+
+
+class CartQuerySet(models.QuerySet):
+    def abandoned(self, hours=None, include_reminded=False):
+        """Non-empty carts of Telegram users with no item activity for ``hours``"""
+        cutoff = timezone.now() - timedelta(hours=hours or settings.ABANDONED_CART_HOURS)
+        carts = self.filter(
+            last_item_activity_at__lt=cutoff, user__telegram_id__isnull=False, user__is_active=True
+        )
+        return carts if include_reminded else carts.filter(reminder_sent_at__isnull=True)
+
+    def backfill_activity(self):
+        """
+        Carts filled before item activity was tracked get the time of their
+        latest item change, so they can be found as abandoned
+        """
+        latest = CartItem.objects.filter(cart_id=OuterRef('pk')).order_by().values('cart_id').annotate(
+            value=Max('updated_at')
+        ).values('value')
+        return self.filter(
+            Exists(CartItem.objects.filter(cart_id=OuterRef('pk'))), last_item_activity_at__isnull=True
+        ).update(last_item_activity_at=Subquery(latest))
+
+
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='carts', verbose_name="User")
+    # Last time an item was added or removed; null while the cart is empty
+    last_item_activity_at = models.DateTimeField(null=True, blank=True, db_index=True,
+                                                 verbose_name="Last Item Activity At")
+    reminder_sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Reminder Sent At")
 
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated At")
 
+    objects = CartQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Cart"
         verbose_name_plural = "Carts"
@@ -120,6 +188,15 @@ class Cart(models.Model):
     def __str__(self):
         return f"Cart for {self.user.username}"
 
+    @classmethod
+    def touch(cls, *cart_ids):
+        """Record item activity after an add or remove, in one UPDATE"""
+        has_items = Exists(CartItem.objects.filter(cart_id=OuterRef('pk')))
+        return cls.objects.filter(pk__in=cart_ids).update(
+            last_item_activity_at=Case(When(has_items, then=Value(timezone.now())), default=None),
+            reminder_sent_at=None,
+        )
+
     @property
     def total_amount(self) -> float:
         items = self.items.all()
@@ -149,3 +226,21 @@ class CartItem(models.Model):
     @property
     def total_price(self) -> Decimal:
         return self.product_color.price * self.quantity
+
+
+class StockReservation(models.Model):
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations', verbose_name="Cart")
+    product_color = models.ForeignKey(ProductColor, on_delete=models.CASCADE, related_name='reservations',
+                                      verbose_name="Product Color")
+    quantity = models.PositiveIntegerField(verbose_name="Quantity")
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Expires At")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
+
+    class Meta:
+        verbose_name = "Stock Reservation"
+        verbose_name_plural = "Stock Reservations"
+        db_table = 'stock_reservation'
+        ordering = ['expires_at']
+
+    def __str__(self):
+        return f"{self.product_color} x {self.quantity} until {self.expires_at}"
@@ -0,0 +1,139 @@
+"""
+Display order of categories (per parent) and color images (per color).
+
+Positions are spaced STEP apart, so moving a row between two neighbours
+writes only that row: it takes the midpoint of their positions. Only when
+two neighbours end up adjacent is their scope renumbered. New rows are
+appended by bumping a per-scope OrderingCounter with F(), which serialises
+concurrent inserts on the counter row and needs no MAX() over the table.
+"""
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .models import Category, OrderingCounter, ProductColorImage
+
+STEP = 1024
+
+# Model -> the field whose value groups rows into one ordering scope
+SCOPES = {
+    Category: 'parent_id',
+    ProductColorImage: 'color_id',
+}
+
+
+def scope_key(obj):
+    return f"{obj._meta.model_name}:{getattr(obj, SCOPES[type(obj)]) or 'root'}"
+
+
+def siblings(obj):
+    field = SCOPES[type(obj)]
+    return type(obj).objects.filter(**{field: getattr(obj, field)})
+
+
+def _seed(obj):
+    """Create the scope's counter from the rows already in it, once per scope"""
+    start = siblings(obj).aggregate(Max('order'))['order__max'] or 0
+    OrderingCounter.objects.get_or_create(scope=scope_key(obj), defaults={'value': start})
+
+
+def next_position(obj):
+    """Reserve the position after the last row of ``obj``'s scope"""
+    key = scope_key(obj)
+    with transaction.atomic():
+        if not OrderingCounter.objects.filter(scope=key).update(value=F('value') + STEP):
+            _seed(obj)
+            OrderingCounter.objects.filter(scope=key).update(value=F('value') + STEP)
+        return OrderingCounter.objects.filter(scope=key).values_list('value', flat=True).get()
+
+
+def _lock(obj):
+    """Lock the scope's counter row, so moves within one scope take turns"""
+    counter = OrderingCounter.objects.select_for_update().filter(scope=scope_key(obj))
+    if not list(counter):
+        _seed(obj)
+        list(counter)
+
+
+def raise_counters(rows):
+    """Keep counters at or above the positions just written, so appends stay last"""
+    top = {}
+    for row in rows:
+        key = scope_key(row)
+        top[key] = max(top.get(key, 0), row.order)
+    for key, value in top.items():
+        OrderingCounter.objects.filter(scope=key, value__lt=value).update(value=value)
+
+
+def rebalance(obj):
+    """Respace ``obj``'s scope STEP apart in its current display order"""
+    model = type(obj)
+    rows = list(siblings(obj).order_by(*model._meta.ordering).only('pk', 'order', SCOPES[model]))
+    now = timezone.now()
+    for position, row in enumerate(rows, start=1):
+        row.order, row.updated_at = position * STEP, now
+    model.objects.bulk_update(rows, ['order', 'updated_at'], batch_size=1000)
+    raise_counters(rows)
+    return len(rows)
+
+
+def _gap(obj, anchor, after):
+    """The (lower, upper) positions ``obj`` has to land between, upper None at the end"""
+    others = siblings(obj).exclude(pk=obj.pk)
+    at = others.filter(pk=anchor.pk).values_list('order', flat=True).get()
+    if others.filter(order=at).exclude(pk=anchor.pk).exists():
+        # Ties leave no room next to the anchor alone
+        return at, at
+    if after:
+        upper = others.filter(order__gt=at).order_by('order').values_list('order', flat=True).first()
+        return at, upper
+    lower = others.filter(order__lt=at).order_by('-order').values_list('order', flat=True).first()
+    return lower or 0, at
+
+
+@transaction.atomic
+def move(obj, before=None, after=None):
+    """Place ``obj`` right before or right after a sibling, writing one row in the common case"""
+    if (before is None) == (after is None):
+        raise ValueError('Give exactly one of before or after')
+    anchor = before or after
+    if type(anchor) is not type(obj) or scope_key(anchor) != scope_key(obj):
+        raise ValueError('Rows can only be moved among their siblings')
+    if anchor.pk == obj.pk:
+        return obj.order
+
+    _lock(obj)
+    lower, upper = _gap(obj, anchor, after is not None)
+    if upper is not None and upper - lower < 2:
+        rebalance(obj)
+        lower, upper = _gap(obj, anchor, after is not None)
+    position = next_position(obj) if upper is None else (lower + upper) // 2
+
+    type(obj).objects.filter(pk=obj.pk).update(order=position, updated_at=timezone.now())
+    obj.order = position
+    transaction.on_commit(bump_catalog_version)
+    return position
+
+
+@transaction.atomic
+def step(obj, direction):
+    """Swap places with the previous ('up') or next ('down') sibling; False at either end"""
+    if direction not in ('up', 'down'):
+        raise ValueError('direction must be up or down')
+    others = siblings(obj).exclude(pk=obj.pk)
+    if others.filter(order=obj.order).exists():
+        # Ties have no defined neighbour until the scope is respaced
+        rebalance(obj)
+        obj.refresh_from_db(fields=['order'])
+    if direction == 'up':
+        neighbour = others.filter(order__lt=obj.order).order_by('-order').first()
+    else:
+        neighbour = others.filter(order__gt=obj.order).order_by('order').first()
+    if neighbour is None:
+        return False
+    if direction == 'up':
+        move(obj, before=neighbour)
+    else:
+        move(obj, after=neighbour)
+    return True
@@ -0,0 +1,166 @@
+"""
+Product search over the translated name and description fields.
+
+On PostgreSQL queries run against a GIN-indexed ``tsvector`` expression,
+falling back to trigram similarity when nothing matches. Other backends
+use an in-process inverted index built from the active catalog and
+rebuilt whenever the catalog version changes.
+"""
+import logging
+import re
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from modeltranslation.utils import build_localized_fieldname
+
+from .cache import get_catalog_version
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+')
+NAME_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+
+
+def localized_fields(field):
+    return [build_localized_fieldname(field, code) for code, _ in settings.LANGUAGES]
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+# PostgreSQL
+
+def _concat_sql(fields):
+    return " || ' ' || ".join(f"coalesce({connection.ops.quote_name(f)}, '')" for f in fields)
+
+
+def _tsvector_sql():
+    return f"to_tsvector('simple', {_concat_sql(localized_fields('name') + localized_fields('description'))})"
+
+
+def _names_sql():
+    return f"({_concat_sql(localized_fields('name'))})"
+
+
+def create_search_indexes(using='default', **kwargs):
+    """Create the GIN indexes used by the PostgreSQL search path"""
+    from django.db import connections
+    conn = connections[using]
+    if conn.vendor != 'postgresql':
+        return
+    table = Product._meta.db_table
+    with conn.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS product_search_tsv ON {table} USING gin (({_tsvector_sql()}))")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS product_name_trgm ON {table} USING gin ({_names_sql()} gin_trgm_ops)")
+
+
+def _postgres_search(query, limit):
+    terms = tokenize(query)
+    if not terms:
+        return []
+    tsquery = ' & '.join(f"{term}:*" for term in terms)
+    queryset = Product.objects.filter(is_active=True)
+    ids = list(queryset.extra(
+        select={'rank': f"ts_rank({_tsvector_sql()}, to_tsquery('simple', %s))"},
+        select_params=[tsquery],
+        where=[f"{_tsvector_sql()} @@ to_tsquery('simple', %s)"],
+        params=[tsquery],
+        order_by=['-rank', '-id'],
+    ).values_list('id', flat=True)[:limit])
+    if ids:
+        return ids
+
+    text = ' '.join(terms)
+    return list(queryset.extra(
+        select={'similarity': f"similarity({_names_sql()}, %s)"},
+        select_params=[text],
+        where=[f"{_names_sql()} %% %s"],
+        params=[text],
+        order_by=['-similarity', '-id'],
+    ).values_list('id', flat=True)[:limit])
+
+
+# In-process inverted index
+
+class InvertedIndex:
+    def __init__(self, rows, name_fields, description_fields):
+        postings = defaultdict(lambda: defaultdict(int))
+        for row in rows:
+            product_id = row['id']
+            for field in name_fields:
+                for token in tokenize(row[field]):
+                    postings[token][product_id] += NAME_WEIGHT
+            for field in description_fields:
+                for token in tokenize(row[field]):
+                    postings[token][product_id] += DESCRIPTION_WEIGHT
+        self.postings = dict(postings)
+        self.tokens = sorted(self.postings)
+
+    def _matches(self, term):
+        """Scores for every product with a token starting with ``term``"""
+        scores = defaultdict(int)
+        position = bisect_left(self.tokens, term)
+        while position < len(self.tokens) and self.tokens[position].startswith(term):
+            for product_id, weight in self.postings[self.tokens[position]].items():
+                scores[product_id] += weight
+            position += 1
+        return scores
+
+    def search(self, query, limit):
+        result = None
+        for term in tokenize(query):
+            scores = self._matches(term)
+            if result is None:
+                result = scores
+            else:
+                result = {pid: score + scores[pid] for pid, score in result.items() if pid in scores}
+            if not result:
+                return []
+        if not result:
+            return []
+        ranked = sorted(result.items(), key=lambda item: (-item[1], -item[0]))
+        return [product_id for product_id, _ in ranked[:limit]]
+
+
+_index = None
+_index_version = None
+
+
+def get_index():
+    global _index, _index_version
+    version = get_catalog_version()
+    if _index is None or _index_version != version:
+        name_fields = localized_fields('name')
+        description_fields = localized_fields('description')
+        rows = Product.objects.filter(is_active=True).values('id', *name_fields, *description_fields)
+        _index = InvertedIndex(rows.iterator(chunk_size=2000), name_fields, description_fields)
+        _index_version = version
+    return _index
+
+
+def search_product_ids(query, limit=None):
+    limit = limit or settings.PRODUCT_SEARCH_LIMIT
+    started = time.perf_counter()
+    if connection.vendor == 'postgresql':
+        ids = _postgres_search(query, limit)
+    else:
+        ids = get_index().search(query, limit)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms > settings.PRODUCT_SEARCH_TARGET_MS:
+        logger.warning("Slow product search %r: %.1f ms", query, elapsed_ms)
+    return ids
+
+
+def search_products(query, limit=None, queryset=None):
+    """Matching products, best match first"""
+    ids = search_product_ids(query, limit)
+    queryset = Product.objects.all() if queryset is None else queryset
+    products = queryset.in_bulk(ids)
+    return [products[product_id] for product_id in ids if product_id in products]
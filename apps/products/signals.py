@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version
+from .inventory import stock_low
+from .models import Category, Product, ProductColor, ProductColorImage, Cart, CartItem
+
+CATALOG_MODELS = (Category, Product, ProductColor, ProductColorImage)
+
+
+def catalog_changed(sender, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(catalog_changed, sender=model, dispatch_uid=f'catalog_save_{model.__name__}')
+    post_delete.connect(catalog_changed, sender=model, dispatch_uid=f'catalog_delete_{model.__name__}')
+
+# Stock moves by UPDATE and bypasses post_save; only crossing the low-stock
+# threshold changes what the catalog shows
+stock_low.connect(catalog_changed, sender=ProductColor, dispatch_uid='catalog_stock_low')
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def product_categories_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(bump_catalog_version)
+
+
+@receiver(pre_delete, sender=ProductColor)
+def color_deleted(sender, instance, **kwargs):
+    # The cascade deletes cart items without going through the cart code;
+    # their carts are touched once the color is gone
+    cart_ids = list(CartItem.objects.filter(product_color=instance).values_list('cart_id', flat=True).distinct())
+    if cart_ids:
+        transaction.on_commit(lambda: Cart.touch(*cart_ids))
@@ -0,0 +1,104 @@
+"""
+Static catalog snapshot for the Telegram Mini App storefront.
+
+For the current catalog version this writes, under STOREFRONT_ROOT:
+
+    catalog/<version>/<language>.json   (+ .gz and, with Brotli, .br)
+    thumbs/<hash>.jpg                   one per source image, made once
+    index.html                          the storefront, pointing at the above
+
+Catalog files never change once written, so they can be cached forever;
+only index.html has to be revalidated. The storefront loads its language's
+file in one request and never calls the bot or the API while browsing.
+"""
+import gzip
+import hashlib
+import os
+import shutil
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.template.loader import render_to_string
+from django.utils import translation
+from PIL import Image
+
+from .cache import get_catalog_version
+from .storefront import build_catalog, encode
+
+try:
+    import brotli
+except ImportError:  # .br files are skipped without it
+    brotli = None
+
+
+def _write(path, data):
+    """Write through a temporary file, so readers never see a partial file"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'.{path.name}.tmp')
+    temporary.write_bytes(data)
+    os.replace(temporary, path)
+
+
+def write_compressed(path, data):
+    _write(path, data)
+    _write(path.with_name(path.name + '.gz'), gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write(path.with_name(path.name + '.br'), brotli.compress(data, quality=11))
+
+
+class Thumbnails:
+    """Maps image fields to thumbnail URLs, creating missing thumbnails"""
+
+    def __init__(self, root, size):
+        self.root = root
+        self.size = size
+        self.made = 0
+
+    def __call__(self, field):
+        if not field:
+            return None
+        digest = hashlib.sha1(f'{field.name}:{self.size}'.encode()).hexdigest()[:20]
+        name = f'thumbs/{digest}.jpg'
+        path = self.root / name
+        if not path.exists():
+            try:
+                with default_storage.open(field.name) as source, Image.open(source) as image:
+                    image.thumbnail((self.size, self.size))
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    image.convert('RGB').save(path, 'JPEG', quality=82, optimize=True, progressive=True)
+            except (OSError, ValueError):
+                # Missing or unreadable source: link the original instead
+                return field.url
+            self.made += 1
+        return settings.STOREFRONT_URL + name
+
+
+def _prune(catalog_root, keep):
+    """Drop all but the ``keep`` newest versions; clients on an older index.html may still load those"""
+    versions = sorted((p for p in catalog_root.iterdir() if p.is_dir() and p.name.isdigit()), key=lambda p: int(p.name))
+    for path in versions[:-keep]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def write_snapshot(root=None, keep=2):
+    """Write the snapshot of the current catalog version, returning what was written"""
+    root = Path(root or settings.STOREFRONT_ROOT)
+    version = get_catalog_version()
+    thumbnails = Thumbnails(root, settings.STOREFRONT_THUMBNAIL_SIZE)
+
+    files = {}
+    for language, _ in settings.LANGUAGES:
+        with translation.override(language):
+            catalog = build_catalog(image_url=thumbnails)
+        name = f'catalog/{version}/{language}.json'
+        write_compressed(root / name, encode({'version': version, 'language': language, **catalog}))
+        files[language] = settings.STOREFRONT_URL + name
+
+    index = render_to_string('storefront/index.html', {
+        'catalog_files': files,
+        'default_language': settings.LANGUAGE_CODE,
+    })
+    write_compressed(root / 'index.html', index.encode())
+    _prune(root / 'catalog', keep)
+    return {'version': version, 'files': files, 'thumbnails': thumbnails.made}
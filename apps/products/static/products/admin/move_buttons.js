@@ -0,0 +1,18 @@
+'use strict';
+// Up/down buttons of MoveButtons: post the CSRF token alone to the move
+// view, leaving the changelist or change form they sit in untouched.
+document.addEventListener('click', event => {
+  const button = event.target.closest('button[data-move-url]');
+  if (!button) {
+    return;
+  }
+  const form = document.createElement('form');
+  form.method = 'post';
+  form.action = button.dataset.moveUrl;
+  const token = document.querySelector('input[name="csrfmiddlewaretoken"]');
+  if (token) {
+    form.appendChild(token.cloneNode());
+  }
+  document.body.appendChild(form);
+  form.submit();
+});
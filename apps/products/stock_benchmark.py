@@ -0,0 +1,149 @@
+"""
+Stock concurrency benchmark.
+
+Many threads, each with its own database connection, place random
+multi-line orders against a handful of colors with little stock until
+everything is sold. Part of the orders go through checkout: the cart is
+reserved, then either committed or abandoned, and abandoned reservations
+are left for the next checkout or for expiry to release. Afterwards every
+color's sold quantity must equal its initial stock minus what is left,
+nothing may go below zero and nothing may stay reserved.
+
+The benchmark runs in a throwaway test database created for the run, so
+the real catalog is never touched.
+"""
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import OperationalError, connection, connections
+from django.db.models import F, Sum
+from django.test.utils import setup_databases, teardown_databases
+
+from apps.users.models import User
+
+from .inventory import OutOfStock, commit_cart, decrement_stock, expire_reservations, release_cart, reserve_cart
+from .models import Cart, CartItem, Product, ProductColor, StockReservation
+
+
+@contextmanager
+def throwaway_database():
+    """Point every connection at a fresh test database for the duration of the block"""
+    old_config = setup_databases(verbosity=0, interactive=False, aliases=set(connections), serialized_aliases=set())
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+
+def run_stock_benchmark(workers=64, colors=5, stock=500, max_lines=3, max_quantity=3, seed=42,
+                        checkout_share=0.5, abandon_share=0.2):
+    with throwaway_database():
+        return _run(workers, colors, stock, max_lines, max_quantity, seed, checkout_share, abandon_share)
+
+
+def _run(workers, colors, stock, max_lines, max_quantity, seed, checkout_share, abandon_share):
+    product = Product.objects.create(name='Stock benchmark', description='Stock benchmark')
+    color_ids = [
+        ProductColor.objects.create(product=product, name=f'Color {i}', price=Decimal('1000'), stock=stock).id
+        for i in range(colors)
+    ]
+    carts = [
+        Cart.objects.create(user=User.objects.create(username=f'stock-bench-{i}', telegram_id=i + 1)).id
+        for i in range(workers)
+    ]
+    sold = Counter()
+    totals = Counter()
+    lock = threading.Lock()
+    start = threading.Barrier(workers)
+
+    def checkout(cart_id, lines, rng, counts):
+        """Reserve the cart, then commit it or walk away"""
+        CartItem.objects.filter(cart_id=cart_id).delete()
+        CartItem.objects.bulk_create([
+            CartItem(cart_id=cart_id, product_color_id=color_id, quantity=quantity) for color_id, quantity in lines
+        ])
+        reserve_cart(Cart(id=cart_id))
+        counts['checkouts'] += 1
+        choice = rng.random()
+        if choice < abandon_share / 2:
+            release_cart(cart_id)
+            return 'abandoned'
+        if choice < abandon_share:
+            # Left for the next checkout of this cart or for expiry
+            return 'abandoned'
+        commit_cart(cart_id, lines)
+        return 'placed'
+
+    def order(index, lines, rng, counts):
+        """Place one order: 'placed', 'abandoned' or 'rejected'"""
+        try:
+            if rng.random() < checkout_share:
+                return checkout(carts[index], lines, rng, counts)
+            decrement_stock(lines)
+            return 'placed'
+        except OutOfStock:
+            return 'rejected'
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        counts = Counter()
+        start.wait()
+        try:
+            while True:
+                lines = [(color_id, rng.randint(1, max_quantity))
+                         for color_id in rng.sample(color_ids, rng.randint(1, max_lines))]
+                try:
+                    outcome = order(index, lines, rng, counts)
+                    counts[outcome] += 1
+                    # Units held by other carts may still come back
+                    if outcome == 'rejected' and not ProductColor.objects.filter(
+                        id__in=color_ids, stock__gt=F('reserved')
+                    ).exists():
+                        break
+                except OperationalError:
+                    # SQLite allows a single writer; retry when it is busy
+                    counts['retried'] += 1
+                    time.sleep(0.001)
+                    continue
+                if outcome == 'placed':
+                    with lock:
+                        for color_id, quantity in lines:
+                            sold[color_id] += quantity
+        finally:
+            with lock:
+                totals.update(counts)
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    # Whatever abandoned carts still hold runs out
+    StockReservation.objects.update(expires_at=F('created_at'))
+    expired = expire_reservations()
+    remaining = dict(ProductColor.objects.filter(id__in=color_ids).values_list('id', 'stock'))
+    still_reserved = ProductColor.objects.filter(id__in=color_ids).aggregate(total=Sum('reserved'))['total']
+    return {
+        'workers': workers,
+        'colors': colors,
+        'initial_stock': stock,
+        'orders_placed': totals['placed'],
+        'orders_rejected': totals['rejected'],
+        'checkouts': totals['checkouts'],
+        'checkouts_abandoned': totals['abandoned'],
+        'reservations_expired': expired,
+        'retries': totals['retried'],
+        'seconds': round(elapsed, 3),
+        'orders_per_second': round(totals['placed'] / elapsed, 1),
+        'units_sold': sum(sold.values()),
+        'oversold': any(sold[pk] > stock or remaining[pk] < 0 for pk in color_ids),
+        'consistent': all(stock - remaining[pk] == sold[pk] for pk in color_ids) and not still_reserved,
+    }
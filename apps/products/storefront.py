@@ -0,0 +1,182 @@
+"""
+Denormalized read model of the active catalog for public clients.
+
+Each document (the category tree, one category with its products, one
+product with its colors and images) is built per language from a few
+queries and stored as encoded JSON in the ``catalog`` cache under the
+catalog version. Readers are served the stored bytes as they are; an edit
+bumps the version, so the next read builds fresh documents and the old
+ones simply expire. Missing or inactive ids are stored too, so probing
+random ids does not reach the database either.
+"""
+from django.core.cache import caches
+from django.db.models import Exists, Min, OuterRef, Prefetch, Q
+from django.utils import translation
+
+from apps.api.renderers import ORJSONRenderer
+
+from .cache import get_catalog_version
+from .models import Category, Product, ProductColor, ProductColorImage
+
+# Stored for ids that have no document
+MISSING = b''
+
+
+def _media(field):
+    return field.url if field else None
+
+
+def build_categories(image_url=_media):
+    """Active categories as a tree; children of inactive categories are left out"""
+    categories = list(Category.objects.filter(is_active=True).order_by('order', 'name'))
+    children = {}
+    for category in categories:
+        children.setdefault(category.parent_id, []).append(category)
+
+    def node(category):
+        return {
+            'id': category.id,
+            'name': category.name,
+            'image': image_url(category.category_image),
+            'children': [node(child) for child in children.get(category.id, ())],
+        }
+
+    return [node(category) for category in children.get(None, ())]
+
+
+def _product_summaries(products):
+    # Products without an active color cannot be ordered
+    products = products.filter(
+        Exists(ProductColor.objects.filter(product=OuterRef('pk'), is_active=True)), is_active=True
+    ).annotate(price_from=Min('colors__price', filter=Q(colors__is_active=True)))
+    return [
+        {
+            'id': product.id,
+            'name': product.name,
+            'image': _media(product.product_image),
+            'price_from': product.price_from,
+        }
+        for product in products.order_by('-created_at')
+    ]
+
+
+def build_category(category_id):
+    category = Category.objects.filter(pk=category_id, is_active=True).first()
+    if category is None:
+        return None
+    return {
+        'id': category.id,
+        'name': category.name,
+        'image': _media(category.category_image),
+        'parent': category.parent_id,
+        'subcategories': [
+            {'id': child.id, 'name': child.name, 'image': _media(child.category_image)}
+            for child in category.subcategories.filter(is_active=True).order_by('order', 'name')
+        ],
+        'products': _product_summaries(category.products.all()),
+    }
+
+
+def build_product(product_id):
+    colors = ProductColor.objects.filter(is_active=True).order_by('price', 'id').prefetch_related(
+        Prefetch('images', queryset=ProductColorImage.objects.order_by('order', 'id'))
+    )
+    product = Product.objects.filter(pk=product_id, is_active=True).prefetch_related(
+        Prefetch('colors', queryset=colors),
+        Prefetch('categories', queryset=Category.objects.filter(is_active=True).only('id')),
+    ).first()
+    if product is None:
+        return None
+    return {
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'image': _media(product.product_image),
+        'categories': [category.id for category in product.categories.all()],
+        'colors': [
+            {
+                'id': color.id,
+                'name': color.name,
+                'price': color.price,
+                'images': [_media(image.image) for image in color.images.all()],
+            }
+            for color in product.colors.all()
+        ],
+    }
+
+
+def build_catalog(image_url=_media):
+    """
+    Every orderable product with its colors, and the category tree with the
+    product ids in each category, as one document. ``image_url`` maps an
+    image field to the URL to publish, e.g. a thumbnail.
+    """
+    colors = ProductColor.objects.filter(is_active=True).order_by('price', 'id').prefetch_related(
+        Prefetch('images', queryset=ProductColorImage.objects.order_by('order', 'id'))
+    )
+    products = Product.objects.filter(
+        Exists(ProductColor.objects.filter(product=OuterRef('pk'), is_active=True)), is_active=True
+    ).order_by('-created_at').prefetch_related(Prefetch('colors', queryset=colors))
+
+    documents = []
+    for product in products:
+        colors = [
+            {
+                'id': color.id,
+                'name': color.name,
+                'price': color.price,
+                'images': [image_url(image.image) for image in color.images.all()],
+            }
+            for color in product.colors.all()
+        ]
+        documents.append({
+            'id': product.id,
+            'name': product.name,
+            'description': product.description,
+            'image': image_url(product.product_image),
+            'price_from': min(color['price'] for color in colors),
+            'colors': colors,
+        })
+
+    listed = {}
+    memberships = Product.categories.through.objects.filter(
+        product_id__in=[product['id'] for product in documents]
+    ).order_by('-product__created_at').values_list('category_id', 'product_id')
+    for category_id, product_id in memberships:
+        listed.setdefault(category_id, []).append(product_id)
+
+    def with_products(node):
+        node['products'] = listed.get(node['id'], [])
+        for child in node['children']:
+            with_products(child)
+        return node
+
+    return {
+        'categories': [with_products(node) for node in build_categories(image_url)],
+        'products': documents,
+    }
+
+
+BUILDERS = {
+    'categories': build_categories,
+    'category': build_category,
+    'product': build_product,
+}
+
+
+def encode(document):
+    # The API's renderer, so prices are JSON numbers here as well
+    return ORJSONRenderer().render(document)
+
+
+def document(kind, language, pk=None):
+    """The encoded document for the current catalog version, or None when it does not exist"""
+    store = caches['catalog']
+    key = f'storefront:{get_catalog_version()}:{language}:{kind}:{pk or ""}'
+    data = store.get(key)
+    if data is None:
+        with translation.override(language):
+            built = BUILDERS[kind](pk) if pk is not None else BUILDERS[kind]()
+        data = MISSING if built is None else encode(built)
+        store.set(key, data)
+    return data or None
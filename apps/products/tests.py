@@ -1,3 +1,311 @@
-from django.test import TestCase
+import io
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.db.models import F
+from django.forms import modelform_factory
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.users.models import User
+
+from . import ordering
+from .admin import ProductColorForm
+from .catalog_io import import_catalog, stream_export
+from .inventory import OutOfStock, commit_cart, decrement_stock, expire_reservations, reserve_cart, stock_low
+from .models import Cart, CartItem, Category, OrderingCounter, Product, ProductColor, StockReservation
+
+# The suite runs without Redis; version keys live in memory
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'products-tests'},
+    'catalog': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'products-tests-catalog'},
+}
+
+
+class StockTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        product = Product.objects.create(name='Shirt', description='Shirt')
+        cls.red = ProductColor.objects.create(product=product, name='Red', price=Decimal('1000'), stock=10)
+        cls.blue = ProductColor.objects.create(product=product, name='Blue', price=Decimal('2000'), stock=2)
+        cls.white = ProductColor.objects.create(product=product, name='White', price=Decimal('500'))
+        cls.cart = Cart.objects.create(user=User.objects.create(username='buyer', telegram_id=1))
+
+    def fill_cart(self, *lines):
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product_color=color, quantity=quantity) for color, quantity in lines
+        ])
+        return [(color.id, quantity) for color, quantity in lines]
+
+    def assertStock(self, color, stock, reserved):
+        color.refresh_from_db()
+        self.assertEqual((color.stock, color.reserved), (stock, reserved))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, LOW_STOCK_THRESHOLD=5)
+class InventoryTests(StockTestCase):
+    def test_decrement_is_all_or_nothing(self):
+        with self.assertRaises(OutOfStock) as raised:
+            decrement_stock([(self.red.id, 3), (self.blue.id, 3)])
+        self.assertEqual(raised.exception.color_ids, {self.blue.id})
+        self.assertStock(self.red, 10, 0)
+        self.assertStock(self.blue, 2, 0)
+
+    def test_decrement_sums_lines_and_skips_untracked(self):
+        decrement_stock([(self.red.id, 2), (self.red.id, 3), (self.white.id, 100)])
+        self.assertStock(self.red, 5, 0)
+        self.assertStock(self.white, None, 0)
+
+    def test_reserve_cart_holds_units(self):
+        self.fill_cart((self.red, 4), (self.white, 1))
+        reserve_cart(self.cart)
+        self.assertStock(self.red, 10, 4)
+        self.assertEqual(list(StockReservation.objects.values_list('product_color_id', 'quantity')),
+                         [(self.red.id, 4)])
+        # Other buyers only get what is not held
+        with self.assertRaises(OutOfStock):
+            decrement_stock([(self.red.id, 7)])
+
+    def test_reserve_cart_again_replaces_reservation(self):
+        self.fill_cart((self.red, 4))
+        reserve_cart(self.cart)
+        reserve_cart(self.cart)
+        self.assertStock(self.red, 10, 4)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_reserve_cart_short_holds_nothing(self):
+        self.fill_cart((self.red, 4), (self.blue, 3))
+        with self.assertRaises(OutOfStock):
+            reserve_cart(self.cart)
+        self.assertStock(self.red, 10, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_commit_cart_turns_reservation_into_sale(self):
+        lines = self.fill_cart((self.red, 4), (self.blue, 2))
+        reserve_cart(self.cart)
+        commit_cart(self.cart.id, lines)
+        self.assertStock(self.red, 6, 0)
+        self.assertStock(self.blue, 0, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_commit_cart_short_keeps_reservation(self):
+        lines = self.fill_cart((self.blue, 2))
+        reserve_cart(self.cart)
+        with self.assertRaises(OutOfStock):
+            commit_cart(self.cart.id, lines + [(self.red.id, 11)])
+        self.assertStock(self.blue, 2, 2)
+        self.assertTrue(StockReservation.objects.exists())
+
+    def test_expire_reservations_releases_only_expired(self):
+        self.fill_cart((self.red, 4), (self.blue, 1))
+        reserve_cart(self.cart)
+        StockReservation.objects.filter(product_color=self.red).update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+        self.assertEqual(expire_reservations(batch_size=1), 1)
+        self.assertStock(self.red, 10, 0)
+        self.assertStock(self.blue, 2, 1)
+
+    def test_stock_low_sent_when_threshold_crossed(self):
+        received = []
+        stock_low.connect(lambda sender, color_ids, **kwargs: received.append(color_ids), weak=False,
+                          dispatch_uid='products-tests')
+        self.addCleanup(stock_low.disconnect, dispatch_uid='products-tests')
+        with self.captureOnCommitCallbacks(execute=True):
+            decrement_stock([(self.red.id, 4)])
+        with self.captureOnCommitCallbacks(execute=True):
+            decrement_stock([(self.red.id, 1)])
+        with self.captureOnCommitCallbacks(execute=True):
+            decrement_stock([(self.red.id, 1)])
+        self.assertEqual(received, [{self.red.id}])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductColorFormTests(StockTestCase):
+    Form = modelform_factory(ProductColor, form=ProductColorForm, fields=['product', 'name', 'price', 'stock'])
+
+    def form(self, color, stock):
+        data = {'product': color.product_id, 'name': color.name, 'price': color.price, 'stock': stock}
+        return self.Form(data, instance=color)
+
+    def test_stock_below_reserved_is_rejected(self):
+        self.fill_cart((self.red, 4))
+        reserve_cart(self.cart)
+        # The form was opened before the checkout reserved the units
+        form = self.form(ProductColor(pk=self.red.pk, product_id=self.red.product_id, name='Red', stock=10), 3)
+        self.assertFalse(form.is_valid())
+        self.assertIn('stock', form.errors)
+
+    def test_stock_covering_reserved_is_accepted(self):
+        self.fill_cart((self.red, 4))
+        reserve_cart(self.cart)
+        self.assertTrue(self.form(self.red, 4).is_valid())
+        self.assertTrue(self.form(self.white, '').is_valid())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogIOTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        furniture = Category.objects.create(name='Mebel')
+        cls.sofas = Category.objects.create(name='Divanlar', parent=furniture)
+        cls.product = Product.objects.create(name_uz='Divan', name_ru='Диван', description='Yumshoq')
+        cls.product.categories.add(cls.sofas)
+        cls.grey = ProductColor.objects.create(product=cls.product, name_uz='Kulrang', name_ru='Серый',
+                                               price=Decimal('1500000.00'))
+        cls.green = ProductColor.objects.create(product=cls.product, name_uz='Yashil', name_ru='Зелёный', price=Decimal('1600000.00'),
+                                                is_active=False)
+
+    def export(self, file_format):
+        return ''.join(stream_export(file_format))
+
+    def snapshot(self):
+        return (
+            list(Product.objects.values_list('id', 'name_uz', 'name_ru', 'description', 'is_active')),
+            list(ProductColor.objects.order_by('id').values_list('id', 'name_uz', 'name_ru', 'price', 'is_active')),
+            list(Product.categories.through.objects.values_list('product_id', 'category_id')),
+        )
+
+    def test_roundtrip(self):
+        for file_format in ('csv', 'jsonl'):
+            with self.subTest(file_format=file_format):
+                exported = self.export(file_format)
+                before = self.snapshot()
+                Product.objects.update(name_uz='Stul', is_active=False)
+                ProductColor.objects.update(price=Decimal('1'))
+                self.product.categories.clear()
+
+                stats = import_catalog(io.StringIO(exported), file_format)
+                self.assertEqual(self.snapshot(), before)
+                self.assertEqual((stats['rows'], stats['rows_skipped'], stats['errors']), (2, 0, []))
+                self.assertEqual(stats['colors_updated'], 2)
+                self.assertEqual(self.export(file_format), exported)
+
+    def test_new_rows_create_products_and_categories(self):
+        data = ('product_name_uz,categories,color_name_uz,price\n'
+                'Kreslo,Mebel > Kreslolar,Qora,900000\n'
+                'Kreslo,Mebel > Kreslolar,Oq,950000\n')
+        stats = import_catalog(io.StringIO(data))
+        self.assertEqual((stats['products_created'], stats['colors_created']), (1, 2))
+        product = Product.objects.get(name_uz='Kreslo')
+        self.assertEqual([c.full_path for c in product.categories.all()], ['Mebel > Kreslolar'])
+        self.assertEqual(sorted(product.colors.values_list('price', flat=True)),
+                         [Decimal('900000'), Decimal('950000')])
+
+    def test_bad_rows_are_skipped_and_reported(self):
+        data = ('product_id,color_id,price\n'
+                f',{self.grey.id},1700000\n'
+                f',{self.green.id},cheap\n'
+                ',999999,100\n'
+                '888888,,\n'
+                f'x,{self.grey.id},100\n')
+        stats = import_catalog(io.StringIO(data))
+        self.assertEqual((stats['rows'], stats['rows_skipped'], stats['colors_updated']), (1, 4, 1))
+        self.assertEqual([error['line'] for error in stats['errors']], [3, 6, 4, 5])
+        self.assertIn('color_id: no color 999999', [error['error'] for error in stats['errors']])
+        self.assertIn('product_id: no product 888888', [error['error'] for error in stats['errors']])
+        self.grey.refresh_from_db()
+        self.green.refresh_from_db()
+        self.assertEqual((self.grey.price, self.green.price), (Decimal('1700000'), Decimal('1600000')))
+
+    def test_invalid_json_line_is_reported(self):
+        data = f'{{"color_id": {self.grey.id}, "price": "10"}}\n{{"color_id": \n'
+        stats = import_catalog(io.StringIO(data), 'jsonl')
+        self.assertEqual((stats['rows'], stats['rows_skipped']), (1, 1))
+        self.assertEqual(stats['errors'][0]['line'], 2)
+        self.assertTrue(stats['errors'][0]['error'].startswith('invalid JSON'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogBulkActionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Mebel')
+        cls.product = Product.objects.create(name='Divan')
+        cls.product.categories.add(cls.category)
+        cls.color = ProductColor.objects.create(product=cls.product, name='Kulrang', price=Decimal('1000'))
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def test_change_prices_from_every_changelist(self):
+        self.client.force_login(self.admin)
+        for model, pk in ((Category, self.category.pk), (Product, self.product.pk), (ProductColor, self.color.pk)):
+            with self.subTest(model=model.__name__):
+                url = reverse(f'admin:products_{model._meta.model_name}_changelist')
+                response = self.client.post(url, {'action': 'change_prices', '_selected_action': [pk],
+                                                  'percent': '10'})
+                self.assertEqual(response.status_code, 302)
+        self.color.refresh_from_db()
+        self.assertEqual(self.color.price, Decimal('1331.00'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OrderingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent = Category.objects.create(name='Mebel')
+        cls.rows = [Category.objects.create(name=f'Child {i}', parent=cls.parent) for i in range(4)]
+
+    def names(self):
+        return list(Category.objects.filter(parent=self.parent).order_by('order', 'name').values_list('name', flat=True))
+
+    def test_new_rows_are_appended_step_apart(self):
+        self.assertEqual([row.order for row in self.rows], [ordering.STEP * i for i in range(1, 5)])
+        # A scope whose rows predate its counter continues after them
+        Category.objects.filter(parent=self.parent).update(order=F('order') * 10)
+        OrderingCounter.objects.filter(scope=ordering.scope_key(self.rows[0])).delete()
+        self.assertEqual(Category.objects.create(name='Child 4', parent=self.parent).order, ordering.STEP * 41)
+
+    def test_move_writes_the_midpoint(self):
+        first, second, third, fourth = self.rows
+        self.assertEqual(ordering.move(fourth, after=first), ordering.STEP * 3 // 2)
+        self.assertEqual(self.names(), ['Child 0', 'Child 3', 'Child 1', 'Child 2'])
+        ordering.move(first, after=third)
+        self.assertEqual(self.names(), ['Child 3', 'Child 1', 'Child 2', 'Child 0'])
+
+    def test_repeated_moves_into_one_gap_rebalance(self):
+        first, second = self.rows[:2]
+        # Each move halves the gap after ``first`` until there is no room left
+        with mock.patch.object(ordering, 'rebalance', wraps=ordering.rebalance) as rebalance:
+            for i in range(12):
+                row = Category.objects.create(name=f'Moved {i:02}', parent=self.parent)
+                ordering.move(row, after=first)
+        self.assertEqual(rebalance.call_count, 1)
+        orders = list(Category.objects.filter(parent=self.parent).order_by('order').values_list('order', flat=True))
+        self.assertEqual(len(set(orders)), len(orders))
+        self.assertEqual(self.names()[:3], ['Child 0', 'Moved 11', 'Moved 10'])
+        self.assertEqual(self.names()[-3:], ['Child 1', 'Child 2', 'Child 3'])
+        # Appends still land after everything that was respaced
+        self.assertGreater(Category.objects.create(name='Last', parent=self.parent).order, max(orders))
+
+    def test_move_among_siblings_only(self):
+        other = Category.objects.create(name='Other')
+        with self.assertRaises(ValueError):
+            ordering.move(self.rows[0], after=other)
+        with self.assertRaises(ValueError):
+            ordering.move(self.rows[0])
+
+    def test_step(self):
+        first, second = self.rows[:2]
+        self.assertFalse(ordering.step(first, 'up'))
+        self.assertTrue(ordering.step(first, 'down'))
+        self.assertEqual(self.names()[:2], ['Child 1', 'Child 0'])
+        # Ties are respaced before stepping
+        Category.objects.filter(parent=self.parent).update(order=5)
+        second.refresh_from_db()
+        self.assertTrue(ordering.step(second, 'down'))
+        self.assertEqual(len(set(Category.objects.filter(parent=self.parent).values_list('order', flat=True))), 4)
+
+    def test_move_buttons_post_on_their_own(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:products_category_changelist'))
+        self.assertContains(response, 'type="button" data-move-url=')
+        self.assertNotContains(response, 'formaction=')
+        self.assertContains(response, 'products/admin/move_buttons.js')
+
+        url = reverse('admin:products_category_move', args=[self.rows[1].pk, 'up'])
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertEqual(self.client.post(url).status_code, 302)
+        self.assertEqual(self.names(), ['Child 1', 'Child 0', 'Child 2', 'Child 3'])
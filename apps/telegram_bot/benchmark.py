@@ -0,0 +1,289 @@
+"""
+Dispatcher load test.
+
+Builds the production Dispatcher from TelegramBot, points the Bot at a local
+aiohttp stub of the Bot API that records every call, and replays a full
+shopping flow (/start, registration, browsing, add to cart, cart, checkout)
+for many synthetic users concurrently. Reports throughput, latency
+percentiles and database queries per update.
+
+A report is compared with the committed baseline for the same run profile
+(users, concurrency, rounds, flood control, storage): a step regresses when
+it runs more queries per update than the baseline, or when its p95 exceeds
+the baseline's by more than the tolerance factor plus the slack, and the
+run regresses when throughput falls below the baseline divided by the
+tolerance.
+
+The benchmark runs in a throwaway test database seeded with a catalog of
+its own, so checkouts never reserve or sell real stock and the orders it
+places never reach the real analytics.
+"""
+import asyncio
+import itertools
+import json
+import statistics
+import time
+from collections import Counter, defaultdict
+from decimal import Decimal
+from pathlib import Path
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Update
+from aiohttp import web
+from asgiref.sync import sync_to_async
+
+from apps.monitoring.queries import count_queries
+from apps.orders.models import Order
+from apps.products.models import Category, Product, ProductColor
+from apps.products.stock_benchmark import throwaway_database
+
+# Synthetic users get Telegram ids from here up
+BENCH_USER_ID_BASE = 9_000_000_000
+
+# Seeded catalog: root categories, products in the first one, colors per product
+BENCH_CATEGORIES = 10
+BENCH_PRODUCTS = 20
+BENCH_COLORS = 3
+
+BASELINE_PATH = Path(__file__).with_name('benchmark_baseline.json')
+# Mean queries per update may drift this much with cache warm-up order
+QUERY_SLACK = 0.5
+
+
+class StubBotAPI:
+    """Minimal Bot API server answering every method successfully"""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.message_ids = itertools.count(1)
+        self.runner = None
+        self.url = None
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        self.calls[method] += 1
+        payload = await request.post()
+        if method.startswith('send') or method.startswith('edit'):
+            chat_id = int(payload.get('chat_id') or 0)
+            result = {
+                'message_id': next(self.message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': payload.get('text', ''),
+            }
+        elif method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}'
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class UpdateFactory:
+    def __init__(self):
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+
+    def _user(self, user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': 'Bench', 'language_code': 'uz'}
+
+    def _message(self, user_id, **fields):
+        return {
+            'message_id': next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self._user(user_id),
+            **fields,
+        }
+
+    def message(self, user_id, text):
+        return {'update_id': next(self.update_ids), 'message': self._message(user_id, text=text)}
+
+    def contact(self, user_id, phone_number):
+        contact = {'phone_number': phone_number, 'first_name': 'Bench', 'user_id': user_id}
+        return {'update_id': next(self.update_ids), 'message': self._message(user_id, contact=contact)}
+
+    def callback(self, user_id, data):
+        return {
+            'update_id': next(self.update_ids),
+            'callback_query': {
+                'id': str(next(self.update_ids)),
+                'from': self._user(user_id),
+                'chat_instance': str(user_id),
+                'message': self._message(user_id, text='...'),
+                'data': data,
+            },
+        }
+
+
+@sync_to_async
+def seed_catalog(orders):
+    """
+    Create the catalog the flows shop in and return the (category, product,
+    color) they order, with stock for ``orders`` units
+    """
+    categories = Category.objects.bulk_create([
+        Category(name=f'Bench category {i}', order=i + 1) for i in range(BENCH_CATEGORIES)
+    ])
+    products = Product.objects.bulk_create([
+        Product(name=f'Bench product {i}', description='Bench') for i in range(BENCH_PRODUCTS)
+    ])
+    categories[0].products.set(products)
+    colors = ProductColor.objects.bulk_create([
+        ProductColor(product=product, name=f'Color {i}', price=Decimal('10000'), stock=orders)
+        for product in products for i in range(BENCH_COLORS)
+    ])
+    return categories[0].id, products[0].id, colors[0].id
+
+
+def shopping_flow(factory, user_id, catalog):
+    category_id, product_id, color_id = catalog
+    return [
+        ('start', factory.message(user_id, '/start')),
+        ('language', factory.callback(user_id, 'lang_uz')),
+        ('name', factory.message(user_id, 'Bench')),
+        ('phone', factory.contact(user_id, '+998901234567')),
+        ('categories', factory.message(user_id, '🛍 Mahsulotlar')),
+        ('category', factory.callback(user_id, f'category_{category_id}')),
+        ('product', factory.callback(user_id, f'product_{product_id}')),
+        ('add_to_cart', factory.callback(user_id, f'add_to_cart_{color_id}')),
+        ('cart', factory.message(user_id, '🛒 Savatcha')),
+        ('start_order', factory.callback(user_id, 'start_order')),
+        ('address', factory.message(user_id, 'Toshkent, Bench ko\'chasi 1')),
+        ('confirm_order', factory.callback(user_id, 'confirm_order')),
+    ]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def run_benchmark(users=200, concurrency=50, rounds=1, flood_control=False, memory_storage=True):
+    """Replay ``rounds`` shopping flows for each of ``users`` and return the report"""
+    with throwaway_database():
+        return asyncio.run(_run(users, concurrency, rounds, flood_control, memory_storage))
+
+
+async def _run(users, concurrency, rounds, flood_control, memory_storage):
+    from apps.telegram_bot.bot import TelegramBot
+
+    catalog = await seed_catalog(users * rounds)
+    stub = StubBotAPI()
+    await stub.start()
+    session = AiohttpSession(api=TelegramAPIServer.from_base(stub.url))
+    telegram_bot = TelegramBot(
+        session=session,
+        storage=MemoryStorage() if memory_storage else None,
+        flood_control=flood_control,
+        # Like flood control, deduplication needs Redis
+        deduplicate=flood_control,
+    )
+    bot, dp = telegram_bot.bot, telegram_bot.dp
+
+    factory = UpdateFactory()
+    latencies = defaultdict(list)
+    queries = defaultdict(list)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def simulate(user_id):
+        async with semaphore:
+            for _ in range(rounds):
+                for step, payload in shopping_flow(factory, user_id, catalog):
+                    update = Update.model_validate(payload, context={'bot': bot})
+                    started = time.perf_counter()
+                    with count_queries() as profile:
+                        await dp.feed_update(bot, update)
+                    latencies[step].append(time.perf_counter() - started)
+                    queries[step].append(profile.count)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(simulate(BENCH_USER_ID_BASE + i) for i in range(users)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await session.close()
+        await stub.stop()
+    orders_placed = await Order.objects.acount()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    all_queries = [value for values in queries.values() for value in values]
+    return {
+        'profile': profile_name(users, concurrency, rounds, flood_control, memory_storage),
+        'users': users,
+        'concurrency': concurrency,
+        'updates': len(all_latencies),
+        'seconds': round(elapsed, 3),
+        'updates_per_second': round(len(all_latencies) / elapsed, 1),
+        'latency_ms': {
+            'p50': round(percentile(all_latencies, 0.5) * 1000, 2),
+            'p95': round(percentile(all_latencies, 0.95) * 1000, 2),
+            'p99': round(percentile(all_latencies, 0.99) * 1000, 2),
+        },
+        'queries_per_update': round(statistics.mean(all_queries), 2),
+        'orders_placed': orders_placed,
+        'steps': {
+            step: {
+                'p95_ms': round(percentile(latencies[step], 0.95) * 1000, 2),
+                'queries': round(statistics.mean(queries[step]), 2),
+            }
+            for step in latencies
+        },
+        'api_calls': dict(stub.calls),
+    }
+
+
+def profile_name(users, concurrency, rounds, flood_control, memory_storage):
+    return (f"users={users},concurrency={concurrency},rounds={rounds},"
+            f"flood_control={int(flood_control)},memory_storage={int(memory_storage)}")
+
+
+def load_baseline(profile, path=BASELINE_PATH):
+    """The baseline report recorded for ``profile``, or None"""
+    if not Path(path).exists():
+        return None
+    return json.loads(Path(path).read_text()).get(profile)
+
+
+def save_baseline(report, path=BASELINE_PATH):
+    """Record ``report`` as the baseline of its profile, keeping the others"""
+    path = Path(path)
+    baselines = json.loads(path.read_text()) if path.exists() else {}
+    baselines[report['profile']] = report
+    path.write_text(json.dumps(baselines, indent=2, ensure_ascii=False, sort_keys=True) + '\n')
+
+
+def regressions(report, baseline, tolerance=1.5, slack_ms=20.0):
+    """Human-readable regressions of ``report`` against ``baseline``; empty when none"""
+    found = []
+    for step, result in report['steps'].items():
+        expected = baseline['steps'].get(step)
+        if expected is None:
+            continue
+        if result['queries'] > expected['queries'] + QUERY_SLACK:
+            found.append(f"{step}: {result['queries']} queries per update vs baseline {expected['queries']}")
+        if result['p95_ms'] > expected['p95_ms'] * tolerance + slack_ms:
+            found.append(f"{step}: p95 {result['p95_ms']} ms vs baseline {expected['p95_ms']} ms")
+    if report['updates_per_second'] < baseline['updates_per_second'] / tolerance:
+        found.append(
+            f"throughput: {report['updates_per_second']} updates/s vs baseline {baseline['updates_per_second']}"
+        )
+    return found
+
+
+def format_report(report):
+    return json.dumps(report, indent=2, ensure_ascii=False)
@@ -3,14 +3,25 @@ import logging
 import os
 import django
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.redis import RedisStorage
+from asgiref.sync import sync_to_async
+from prometheus_client import start_http_server
+from redis.asyncio import Redis
 from django.conf import settings
 
 # Django setup
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'telegram_shop.settings')
 django.setup()
 
-from apps.telegram_bot.handlers import start, products, cart
+from apps.telegram_bot.handlers import start, products, cart, search, webapp
+from apps.telegram_bot.middlewares import (
+    DeduplicationMiddleware, ReplicaPinningMiddleware, ThrottlingMiddleware, HandlerMetricsMiddleware
+)
+from apps.telegram_bot.inline import inline_results
+from apps.telegram_bot.storage import build_fsm_storage
+from apps.telegram_bot.scheduler import SendScheduler, PooledAiohttpSession
+from apps.telegram_bot.sharding import ShardWorker
+from apps.telegram_bot.reminders import remind_periodically
+from apps.products.inventory import expire_reservations
 
 # Configure logging
 logging.basicConfig(
@@ -21,18 +32,76 @@ logger = logging.getLogger(__name__)
 
 
 class TelegramBot:
-    def __init__(self):
+    def __init__(self, session=None, storage=None, flood_control=True, deduplicate=True):
+        """
+        ``session`` and ``storage`` default to the production ones; the
+        benchmark passes a stub API session and may turn off flood control
+        (send scheduling and per-user throttling) and update deduplication.
+        """
         # Initialize bot and dispatcher
-        self.bot = Bot(token=settings.BOT_TOKEN)
+        self.bot = Bot(token=settings.BOT_TOKEN, session=session or PooledAiohttpSession())
+        self.scheduler = SendScheduler() if flood_control else None
+        if self.scheduler:
+            self.bot.session.middleware(self.scheduler)
 
         # Redis storage for FSM
-        storage = RedisStorage.from_url(settings.REDIS_URL)
-        self.dp = Dispatcher(storage=storage)
+        self.dp = Dispatcher(storage=storage or build_fsm_storage())
+        # Redelivered updates are dropped before anything else runs
+        if deduplicate:
+            self.dp.update.outer_middleware(DeduplicationMiddleware(Redis.from_url(settings.REDIS_URL)))
+        self.dp.update.outer_middleware(ReplicaPinningMiddleware())
+
+        # Flood control runs before filters so dropped updates cost one Redis call
+        if flood_control:
+            throttling = ThrottlingMiddleware(Redis.from_url(settings.REDIS_URL))
+            self.dp.message.outer_middleware(throttling)
+            self.dp.callback_query.outer_middleware(throttling)
+
+        handler_metrics = HandlerMetricsMiddleware()
+        self.dp.message.middleware(handler_metrics)
+        self.dp.callback_query.middleware(handler_metrics)
+        self.dp.inline_query.middleware(handler_metrics)
 
         # Include routers
         self.dp.include_router(start.router)
         self.dp.include_router(products.router)
         self.dp.include_router(cart.router)
+        self.dp.include_router(webapp.router)
+        # Catch-all text search goes last
+        self.dp.include_router(search.router)
+
+        self.dp.startup.register(self.on_startup)
+        self.dp.shutdown.register(self.on_shutdown)
+        self.expiry_task = None
+        self.reminder_task = None
+
+    async def on_startup(self):
+        """Build the inline result cache and expose metrics before the first update"""
+        if settings.BOT_METRICS_PORT:
+            start_http_server(settings.BOT_METRICS_PORT)
+        await sync_to_async(inline_results.warm)()
+        self.expiry_task = asyncio.create_task(self.expire_reservations())
+        # Reminders go out at broadcast priority through this bot's scheduler
+        if self.scheduler and settings.ABANDONED_CART_INTERVAL:
+            self.reminder_task = asyncio.create_task(
+                remind_periodically(self.bot, Redis.from_url(settings.REDIS_URL))
+            )
+
+    async def on_shutdown(self):
+        for task in (self.expiry_task, self.reminder_task):
+            if task:
+                task.cancel()
+        if self.scheduler:
+            await self.scheduler.close()
+
+    async def expire_reservations(self, interval=60):
+        """Give back stock held by checkouts that were never completed"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await sync_to_async(expire_reservations)()
+            except Exception:
+                logger.exception("Expiring stock reservations failed")
 
     async def start_polling(self):
         """Start bot polling"""
@@ -45,11 +114,26 @@ class TelegramBot:
         finally:
             await self.bot.session.close()
 
+    async def start_sharded(self):
+        """Process a share of the update shards alongside other workers"""
+        worker = ShardWorker(
+            Redis.from_url(settings.BOT_STREAM_REDIS_URL),
+            handle=lambda update: self.dp.feed_raw_update(self.bot, update),
+        )
+        await self.dp.emit_startup(bot=self.bot, dispatcher=self.dp, **self.dp.workflow_data)
+        try:
+            await worker.run(self.bot, allowed_updates=self.dp.resolve_used_update_types())
+        finally:
+            try:
+                await self.dp.emit_shutdown(bot=self.bot, dispatcher=self.dp, **self.dp.workflow_data)
+            finally:
+                await self.bot.session.close()
+
 
-def run_bot():
+def run_bot(sharded=False):
     """Run the telegram bot"""
     bot = TelegramBot()
-    asyncio.run(bot.start_polling())
+    asyncio.run(bot.start_sharded() if sharded else bot.start_polling())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,60 @@
+"""
+Dropping Telegram updates that were already delivered.
+
+Webhook retries, a receiver failing over and a shard changing hands can
+all deliver one update_id more than once. Each update is claimed in Redis
+with SET NX under UPDATE_DEDUP_TTL, so one delivery across all processes
+gets through. An in-process Bloom filter of handled updates sits in front:
+a repeat this process has handled is a hit, confirmed with a read-only
+lookup before it is dropped, since a hit may also be a false positive.
+"""
+import hashlib
+import math
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for ``capacity`` keys at ``error_rate`` false positives"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: bytes):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def add(self, key: bytes):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+
+class RecentKeys:
+    """
+    Two Bloom filter generations: once the current one holds ``capacity``
+    keys it becomes the previous one and the oldest keys are forgotten, so
+    memory and the false positive rate (at most twice ``error_rate``) stay
+    bounded however long the process runs.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous = None
+
+    def __contains__(self, key: bytes) -> bool:
+        return key in self.current or (self.previous is not None and key in self.previous)
+
+    def add(self, key: bytes):
+        if self.current.count >= self.capacity:
+            self.previous, self.current = self.current, BloomFilter(self.capacity, self.error_rate)
+        self.current.add(key)
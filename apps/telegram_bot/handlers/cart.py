@@ -10,9 +10,13 @@ from apps.telegram_bot.utils import (
     get_user_cart,
     cart_has_items,
     clear_cart_items,
-    format_cart_text
+    format_cart_text,
+    touch_cart,
+    reserve_cart_items,
+    place_cart_order
 )
 from apps.telegram_bot.states import OrderCreation
+from apps.orders.checkout import EmptyCart
 from apps.products.models import CartItem
 
 User = get_user_model()
@@ -88,6 +92,7 @@ async def remove_item_from_cart(callback: CallbackQuery):
 
         item = await CartItem.objects.aget(id=item_id)
         await item.adelete()
+        await touch_cart(item.cart_id)
 
         await callback.answer(translate_text("Mahsulot savatchadan o'chirildi!", language), show_alert=True)
         await show_cart(callback.message)
@@ -118,6 +123,13 @@ async def start_order(callback: CallbackQuery, state: FSMContext):
             )
             return
 
+        short = await reserve_cart_items(cart)
+        if short:
+            await callback.message.edit_text(
+                translate_text("❗️ Quyidagi mahsulotlar yetarli emas:\n", language) + "\n".join(short)
+            )
+            return
+
         await callback.message.edit_text(
             translate_text("📝 Buyurtma jarayoni boshlandi!\n\nManzilni kiriting:", language)
         )
@@ -161,9 +173,19 @@ async def confirm_order(callback: CallbackQuery, state: FSMContext):
         cart = await get_user_cart(user)
         data = await state.get_data()
 
-        # Here you would typically create an order in database
-        # For now, we'll just show a confirmation
-        await clear_cart_items(cart)
+        try:
+            order, short = await place_cart_order(cart, data.get('address', ''))
+        except EmptyCart:
+            await callback.message.edit_text(translate_text("🛒 Savatchangiz bo'sh", language))
+            await state.clear()
+            return
+        if order is None:
+            await callback.message.edit_text(
+                translate_text("❗️ Quyidagi mahsulotlar yetarli emas:\n", language) + "\n".join(short)
+            )
+            await state.clear()
+            return
+
         await callback.message.edit_text(
             translate_text("✅ Buyurtmangiz qabul qilindi! Tez orada operator siz bilan bog'lanadi.", language)
         )
@@ -6,7 +6,7 @@ from apps.telegram_bot.keyboards import (
     get_products_keyboard,
     get_product_keyboard
 )
-from apps.telegram_bot.utils import translate_text, get_user_language, get_user_by_telegram_id
+from apps.telegram_bot.utils import translate_text, get_user_language, get_user_by_telegram_id, touch_cart
 from apps.products.models import Category, Product, ProductColor, CartItem, Cart
 
 User = get_user_model()
@@ -128,6 +128,9 @@ async def add_to_cart(callback: CallbackQuery):
         color_id = int(callback.data.split('_')[3])
 
         color = await ProductColor.objects.select_related('product').aget(id=color_id)
+        if color.available is not None and color.available < 1:
+            await callback.answer(translate_text("Kechirasiz, bu mahsulot tugagan.", language), show_alert=True)
+            return
         cart, _ = await Cart.objects.aget_or_create(user=user)
 
         item, created = await CartItem.objects.aget_or_create(
@@ -139,6 +142,7 @@ async def add_to_cart(callback: CallbackQuery):
         if not created:
             item.quantity += 1
             await item.asave()
+        await touch_cart(cart.id)
 
         await callback.answer(
             translate_text(f"{color.product.name} ({color.name}) savatchaga qo'shildi!", language),
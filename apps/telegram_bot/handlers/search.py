@@ -0,0 +1,51 @@
+from aiogram import Router, F
+from aiogram.filters import StateFilter
+from aiogram.types import Message, InlineQuery
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from apps.products.search import search_products
+from apps.telegram_bot.inline import inline_results, inline_language
+from apps.telegram_bot.keyboards import get_products_keyboard
+from apps.telegram_bot.utils import translate_text, get_user_language
+
+router = Router()
+
+
+@sync_to_async
+def find_products(query, language):
+    """Search products and build the results keyboard (async)"""
+    products = search_products(query)
+    if not products:
+        return None
+    return get_products_keyboard(products, language)
+
+
+@router.message(StateFilter(None), F.text)
+async def search_by_text(message: Message):
+    """Treat any other text as a product search query"""
+    language = await get_user_language(message.from_user.id)
+    keyboard = await find_products(message.text, language)
+
+    if keyboard is None:
+        await message.answer(translate_text("🔍 Hech narsa topilmadi", language))
+        return
+
+    await message.answer(
+        translate_text("🔍 Qidiruv natijalari:", language),
+        reply_markup=keyboard
+    )
+
+
+@router.inline_query()
+async def search_inline(inline_query: InlineQuery):
+    """Answer inline queries from the precomputed result cache"""
+    language = inline_language(inline_query.from_user)
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    results, next_offset = await sync_to_async(inline_results.page)(inline_query.query, language, offset)
+
+    await inline_query.answer(
+        results,
+        cache_time=settings.INLINE_QUERY_CACHE_TIME,
+        is_personal=True,
+        next_offset=next_offset
+    )
@@ -0,0 +1,35 @@
+import json
+
+from aiogram import Router, F
+from aiogram.types import Message
+from apps.telegram_bot.keyboards import get_cart_keyboard
+from apps.telegram_bot.utils import (
+    translate_text,
+    get_user_language,
+    get_user_by_telegram_id,
+    replace_cart_items,
+    cart_has_items,
+    format_cart_text
+)
+
+router = Router()
+
+
+@router.message(F.web_app_data)
+async def receive_webapp_cart(message: Message):
+    """Take over the cart built in the Mini App storefront and offer checkout"""
+    language = await get_user_language(message.from_user.id)
+    try:
+        user = await get_user_by_telegram_id(message.from_user.id)
+        lines = json.loads(message.web_app_data.data)['items']
+        if not user or not isinstance(lines, list):
+            raise ValueError('Invalid Mini App cart')
+
+        cart, skipped = await replace_cart_items(user, lines)
+        if skipped:
+            await message.answer(translate_text("❗️ Ba'zi mahsulotlar mavjud emas va qo'shilmadi.", language))
+        keyboard = get_cart_keyboard(language) if await cart_has_items(cart) else None
+        await message.answer(await format_cart_text(cart, language), reply_markup=keyboard)
+
+    except (KeyError, TypeError, ValueError):
+        await message.answer(translate_text("Xatolik yuz berdi. Iltimos, qayta urunib ko'ring.", language))
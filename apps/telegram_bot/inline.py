@@ -0,0 +1,100 @@
+"""
+Precomputed inline mode results.
+
+Product cards are rendered once per language for the current catalog
+version, and the ids matching each query string are memoized, so a
+repeated inline query is answered from process memory without touching
+the database.
+"""
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.db.models import Min, Q
+from aiogram.types import InlineQueryResultArticle, InputTextMessageContent
+from modeltranslation.utils import build_localized_fieldname
+
+from apps.products.cache import get_catalog_version
+from apps.products.models import Product
+from apps.products.search import search_product_ids
+
+
+def inline_language(telegram_user) -> str:
+    """Map Telegram's client language onto a shop language"""
+    code = (telegram_user.language_code or '')[:2]
+    languages = dict(settings.LANGUAGES)
+    return code if code in languages else settings.LANGUAGE_CODE
+
+
+class InlineResultCache:
+    def __init__(self, max_queries=None):
+        self.max_queries = max_queries or settings.INLINE_QUERY_CACHE_SIZE
+        self.version = None
+        self.cards = {}
+        self.catalog_ids = []
+        self.queries = OrderedDict()
+        self.lock = Lock()
+
+    def _build_cards(self):
+        name_fields = {code: build_localized_fieldname('name', code) for code, _ in settings.LANGUAGES}
+        description_fields = {code: build_localized_fieldname('description', code) for code, _ in settings.LANGUAGES}
+        rows = Product.objects.filter(is_active=True).annotate(
+            price=Min('colors__price', filter=Q(colors__is_active=True))
+        ).values('id', 'name', 'description', 'price', *name_fields.values(), *description_fields.values())
+
+        cards = {code: {} for code in name_fields}
+        catalog_ids = []
+        for row in rows.iterator(chunk_size=2000):
+            catalog_ids.append(row['id'])
+            for code in cards:
+                name = row[name_fields[code]] or row['name']
+                description = row[description_fields[code]] or row['description']
+                cards[code][row['id']] = InlineQueryResultArticle(
+                    id=str(row['id']),
+                    title=name,
+                    description=f"{row['price'] or 0} so'm",
+                    input_message_content=InputTextMessageContent(
+                        message_text=f"🛍 {name}\n\n{description}".strip()
+                    )
+                )
+        return cards, catalog_ids
+
+    def _refresh(self):
+        version = get_catalog_version()
+        if version != self.version:
+            self.cards, self.catalog_ids = self._build_cards()
+            self.queries.clear()
+            self.version = version
+
+    def _match(self, query):
+        key = ' '.join(query.lower().split())
+        if not key:
+            return self.catalog_ids
+        if key in self.queries:
+            self.queries.move_to_end(key)
+            return self.queries[key]
+        ids = search_product_ids(key, limit=settings.INLINE_QUERY_MAX_RESULTS)
+        self.queries[key] = ids
+        if len(self.queries) > self.max_queries:
+            self.queries.popitem(last=False)
+        return ids
+
+    def page(self, query, language, offset=0):
+        """One page of results and the next_offset to send with it"""
+        with self.lock:
+            self._refresh()
+            ids = self._match(query)
+            cards = self.cards.get(language) or self.cards.get(settings.LANGUAGE_CODE, {})
+
+        page_size = settings.INLINE_QUERY_PAGE_SIZE
+        window = ids[offset:offset + page_size]
+        results = [cards[product_id] for product_id in window if product_id in cards]
+        next_offset = str(offset + page_size) if offset + page_size < len(ids) else ''
+        return results, next_offset
+
+    def warm(self):
+        with self.lock:
+            self._refresh()
+
+
+inline_results = InlineResultCache()
@@ -1,5 +1,6 @@
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
+from django.conf import settings
 from .utils import translate_text
 
 
@@ -10,8 +11,14 @@ def get_main_menu_keyboard(language: str) -> ReplyKeyboardMarkup:
     builder.add(KeyboardButton(text=translate_text("🛒 Savatcha", language)))
     builder.add(KeyboardButton(text=translate_text("📞 Aloqa", language)))
     builder.add(KeyboardButton(text=translate_text("⚙️ Sozlamalar", language)))
+    if settings.STOREFRONT_WEBAPP_URL:
+        # Only a reply keyboard button lets the Mini App send the cart back
+        builder.add(KeyboardButton(
+            text=translate_text("🛍 Do'kon", language),
+            web_app=WebAppInfo(url=f"{settings.STOREFRONT_WEBAPP_URL}?lang={language}")
+        ))
 
-    builder.adjust(2, 2)
+    builder.adjust(2, 2, 1)
     return builder.as_markup(resize_keyboard=True)
 
 
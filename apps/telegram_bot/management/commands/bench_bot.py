@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.telegram_bot.benchmark import (
+    BASELINE_PATH, run_benchmark, format_report, load_baseline, regressions, save_baseline,
+)
+
+
+class Command(BaseCommand):
+    help = ('Replay synthetic Telegram updates against the dispatcher, report throughput '
+            'and fail on a regression against the baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--rounds', type=int, default=1, help='Shopping flows per user')
+        parser.add_argument('--flood-control', action='store_true',
+                            help='Keep send scheduling, per-user throttling and update deduplication enabled')
+        parser.add_argument('--redis-storage', action='store_true',
+                            help='Use the configured Redis FSM storage instead of memory')
+        parser.add_argument('--output', help='Also write the JSON report to this file')
+        parser.add_argument('--baseline', default=str(BASELINE_PATH), help='Baseline file to compare with')
+        parser.add_argument('--tolerance', type=float, default=1.5,
+                            help='Allowed p95 and throughput factor against the baseline')
+        parser.add_argument('--slack-ms', type=float, default=20.0,
+                            help='Allowed p95 milliseconds on top of the tolerance')
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Record this run as the baseline of its profile instead of comparing')
+
+    def handle(self, *args, **options):
+        report = run_benchmark(
+            users=options['users'],
+            concurrency=options['concurrency'],
+            rounds=options['rounds'],
+            flood_control=options['flood_control'],
+            memory_storage=not options['redis_storage'],
+        )
+        text = format_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text)
+        self.stdout.write(text)
+
+        if options['update_baseline']:
+            save_baseline(report, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Recorded the baseline for {report['profile']}"))
+            return
+        baseline = load_baseline(report['profile'], options['baseline'])
+        if baseline is None:
+            self.stdout.write(self.style.WARNING(f"No baseline for {report['profile']}, nothing compared"))
+            return
+        found = regressions(report, baseline, options['tolerance'], options['slack_ms'])
+        if found:
+            raise CommandError('Regressed against the baseline:\n' + '\n'.join(found))
+        self.stdout.write(self.style.SUCCESS('Within the baseline'))
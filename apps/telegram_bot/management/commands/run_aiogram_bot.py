@@ -1,3 +1,9 @@
+import os
+import signal
+import subprocess
+import sys
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from apps.telegram_bot.bot import run_bot
 
@@ -5,6 +11,34 @@ from apps.telegram_bot.bot import run_bot
 class Command(BaseCommand):
     help = 'Run Aiogram Telegram Bot'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--sharded', action='store_true',
+                            help='Share updates with other workers, ordered per user')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Sharded workers to start on this host, one per core')
+
     def handle(self, *args, **options):
+        if options['processes'] > 1:
+            return self.run_processes(options['processes'])
         self.stdout.write(self.style.SUCCESS('Starting Aiogram Telegram Bot...'))
-        run_bot()
\ No newline at end of file
+        run_bot(sharded=options['sharded'])
+
+    def run_processes(self, count):
+        """Start ``count`` sharded workers, each exporting metrics on its own port"""
+        self.stdout.write(self.style.SUCCESS(f'Starting {count} sharded bot workers...'))
+        port = settings.BOT_METRICS_PORT
+        processes = [
+            subprocess.Popen(
+                [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'run_aiogram_bot', '--sharded'],
+                env=dict(os.environ, BOT_METRICS_PORT=str(port + index if port else 0)),
+            )
+            for index in range(count)
+        ]
+        signal.signal(signal.SIGTERM, lambda *_: [process.terminate() for process in processes])
+        try:
+            for process in processes:
+                process.wait()
+        except KeyboardInterrupt:
+            # The workers got the same SIGINT and are handing their shards over
+            for process in processes:
+                process.wait()
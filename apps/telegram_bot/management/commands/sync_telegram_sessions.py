@@ -0,0 +1,49 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from apps.telegram_bot.storage import build_fsm_storage
+from apps.users.models import TelegramUserSession
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Copy FSM state from Redis into TelegramUserSession for the admin'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        synced = asyncio.run(self.sync(options['chunk_size']))
+        self.stdout.write(self.style.SUCCESS(f'Synced {synced} sessions'))
+
+    async def sync(self, chunk_size):
+        storage = build_fsm_storage()
+        users = User.objects.filter(telegram_id__isnull=False).order_by('id').values_list('id', 'telegram_id')
+        synced = 0
+        try:
+            last_id = 0
+            while True:
+                chunk = [row async for row in users.filter(id__gt=last_id)[:chunk_size]]
+                if not chunk:
+                    break
+                last_id = chunk[-1][0]
+                keys = [StorageKey(bot_id=0, chat_id=telegram_id, user_id=telegram_id) for _, telegram_id in chunk]
+                states = await asyncio.gather(*(storage.get_state(key) for key in keys))
+                data = await asyncio.gather(*(storage.get_data(key) for key in keys))
+                sessions = [
+                    TelegramUserSession(user_id=user_id, current_state=state or 'main_menu', session_data=session_data)
+                    for (user_id, _), state, session_data in zip(chunk, states, data)
+                ]
+                await TelegramUserSession.objects.abulk_create(
+                    sessions,
+                    update_conflicts=True,
+                    unique_fields=['user'],
+                    update_fields=['current_state', 'session_data', 'updated_at'],
+                )
+                synced += len(sessions)
+        finally:
+            await storage.close()
+        return synced
@@ -0,0 +1,202 @@
+import hashlib
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import TelegramObject, CallbackQuery, Update
+from django.conf import settings
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from apps.monitoring.metrics import (
+    BOT_HANDLER_DURATION, BOT_HANDLER_ERRORS, BOT_HANDLER_QUERIES, BOT_DUPLICATE_UPDATES
+)
+from apps.telegram_bot.dedup import RecentKeys
+from apps.monitoring.queries import count_queries, should_track_shapes, check_profile
+from config.db_router import pinning_scope, did_write
+
+logger = logging.getLogger(__name__)
+
+# Refill a per-user bucket for the time elapsed, then try to take one token
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return allowed
+"""
+
+
+class DeduplicationMiddleware(BaseMiddleware):
+    """
+    Drops updates that were already delivered, before any filter or handler
+    runs. A hit in the in-process filter only means "maybe seen" and is
+    confirmed in Redis before the update is dropped, so a false positive
+    costs a lookup, never an update. An update that raises gives its claim
+    back, so a redelivery is handled again.
+    """
+
+    def __init__(self, redis: Redis):
+        self.redis = redis
+        self.handled = RecentKeys(settings.UPDATE_DEDUP_CAPACITY, settings.UPDATE_DEDUP_ERROR_RATE)
+
+    async def seen(self, key: str) -> bool:
+        try:
+            return bool(await self.redis.exists(key))
+        except RedisError:
+            logger.warning("Could not look up update %s", key, exc_info=True)
+            return False
+
+    async def claim(self, key: str) -> bool:
+        try:
+            return bool(await self.redis.set(key, 1, nx=True, ex=settings.UPDATE_DEDUP_TTL))
+        except RedisError:
+            # Without Redis, a duplicate is better than a lost update
+            logger.warning("Could not claim update %s, handling it anyway", key, exc_info=True)
+            return True
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        key = f"upd:{data['bot'].id}:{event.update_id}"
+        if key.encode() in self.handled and await self.seen(key):
+            BOT_DUPLICATE_UPDATES.labels('memory').inc()
+            return None
+        if not await self.claim(key):
+            BOT_DUPLICATE_UPDATES.labels('redis').inc()
+            self.handled.add(key.encode())
+            return None
+
+        try:
+            result = await handler(event, data)
+        except Exception:
+            try:
+                await self.redis.delete(key)
+            except RedisError:
+                logger.warning("Could not release update %s", key, exc_info=True)
+            raise
+        self.handled.add(key.encode())
+        return result
+
+
+class ReplicaPinningMiddleware(BaseMiddleware):
+    """Route a user's reads to the primary for a while after their last write"""
+
+    def __init__(self):
+        self.pinned_until: Dict[int, float] = {}
+        self.next_prune = 0.0
+
+    def prune(self, now: float):
+        """Forget expired pins, at most once per pin window"""
+        if now >= self.next_prune:
+            self.pinned_until = {user_id: until for user_id, until in self.pinned_until.items() if until > now}
+            self.next_prune = now + settings.REPLICA_PIN_SECONDS
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        self.prune(now)
+        pinned = self.pinned_until.get(user.id, 0) > now
+
+        with pinning_scope(pinned):
+            try:
+                return await handler(event, data)
+            finally:
+                if did_write():
+                    self.pinned_until[user.id] = now + settings.REPLICA_PIN_SECONDS
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Per-user token bucket in Redis, plus coalescing of repeated presses of
+    the same callback button within CALLBACK_DEBOUNCE_MS. Dropped callbacks
+    are acknowledged straight away so the client stops its spinner.
+    """
+
+    def __init__(self, redis: Redis):
+        self.redis = redis
+        self.take_token = redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def is_duplicate(self, callback: CallbackQuery) -> bool:
+        digest = hashlib.blake2b((callback.data or '').encode(), digest_size=8).hexdigest()
+        key = f"dbn:{callback.from_user.id}:{digest}"
+        return not await self.redis.set(key, 1, nx=True, px=settings.CALLBACK_DEBOUNCE_MS)
+
+    async def is_throttled(self, user_id: int) -> bool:
+        allowed = await self.take_token(
+            keys=[f"tb:{user_id}"],
+            args=[settings.THROTTLE_RATE, settings.THROTTLE_BURST, time.time()]
+        )
+        return not allowed
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+
+        is_callback = isinstance(event, CallbackQuery)
+        if (is_callback and await self.is_duplicate(event)) or await self.is_throttled(user.id):
+            if is_callback:
+                await event.answer()
+            return None
+
+        try:
+            return await handler(event, data)
+        except TelegramBadRequest as e:
+            # Coalesced or laggy presses re-render the same content
+            if 'message is not modified' in str(e):
+                logger.debug("Skipped unchanged edit for user %s", user.id)
+                return None
+            raise
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Latency, error and query metrics per matched handler, named router.handler"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        callback = data['handler'].callback
+        labels = (callback.__module__.rsplit('.', 1)[-1], callback.__name__)
+        started = time.perf_counter()
+        with count_queries(track_shapes=should_track_shapes()) as queries:
+            try:
+                return await handler(event, data)
+            except Exception:
+                BOT_HANDLER_ERRORS.labels(*labels).inc()
+                raise
+            finally:
+                BOT_HANDLER_DURATION.labels(*labels).observe(time.perf_counter() - started)
+                BOT_HANDLER_QUERIES.labels(*labels).observe(queries.count)
+                check_profile('.'.join(labels), queries)
@@ -0,0 +1,113 @@
+"""
+Abandoned cart reminders.
+
+Carts idle for ABANDONED_CART_HOURS are walked in id order, a chunk at a
+time, and each owner gets one reminder. The running bot sends them every
+ABANDONED_CART_INTERVAL seconds, at broadcast priority through its own
+send scheduler, so they share its Telegram rate limits and never hold up
+interactive replies. A Redis lock lets one bot process per interval send.
+A cart is reminded once until its items change again.
+"""
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError, TelegramBadRequest
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Prefetch
+from django.utils import timezone
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from apps.products.models import Cart, CartItem
+from apps.telegram_bot.scheduler import broadcast
+from apps.telegram_bot.utils import translate_text
+
+logger = logging.getLogger(__name__)
+
+REMINDERS_KEY = 'bot:reminders'
+
+
+@sync_to_async
+def fetch_chunk(after_id, hours, chunk_size):
+    """Next ``chunk_size`` abandoned carts with id above ``after_id``"""
+    items = CartItem.objects.select_related('product_color__product').order_by('id')
+    return list(
+        Cart.objects.abandoned(hours)
+        .filter(id__gt=after_id)
+        .select_related('user')
+        .prefetch_related(Prefetch('items', queryset=items))
+        .order_by('id')[:chunk_size]
+    )
+
+
+@sync_to_async
+def mark_reminded(cart_ids, hours):
+    # Carts touched since they were fetched are no longer abandoned
+    return Cart.objects.abandoned(hours).filter(id__in=cart_ids).update(reminder_sent_at=timezone.now())
+
+
+def reminder_text(cart):
+    language = cart.user.language
+    text = translate_text("🛒 Savatchangizda mahsulotlar qoldi:\n\n", language)
+    total = 0
+    for item in cart.items.all():
+        color = item.product_color
+        total += color.price * item.quantity
+        text += f"• {color.product.name} ({color.name}) x {item.quantity}\n"
+    text += f"\n💰 {translate_text('Jami:', language)} {total} so'm\n\n"
+    text += translate_text("Buyurtmani yakunlash uchun «🛒 Savatcha» tugmasini bosing.", language)
+    return text
+
+
+async def send_reminder(bot, cart):
+    """Send one reminder; True when the cart should not be retried"""
+    try:
+        await bot.send_message(chat_id=cart.user.telegram_id, text=reminder_text(cart))
+        return True
+    except (TelegramForbiddenError, TelegramBadRequest) as e:
+        # Blocked the bot or the chat is gone, retrying will not help
+        logger.info("Cart %s reminder not deliverable: %s", cart.id, e)
+        return True
+    except TelegramAPIError as e:
+        logger.warning("Cart %s reminder failed: %s", cart.id, e)
+        return False
+
+
+async def send_reminders(bot, hours=None, chunk_size=None):
+    """Remind every abandoned cart once and return how many were handled"""
+    chunk_size = chunk_size or settings.ABANDONED_CART_CHUNK_SIZE
+    after_id, handled = 0, 0
+    with broadcast():
+        while True:
+            carts = await fetch_chunk(after_id, hours, chunk_size)
+            if not carts:
+                return handled
+            results = await asyncio.gather(*(send_reminder(bot, cart) for cart in carts))
+            done = [cart.id for cart, ok in zip(carts, results) if ok]
+            handled += await mark_reminded(done, hours)
+            after_id = carts[-1].id
+
+
+async def claim_run(redis: Redis, interval: int) -> bool:
+    """Whether this process sends the reminders of the current interval"""
+    try:
+        return bool(await redis.set(REMINDERS_KEY, 1, nx=True, ex=max(1, interval)))
+    except RedisError:
+        logger.warning("Could not take the reminders lock, skipping this run", exc_info=True)
+        return False
+
+
+async def remind_periodically(bot, redis: Redis, interval=None):
+    """Send reminders every ``interval`` seconds, from one bot process at a time"""
+    interval = interval or settings.ABANDONED_CART_INTERVAL
+    while True:
+        await asyncio.sleep(interval)
+        if not await claim_run(redis, interval):
+            continue
+        try:
+            handled = await send_reminders(bot)
+        except Exception:
+            logger.exception("Sending cart reminders failed")
+        else:
+            logger.info("Reminded %s abandoned cart(s)", handled)
@@ -0,0 +1,270 @@
+"""
+Outbound Telegram request scheduling.
+
+Every message-sending API call goes through one priority queue, paced to
+the global and per-chat rate limits, and is sent by one of a few workers
+that retry on ``RetryAfter``. Callback and inline answers jump the queue,
+interactive replies come next and anything sent inside ``broadcast()``
+goes last. A message to a chat that was just sent to waits off the queue
+until the chat's next slot, so a burst to one chat holds up nobody else.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    AnswerCallbackQuery, AnswerInlineQuery, SendMessage, SendPhoto, SendMediaGroup,
+    EditMessageText, EditMessageReplyMarkup, EditMessageCaption, DeleteMessage,
+    CopyMessage, ForwardMessage,
+)
+from django.conf import settings
+
+from apps.monitoring.metrics import (
+    TELEGRAM_SEND_QUEUE_DEPTH, TELEGRAM_SEND_LATENCY, TELEGRAM_SEND_FAILURES, TELEGRAM_SEND_RETRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+URGENT, INTERACTIVE, BROADCAST = 0, 1, 2
+
+URGENT_METHODS = (AnswerCallbackQuery, AnswerInlineQuery)
+SCHEDULED_METHODS = URGENT_METHODS + (
+    SendMessage, SendPhoto, SendMediaGroup, EditMessageText, EditMessageReplyMarkup,
+    EditMessageCaption, DeleteMessage, CopyMessage, ForwardMessage,
+)
+
+_priority = ContextVar('send_priority', default=INTERACTIVE)
+
+
+@contextmanager
+def broadcast():
+    """Queue everything sent in this block behind interactive replies"""
+    token = _priority.set(BROADCAST)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class PooledAiohttpSession(AiohttpSession):
+    """aiohttp session with a sized, keep-alive connection pool"""
+
+    def __init__(self, limit=None, **kwargs):
+        super().__init__(**kwargs)
+        limit = limit or settings.TELEGRAM_CONNECTION_LIMIT
+        self._connector_init.update(
+            limit=limit,
+            limit_per_host=limit,
+            keepalive_timeout=settings.TELEGRAM_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+        )
+
+
+class SendStats:
+    def __init__(self, window=2000):
+        self.latencies = deque(maxlen=window)
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+
+    def observe(self, seconds, ok=True):
+        self.latencies.append(seconds)
+        TELEGRAM_SEND_LATENCY.observe(seconds)
+        if ok:
+            self.sent += 1
+        else:
+            self.failed += 1
+            TELEGRAM_SEND_FAILURES.inc()
+
+    def retried(self):
+        self.retries += 1
+        TELEGRAM_SEND_RETRIES.inc()
+
+    def percentile(self, q):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class SendScheduler(BaseRequestMiddleware):
+    def __init__(self, rate=None, workers=None):
+        self.interval = 1 / (rate or settings.TELEGRAM_GLOBAL_RATE)
+        self.worker_count = workers or settings.TELEGRAM_SEND_WORKERS
+        self.counter = itertools.count()
+        # Requests free to go, by (priority, arrival)
+        self.ready = []
+        # (slot, chat id) of chats whose next request waits for their slot
+        self.delayed = []
+        # Requests per chat that is queued or waiting; a chat is in here
+        # from its first request until its last one has been let through
+        self.waiting = {}
+        self.next_global = 0.0
+        self.next_chat = {}
+        self.paused_until = 0.0
+        self.wakeup = None
+        self.idle_workers = None
+        self.pump = None
+        self.sending = set()
+        self.stats = SendStats()
+        TELEGRAM_SEND_QUEUE_DEPTH.set_function(lambda: self.queue_depth)
+
+    @property
+    def queue_depth(self):
+        return len(self.ready) + sum(len(requests) for requests in self.waiting.values())
+
+    def snapshot(self):
+        """Queue depth and send latency figures for monitoring"""
+        return {
+            'queue_depth': self.queue_depth,
+            'sent': self.stats.sent,
+            'failed': self.stats.failed,
+            'retries': self.stats.retries,
+            'latency_p50': self.stats.percentile(0.5),
+            'latency_p95': self.stats.percentile(0.95),
+            'latency_p99': self.stats.percentile(0.99),
+        }
+
+    def _start(self):
+        if self.pump is None:
+            self.wakeup = asyncio.Event()
+            self.idle_workers = asyncio.Semaphore(self.worker_count)
+            self.pump = asyncio.create_task(self._pump())
+
+    async def close(self):
+        tasks = [self.pump, *self.sending] if self.pump else []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for request in [*self.ready, *itertools.chain.from_iterable(self.waiting.values())]:
+            request[3].cancel()
+        self.ready, self.delayed, self.waiting = [], [], {}
+        self.pump = None
+        self.sending = set()
+
+    async def __call__(self, make_request, bot, method):
+        if not isinstance(method, SCHEDULED_METHODS):
+            return await make_request(bot, method)
+
+        self._start()
+        priority = URGENT if isinstance(method, URGENT_METHODS) else _priority.get()
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue((priority, next(self.counter), time.monotonic(), future, make_request, bot, method))
+        return await future
+
+    @staticmethod
+    def _chat_interval(chat_id):
+        # Telegram allows about one message a second per private chat and
+        # twenty a minute per group
+        return 1.0 if chat_id > 0 else 3.0
+
+    @staticmethod
+    def _chat_of(request):
+        chat_id = getattr(request[-1], 'chat_id', None)
+        return chat_id if isinstance(chat_id, int) else None
+
+    def _enqueue(self, request):
+        chat_id = self._chat_of(request)
+        if chat_id is None:
+            heapq.heappush(self.ready, request)
+        elif chat_id in self.waiting:
+            # Behind the chat's request already queued or waiting
+            heapq.heappush(self.waiting[chat_id], request)
+        else:
+            self.waiting[chat_id] = []
+            slot = self.next_chat.get(chat_id, 0.0)
+            if slot <= time.monotonic():
+                heapq.heappush(self.ready, request)
+            else:
+                heapq.heappush(self.waiting[chat_id], request)
+                heapq.heappush(self.delayed, (slot, chat_id))
+        self.wakeup.set()
+
+    def _promote(self, now):
+        """Move the next request of every chat whose slot has come to the ready queue"""
+        while self.delayed and self.delayed[0][0] <= now:
+            _, chat_id = heapq.heappop(self.delayed)
+            heapq.heappush(self.ready, heapq.heappop(self.waiting[chat_id]))
+
+    def _let_through(self, chat_id, now, sent=True):
+        """Book the chat's next slot, and queue its next request for it"""
+        slot = now + self._chat_interval(chat_id) if sent else self.next_chat.get(chat_id, now)
+        self.next_chat[chat_id] = slot
+        if len(self.next_chat) > 10000:
+            self.next_chat = {chat: at for chat, at in self.next_chat.items() if at > now}
+        if self.waiting[chat_id]:
+            heapq.heappush(self.delayed, (slot, chat_id))
+        else:
+            del self.waiting[chat_id]
+
+    async def _pump(self):
+        """Hand the most urgent ready request to a worker at every global slot"""
+        while True:
+            now = time.monotonic()
+            self._promote(now)
+            if self.ready:
+                wait = max(self.next_global, self.paused_until) - now
+            else:
+                wait = self.delayed[0][0] - now if self.delayed else None
+            if wait is None or wait > 0:
+                self.wakeup.clear()
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self.wakeup.wait(), wait)
+                continue
+
+            await self.idle_workers.acquire()
+            # Whatever arrived while the workers were busy competes too
+            now = time.monotonic()
+            self._promote(now)
+            request = heapq.heappop(self.ready)
+            chat_id = self._chat_of(request)
+            future = request[3]
+            if chat_id is not None:
+                self._let_through(chat_id, now, sent=not future.cancelled())
+            if future.cancelled():
+                self.idle_workers.release()
+                continue
+
+            self.next_global = max(now, self.next_global) + self.interval
+            task = asyncio.create_task(self._deliver(request))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+
+    async def _send(self, make_request, bot, method):
+        for attempt in itertools.count():
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= settings.TELEGRAM_MAX_RETRIES:
+                    raise
+                logger.warning("Flood control on %s, retrying in %s s", type(method).__name__, e.retry_after)
+                self.stats.retried()
+                self.paused_until = max(self.paused_until, time.monotonic() + e.retry_after)
+                await asyncio.sleep(e.retry_after)
+
+    async def _deliver(self, request):
+        priority, _, queued_at, future, make_request, bot, method = request
+        ok = False
+        try:
+            result = await self._send(make_request, bot, method)
+            ok = True
+            if not future.done():
+                future.set_result(result)
+        except asyncio.CancelledError:
+            if not future.done():
+                future.cancel()
+            raise
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            self.stats.observe(time.monotonic() - queued_at, ok)
+            self.idle_workers.release()
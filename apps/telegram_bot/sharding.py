@@ -0,0 +1,254 @@
+"""
+Per-user ordered update processing over several bot processes.
+
+One process at a time, the holder of the receiver lease, long-polls
+Telegram and appends every update to one of BOT_SHARDS Redis streams,
+chosen by the id of the user who sent it. Shards are spread over the live
+workers by rendezvous hashing, and each shard is owned by one worker at a
+time under a lease. The owner handles a shard's entries one after another,
+so a user's updates are processed in the order they arrived, while
+different shards run concurrently within a process and across processes
+and hosts.
+
+When a worker joins or leaves, only the shards whose top-scoring worker
+changed move. The old owner hands a shard over after the update in hand,
+and the new owner resumes after the shard's last committed entry. A worker
+that dies mid-update leaves that update to be handled again by the next
+owner once its lease expires.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import signal
+import socket
+import time
+import uuid
+from contextlib import suppress
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from aiogram import Bot
+from aiogram.methods import GetUpdates
+from aiogram.types import Update
+from aiogram.types.update import UpdateTypeLookupError
+from django.conf import settings
+from redis.asyncio import Redis
+
+from apps.monitoring.metrics import BOT_SHARDS_OWNED, BOT_SHARD_HANDOFFS
+
+logger = logging.getLogger(__name__)
+
+WORKERS_KEY = 'bot:workers'
+RECEIVER_KEY = 'bot:receiver'
+RECEIVER_OFFSET_KEY = 'bot:receiver:offset'
+
+# Extend or drop a lease only while this worker still holds it
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+# Record the last handled entry of a shard, refused once the lease is lost
+COMMIT_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('SET', KEYS[2], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+def stream_key(shard: int) -> str:
+    return f'bot:shard:{shard}'
+
+
+def lease_key(shard: int) -> str:
+    return f'bot:shard:{shard}:owner'
+
+
+def offset_key(shard: int) -> str:
+    return f'bot:shard:{shard}:offset'
+
+
+def _score(worker: str, shard: int) -> int:
+    return int.from_bytes(hashlib.blake2b(f'{worker}:{shard}'.encode(), digest_size=8).digest(), 'big')
+
+
+def owner_of(shard: int, workers: Iterable[str]) -> Optional[str]:
+    """The worker with the highest score for ``shard`` (rendezvous hashing)"""
+    return max(workers, key=lambda worker: _score(worker, shard), default=None)
+
+
+def update_shard(update: Update, shards: int) -> int:
+    """Shard of the user an update comes from; updates without one are spread by id"""
+    try:
+        event = update.event
+    except UpdateTypeLookupError:
+        return update.update_id % shards
+    user = getattr(event, 'from_user', None) or getattr(event, 'user', None)
+    if user is not None:
+        return user.id % shards
+    chat = getattr(event, 'chat', None)
+    return (chat.id if chat is not None else update.update_id) % shards
+
+
+class UpdateReceiver:
+    """Long-polls Telegram while holding the receiver lease and fills the shard streams"""
+
+    def __init__(self, redis: Redis, worker_id: str):
+        self.redis = redis
+        self.worker_id = worker_id
+        self.renew = redis.register_script(RENEW_SCRIPT)
+        self.release = redis.register_script(RELEASE_SCRIPT)
+
+    async def hold_lease(self, ttl_ms: int) -> bool:
+        if await self.renew(keys=[RECEIVER_KEY], args=[self.worker_id, ttl_ms]):
+            return True
+        return bool(await self.redis.set(RECEIVER_KEY, self.worker_id, nx=True, px=ttl_ms))
+
+    async def run(self, bot: Bot, allowed_updates: Optional[List[str]], stopping: asyncio.Event):
+        ttl_ms = settings.BOT_SHARD_LEASE_SECONDS * 1000
+        # The long poll has to return well before the lease runs out
+        polling_timeout = max(1, settings.BOT_SHARD_LEASE_SECONDS // 3)
+        while not stopping.is_set():
+            if not await self.hold_lease(ttl_ms):
+                await asyncio.sleep(polling_timeout)
+                continue
+            offset = await self.redis.get(RECEIVER_OFFSET_KEY)
+            try:
+                updates = await bot(GetUpdates(
+                    offset=int(offset) if offset else None,
+                    timeout=polling_timeout,
+                    allowed_updates=allowed_updates,
+                ), request_timeout=polling_timeout + 10)
+            except Exception as e:
+                logger.error("Failed to fetch updates - %s: %s", type(e).__name__, e)
+                await asyncio.sleep(1)
+                continue
+            if updates:
+                await self.enqueue(updates)
+
+    async def enqueue(self, updates: List[Update]):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for update in updates:
+                pipe.xadd(
+                    stream_key(update_shard(update, settings.BOT_SHARDS)),
+                    {'u': update.model_dump_json(exclude_none=True, by_alias=True)},
+                    maxlen=settings.BOT_STREAM_MAXLEN, approximate=True,
+                )
+            # Telegram confirms everything below the next offset we poll with
+            pipe.set(RECEIVER_OFFSET_KEY, updates[-1].update_id + 1)
+            await pipe.execute()
+
+
+class ShardWorker:
+    """
+    Keeps this process's share of the shards leased and runs one consumer
+    task per owned shard. ``handle`` receives each update as a dict.
+    """
+
+    def __init__(self, redis: Redis, handle: Callable[[Dict[str, Any]], Awaitable[Any]]):
+        self.redis = redis
+        self.handle = handle
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self.shards = settings.BOT_SHARDS
+        self.lease_ms = settings.BOT_SHARD_LEASE_SECONDS * 1000
+        self.renew = redis.register_script(RENEW_SCRIPT)
+        self.release = redis.register_script(RELEASE_SCRIPT)
+        self.commit = redis.register_script(COMMIT_SCRIPT)
+        self.consumers: Dict[int, asyncio.Task] = {}
+        # Shards to give up once the update in hand is done
+        self.handing_off = set()
+        self.stopping = asyncio.Event()
+
+    async def live_workers(self) -> List[str]:
+        now = time.time()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(WORKERS_KEY, {self.worker_id: now})
+            pipe.zremrangebyscore(WORKERS_KEY, 0, now - settings.BOT_SHARD_LEASE_SECONDS)
+            pipe.zrange(WORKERS_KEY, 0, -1)
+            *_, workers = await pipe.execute()
+        return [worker.decode() for worker in workers]
+
+    async def rebalance(self):
+        """Heartbeat, then renew, give up or take shards to match the current workers"""
+        workers = await self.live_workers()
+        wanted = {shard for shard in range(self.shards) if owner_of(shard, workers) == self.worker_id}
+
+        for shard, task in list(self.consumers.items()):
+            # Shards being handed off stay leased until their consumer lets go
+            if not await self.renew(keys=[lease_key(shard)], args=[self.worker_id, self.lease_ms]):
+                logger.warning("Lost the lease of shard %s", shard)
+                task.cancel()
+            elif shard not in wanted:
+                self.handing_off.add(shard)
+
+        for shard in wanted - self.consumers.keys():
+            if await self.redis.set(lease_key(shard), self.worker_id, nx=True, px=self.lease_ms):
+                self.consumers[shard] = asyncio.create_task(self.consume(shard))
+        BOT_SHARDS_OWNED.set(len(self.consumers))
+
+    async def consume(self, shard: int):
+        try:
+            offset = (await self.redis.get(offset_key(shard)) or b'0').decode()
+            while shard not in self.handing_off and not self.stopping.is_set():
+                batches = await self.redis.xread(
+                    {stream_key(shard): offset}, count=settings.BOT_SHARD_BATCH, block=1000
+                )
+                for _, entries in batches:
+                    for entry_id, fields in entries:
+                        if shard in self.handing_off or self.stopping.is_set():
+                            return
+                        try:
+                            await self.handle(json.loads(fields[b'u']))
+                        except Exception:
+                            logger.exception("Update in shard %s failed", shard)
+                        offset = entry_id.decode()
+                        if not await self.commit(
+                            keys=[lease_key(shard), offset_key(shard)], args=[self.worker_id, offset]
+                        ):
+                            logger.warning("Lost the lease of shard %s", shard)
+                            return
+        finally:
+            self.consumers.pop(shard, None)
+            if shard in self.handing_off:
+                BOT_SHARD_HANDOFFS.inc()
+            self.handing_off.discard(shard)
+            with suppress(Exception):
+                await self.release(keys=[lease_key(shard)], args=[self.worker_id])
+
+    async def run(self, bot: Bot, allowed_updates: Optional[List[str]] = None):
+        """Process shards, and receive updates whenever this worker holds the receiver lease, until stopped"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with suppress(NotImplementedError):
+                loop.add_signal_handler(sig, self.stopping.set)
+
+        receiver = UpdateReceiver(self.redis, self.worker_id)
+        receiving = asyncio.create_task(receiver.run(bot, allowed_updates, self.stopping))
+        logger.info("Shard worker %s started", self.worker_id)
+        try:
+            while not self.stopping.is_set():
+                try:
+                    await self.rebalance()
+                except Exception:
+                    logger.exception("Rebalancing shards failed")
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self.stopping.wait(), settings.BOT_SHARD_LEASE_SECONDS / 3)
+        finally:
+            receiving.cancel()
+            # Consumers finish the update in hand and release their leases
+            await asyncio.gather(receiving, *self.consumers.values(), return_exceptions=True)
+            with suppress(Exception):
+                await receiver.release(keys=[RECEIVER_KEY], args=[self.worker_id])
+            with suppress(Exception):
+                await self.redis.zrem(WORKERS_KEY, self.worker_id)
+            logger.info("Shard worker %s stopped", self.worker_id)
@@ -0,0 +1,76 @@
+import json
+from functools import partial
+from typing import Any, Dict, List, Literal, Optional
+
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey, DEFAULT_DESTINY
+from aiogram.fsm.storage.redis import KeyBuilder, RedisStorage
+from django.conf import settings
+
+
+class CompactKeyBuilder(KeyBuilder):
+    """
+    Short FSM keys: ``f:<user>:s`` for private chats and
+    ``f:<chat>:<user>:d`` elsewhere, instead of ``fsm:<chat>:<user>:state``.
+    """
+    parts = {'state': 's', 'data': 'd', 'lock': 'l'}
+
+    def __init__(self, prefix: str = 'f'):
+        self.prefix = prefix
+
+    def build(self, key: StorageKey, part: Literal['data', 'state', 'lock']) -> str:
+        parts = [self.prefix]
+        if key.chat_id != key.user_id:
+            parts.append(str(key.chat_id))
+        parts.append(str(key.user_id))
+        if key.thread_id:
+            parts.append(f't{key.thread_id}')
+        if key.destiny != DEFAULT_DESTINY:
+            parts.append(f'~{key.destiny}')
+        parts.append(self.parts[part])
+        return ':'.join(parts)
+
+
+class ShardedRedisStorage(BaseStorage):
+    """
+    Spreads FSM records over several Redis servers by user id. Changing the
+    number of shards orphans existing records, which then expire by TTL.
+    """
+
+    def __init__(self, shards: List[RedisStorage]):
+        self.shards = shards
+
+    def shard_for(self, key: StorageKey) -> RedisStorage:
+        return self.shards[key.user_id % len(self.shards)]
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.shard_for(key).set_state(key, state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self.shard_for(key).get_state(key)
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self.shard_for(key).set_data(key, data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return await self.shard_for(key).get_data(key)
+
+    async def close(self) -> None:
+        for shard in self.shards:
+            await shard.close()
+
+
+def build_fsm_storage() -> BaseStorage:
+    """FSM storage configured from the FSM_* settings"""
+    shards = [
+        RedisStorage.from_url(
+            url,
+            key_builder=CompactKeyBuilder(),
+            state_ttl=settings.FSM_STATE_TTL or None,
+            data_ttl=settings.FSM_DATA_TTL or None,
+            json_dumps=partial(json.dumps, separators=(',', ':'), ensure_ascii=False),
+        )
+        for url in settings.FSM_REDIS_URLS
+    ]
+    if len(shards) == 1:
+        return shards[0]
+    return ShardedRedisStorage(shards)
@@ -0,0 +1,407 @@
+import asyncio
+import itertools
+import time
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, SendMessage
+from aiogram.types import Update
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from redis.exceptions import ConnectionError
+
+from . import sharding
+from .middlewares import DeduplicationMiddleware
+from .scheduler import SendScheduler
+
+
+class FakeScript:
+    """The lease scripts of apps.telegram_bot.sharding, run against FakeRedis"""
+
+    def __init__(self, redis, text):
+        self.redis = redis
+        self.text = text
+
+    async def __call__(self, keys, args):
+        data = self.redis.data
+        if data.get(keys[0]) != str(args[0]).encode():
+            return 0
+        if self.text == sharding.RELEASE_SCRIPT:
+            del data[keys[0]]
+        elif self.text == sharding.COMMIT_SCRIPT:
+            data[keys[1]] = str(args[1]).encode()
+        return 1
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    async def execute(self):
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+class FakeRedis:
+    """
+    The few Redis commands the bot's middlewares and shard workers use,
+    kept in dicts. Keys do not expire; tests delete them instead.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.sorted_sets = {}
+        self.streams = {}
+        self.entry_ids = itertools.count(1)
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError('Redis is down')
+
+    def register_script(self, text):
+        return FakeScript(self, text)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def set(self, key, value, nx=False, ex=None, px=None):
+        self._check()
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value).encode()
+        return True
+
+    async def get(self, key):
+        self._check()
+        return self.data.get(key)
+
+    async def exists(self, key):
+        self._check()
+        return int(key in self.data)
+
+    async def delete(self, *keys):
+        self._check()
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def zadd(self, key, mapping):
+        self.sorted_sets.setdefault(key, {}).update(mapping)
+
+    async def zremrangebyscore(self, key, low, high):
+        members = self.sorted_sets.setdefault(key, {})
+        for member in [member for member, score in members.items() if low <= score <= high]:
+            del members[member]
+
+    async def zrange(self, key, start, end):
+        members = self.sorted_sets.get(key, {})
+        return [member.encode() for member in sorted(members, key=members.get)]
+
+    async def zrem(self, key, member):
+        self.sorted_sets.get(key, {}).pop(member, None)
+
+    async def xadd(self, key, fields, maxlen=None, approximate=True):
+        entry_id = f'{next(self.entry_ids)}-0'.encode()
+        self.streams.setdefault(key, []).append(
+            (entry_id, {name.encode(): value.encode() for name, value in fields.items()})
+        )
+        return entry_id
+
+    async def xread(self, streams, count=None, block=None):
+        found = []
+        for key, after in streams.items():
+            after = int(str(after).partition('-')[0])
+            entries = [entry for entry in self.streams.get(key, []) if int(entry[0].partition(b'-')[0]) > after]
+            if entries:
+                found.append((key.encode(), entries[:count]))
+        if not found:
+            # Stands in for blocking, briefly
+            await asyncio.sleep(0.005)
+        return found
+
+
+class DeduplicationTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.handled = []
+        self.data = {'bot': SimpleNamespace(id=42)}
+
+    async def handler(self, event, data):
+        self.handled.append(event.update_id)
+        return 'ok'
+
+    async def failing_handler(self, event, data):
+        self.handled.append(event.update_id)
+        raise RuntimeError('handler failed')
+
+    async def deliver(self, middleware, update_id, handler=None):
+        return await middleware(handler or self.handler, Update(update_id=update_id), self.data)
+
+    async def test_redelivery_is_dropped(self):
+        middleware = DeduplicationMiddleware(self.redis)
+        self.assertEqual(await self.deliver(middleware, 1), 'ok')
+        self.assertIsNone(await self.deliver(middleware, 1))
+        self.assertEqual(await self.deliver(middleware, 2), 'ok')
+        self.assertEqual(self.handled, [1, 2])
+
+    async def test_redelivery_to_another_process_is_dropped(self):
+        await self.deliver(DeduplicationMiddleware(self.redis), 1)
+        other = DeduplicationMiddleware(self.redis)
+        self.assertIsNone(await self.deliver(other, 1))
+        # Now known locally too
+        self.assertIn(b'upd:42:1', other.handled)
+        self.assertEqual(self.handled, [1])
+
+    async def test_claim_is_released_when_the_handler_raises(self):
+        middleware = DeduplicationMiddleware(self.redis)
+        with self.assertRaises(RuntimeError):
+            await self.deliver(middleware, 1, self.failing_handler)
+        self.assertNotIn('upd:42:1', self.redis.data)
+        self.assertEqual(await self.deliver(middleware, 1), 'ok')
+        self.assertEqual(self.handled, [1, 1])
+
+    async def test_local_hit_is_confirmed_in_redis(self):
+        middleware = DeduplicationMiddleware(self.redis)
+        # A false positive of the in-process filter, or a claim that expired
+        middleware.handled.add(b'upd:42:1')
+        self.assertEqual(await self.deliver(middleware, 1), 'ok')
+        self.assertEqual(self.handled, [1])
+
+    async def test_updates_are_handled_without_redis(self):
+        middleware = DeduplicationMiddleware(self.redis)
+        self.redis.down = True
+        with self.assertLogs('apps.telegram_bot.middlewares', 'WARNING'):
+            self.assertEqual(await self.deliver(middleware, 1), 'ok')
+            self.assertEqual(await self.deliver(middleware, 1), 'ok')
+        self.assertEqual(self.handled, [1, 1])
+
+
+def message_update(update_id, user_id):
+    return Update.model_validate({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+            'text': str(update_id),
+        },
+    })
+
+
+class RendezvousTests(SimpleTestCase):
+    shards = range(64)
+
+    def owners(self, workers):
+        return {shard: sharding.owner_of(shard, workers) for shard in self.shards}
+
+    def test_every_shard_has_one_owner(self):
+        workers = ['a', 'b', 'c']
+        owners = self.owners(workers)
+        self.assertEqual(owners, self.owners(list(reversed(workers))))
+        self.assertEqual(set(owners.values()), set(workers))
+        self.assertIsNone(sharding.owner_of(0, []))
+
+    def test_only_shards_of_the_changed_worker_move(self):
+        before = self.owners(['a', 'b', 'c'])
+        joined = self.owners(['a', 'b', 'c', 'd'])
+        self.assertTrue(all(joined[shard] in (before[shard], 'd') for shard in self.shards))
+        self.assertIn('d', joined.values())
+        left = self.owners(['a', 'c'])
+        self.assertTrue(all(left[shard] == before[shard] for shard in self.shards if before[shard] != 'b'))
+
+    def test_update_shard_follows_the_user(self):
+        self.assertEqual(sharding.update_shard(message_update(1, 70), 32), 70 % 32)
+        self.assertEqual(sharding.update_shard(message_update(2, 70), 32), 70 % 32)
+        self.assertEqual(sharding.update_shard(Update(update_id=45), 32), 45 % 32)
+
+
+@override_settings(BOT_SHARDS=8, BOT_SHARD_LEASE_SECONDS=15, BOT_SHARD_BATCH=10, BOT_STREAM_MAXLEN=1000)
+class ShardWorkerTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.handled = []
+
+    def worker(self, name):
+        async def handle(update):
+            self.handled.append((name, update['update_id']))
+        return sharding.ShardWorker(self.redis, handle)
+
+    def leases(self):
+        return {
+            shard: self.redis.data.get(sharding.lease_key(shard), b'').decode()
+            for shard in range(settings.BOT_SHARDS)
+        }
+
+    async def settle(self, *workers):
+        """Let consumers drain the streams or finish handing off"""
+        for _ in range(100):
+            await asyncio.sleep(0.005)
+            if not any(worker.handing_off for worker in workers):
+                pending = sum(len(entries) for entries in self.redis.streams.values())
+                if len(self.handled) >= pending:
+                    return
+
+    async def stop(self, *workers):
+        for worker in workers:
+            worker.stopping.set()
+        await asyncio.gather(*(task for worker in workers for task in worker.consumers.values()))
+
+    async def test_lease_handover(self):
+        first, second = self.worker('first'), self.worker('second')
+        await first.rebalance()
+        self.assertEqual(set(first.consumers), set(range(8)))
+
+        # The newcomer waits until the current owner lets go
+        await second.rebalance()
+        self.assertEqual(second.consumers, {})
+        await first.rebalance()
+        await self.settle(first)
+        await second.rebalance()
+
+        owners = {shard: sharding.owner_of(shard, [first.worker_id, second.worker_id]) for shard in range(8)}
+        self.assertEqual(self.leases(), owners)
+        self.assertEqual(set(first.consumers) | set(second.consumers), set(range(8)))
+        self.assertFalse(set(first.consumers) & set(second.consumers))
+        await self.stop(first, second)
+        self.assertEqual(self.leases(), {shard: '' for shard in range(8)})
+
+    async def test_new_owner_resumes_after_the_last_commit(self):
+        first, second = self.worker('first'), self.worker('second')
+        receiver = sharding.UpdateReceiver(self.redis, first.worker_id)
+        users = range(100, 116)
+        await receiver.enqueue([message_update(i, user) for i, user in enumerate(users, start=1)])
+        await first.rebalance()
+        await self.settle(first)
+
+        await second.rebalance()
+        await first.rebalance()
+        await self.settle(first)
+        await second.rebalance()
+        await receiver.enqueue([message_update(i, user) for i, user in enumerate(users, start=17)])
+        await self.settle(first, second)
+        await self.stop(first, second)
+
+        # Every update once, each user's in order, and the second round by the shard's new owner
+        self.assertEqual(sorted(update_id for _, update_id in self.handled), list(range(1, 33)))
+        by_user = {}
+        for name, update_id in self.handled:
+            by_user.setdefault(100 + (update_id - 1) % 16, []).append(update_id)
+        self.assertTrue(all(ids == sorted(ids) for ids in by_user.values()))
+        for name, update_id in self.handled:
+            if update_id > 16:
+                shard = sharding.update_shard(message_update(update_id, 100 + (update_id - 1) % 16), 8)
+                expected = sharding.owner_of(shard, [first.worker_id, second.worker_id])
+                self.assertEqual({'first': first, 'second': second}[name].worker_id, expected)
+        self.assertEqual(await self.redis.get(sharding.RECEIVER_OFFSET_KEY), b'33')
+        self.assertEqual({name for name, _ in self.handled}, {'first', 'second'})
+
+    async def test_consumer_stops_when_its_lease_is_taken(self):
+        worker = self.worker('first')
+        await worker.rebalance()
+        # The lease ran out and another worker took the shard
+        self.redis.data[sharding.lease_key(3)] = b'other'
+        receiver = sharding.UpdateReceiver(self.redis, 'receiver')
+        await receiver.enqueue([message_update(1, 3)])
+        with self.assertLogs('apps.telegram_bot.sharding', 'WARNING'):
+            await self.settle(worker)
+        self.assertNotIn(3, worker.consumers)
+        self.assertEqual(self.redis.data[sharding.lease_key(3)], b'other')
+        self.assertIsNone(await self.redis.get(sharding.offset_key(3)))
+        await self.stop(worker)
+
+
+class FastScheduler(SendScheduler):
+    """Per-chat spacing scaled down so the tests run in milliseconds"""
+
+    @staticmethod
+    def _chat_interval(chat_id):
+        return 0.1 if chat_id > 0 else 0.3
+
+
+class SendSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.sent = []
+        self.started = time.monotonic()
+
+    async def make_request(self, bot, method):
+        self.sent.append((getattr(method, 'chat_id', None), time.monotonic() - self.started))
+        return True
+
+    async def send(self, scheduler, *methods, make_request=None):
+        make_request = make_request or self.make_request
+        try:
+            return await asyncio.gather(*(scheduler(make_request, None, method) for method in methods))
+        finally:
+            await scheduler.close()
+
+    def times(self, chat_id):
+        return [at for chat, at in self.sent if chat == chat_id]
+
+    async def test_messages_to_one_chat_are_spaced(self):
+        scheduler = FastScheduler(rate=1000, workers=4)
+        await self.send(scheduler, *(SendMessage(chat_id=1, text=str(i)) for i in range(3)),
+                        SendMessage(chat_id=-5, text='group'), SendMessage(chat_id=2, text='other'))
+        first, second, third = self.times(1)
+        self.assertGreaterEqual(second - first, 0.09)
+        self.assertGreaterEqual(third - second, 0.09)
+        # Other chats do not wait behind the burst
+        self.assertLess(self.times(2)[0], 0.08)
+        self.assertLess(self.times(-5)[0], 0.08)
+
+    async def test_global_rate(self):
+        scheduler = FastScheduler(rate=50, workers=4)
+        await self.send(scheduler, *(SendMessage(chat_id=chat_id, text='x') for chat_id in range(1, 6)))
+        times = sorted(at for _, at in self.sent)
+        self.assertTrue(all(later - earlier >= 0.015 for earlier, later in zip(times, times[1:])), times)
+
+    async def test_callback_answers_go_first(self):
+        scheduler = FastScheduler(rate=50, workers=1)
+        methods = [SendMessage(chat_id=chat_id, text='x') for chat_id in range(1, 4)]
+        methods.append(AnswerCallbackQuery(callback_query_id='1'))
+        await self.send(scheduler, *methods)
+        # Queued last, sent first
+        self.assertEqual([chat_id for chat_id, _ in self.sent], [None, 1, 2, 3])
+
+    @override_settings(TELEGRAM_MAX_RETRIES=3)
+    async def test_retry_after_pauses_and_retries(self):
+        failures = [0]
+
+        async def make_request(bot, method):
+            if method.chat_id == 1 and not failures[0]:
+                failures[0] += 1
+                error = TelegramRetryAfter(method, 'Flood control exceeded', 1)
+                error.retry_after = 0.2
+                raise error
+            return await self.make_request(bot, method)
+
+        scheduler = FastScheduler(rate=1000, workers=4)
+        with self.assertLogs('apps.telegram_bot.scheduler', 'WARNING'):
+            results = await self.send(scheduler, SendMessage(chat_id=1, text='x'), SendMessage(chat_id=2, text='y'),
+                                      make_request=make_request)
+        self.assertEqual(results, [True, True])
+        self.assertEqual(scheduler.stats.retries, 1)
+        # Nothing goes out while Telegram asked to wait
+        self.assertGreaterEqual(self.times(2)[0], 0.19)
+        self.assertGreaterEqual(self.times(1)[0], 0.19)
+
+    @override_settings(TELEGRAM_MAX_RETRIES=1)
+    async def test_retry_after_gives_up(self):
+        async def make_request(bot, method):
+            error = TelegramRetryAfter(method, 'Flood control exceeded', 1)
+            error.retry_after = 0.01
+            raise error
+
+        scheduler = FastScheduler(rate=1000, workers=1)
+        with self.assertLogs('apps.telegram_bot.scheduler', 'WARNING'):
+            with self.assertRaises(TelegramRetryAfter):
+                await self.send(scheduler, SendMessage(chat_id=1, text='x'), make_request=make_request)
+        self.assertEqual((scheduler.stats.retries, scheduler.stats.failed), (1, 1))
@@ -8,11 +8,18 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'telegram_shop.settings')
 django.setup()
 
 from django.contrib.auth import get_user_model
-from apps.users.models import TelegramUserSession
-from apps.products.models import Cart, CartItem
+from django.db import transaction
+from django.db.models import F, Q
+from apps.products.models import Cart, CartItem, ProductColor
+from apps.products.inventory import reserve_cart, release_cart, OutOfStock
+from apps.orders.checkout import place_order
 
 User = get_user_model()
 
+# Bounds on a cart sent by the Mini App
+MAX_WEBAPP_CART_LINES = 100
+MAX_WEBAPP_CART_QUANTITY = 99
+
 
 # Database operations
 @sync_to_async
@@ -40,14 +47,12 @@ def get_or_create_user(telegram_id: int, telegram_user) -> User:
     try:
         return User.objects.get(telegram_id=telegram_id)
     except User.DoesNotExist:
-        user = User.objects.create(
+        return User.objects.create(
             username=f"user_{telegram_id}",
             telegram_id=telegram_id,
             first_name=telegram_user.first_name or "",
             last_name=telegram_user.last_name or ""
         )
-        TelegramUserSession.objects.create(user=user)
-        return user
 
 
 @sync_to_async
@@ -81,6 +86,65 @@ def get_cart_items(cart):
 def clear_cart_items(cart):
     """Clear all items from cart (async)"""
     cart.items.all().delete()
+    Cart.touch(cart.id)
+    release_cart(cart.id)
+
+
+def _short_item_names(cart, color_ids):
+    items = cart.items.select_related('product_color__product')
+    return [str(item.product_color) for item in items if item.product_color_id in color_ids]
+
+
+@sync_to_async
+def reserve_cart_items(cart):
+    """Hold the cart's items for checkout, returning names of those out of stock (async)"""
+    try:
+        reserve_cart(cart)
+        return []
+    except OutOfStock as e:
+        return _short_item_names(cart, e.color_ids)
+
+
+@sync_to_async
+def place_cart_order(cart, address):
+    """Create the order from the cart, returning (order, names out of stock) (async)"""
+    try:
+        return place_order(cart, address), []
+    except OutOfStock as e:
+        return None, _short_item_names(cart, e.color_ids)
+
+
+@sync_to_async
+def replace_cart_items(user, lines):
+    """
+    Make the cart hold exactly the (color_id, quantity) lines sent by the
+    Mini App, skipping colors that cannot be ordered; returns the cart and
+    how many lines were skipped (async)
+    """
+    quantities = {}
+    for color_id, quantity in lines[:MAX_WEBAPP_CART_LINES]:
+        quantities[int(color_id)] = min(max(int(quantity), 1), MAX_WEBAPP_CART_QUANTITY)
+    orderable = set(ProductColor.objects.filter(
+        Q(stock__isnull=True) | Q(stock__gt=F('reserved')),
+        id__in=quantities, is_active=True, product__is_active=True
+    ).values_list('id', flat=True))
+
+    cart, _ = Cart.objects.get_or_create(user=user)
+    with transaction.atomic():
+        cart.items.all().delete()
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product_color_id=color_id, quantity=quantity)
+            for color_id, quantity in quantities.items() if color_id in orderable
+        ])
+        Cart.touch(cart.id)
+    release_cart(cart.id)
+    return cart, len(quantities) - len(orderable)
+
+
+@sync_to_async
+def touch_cart(cart_id):
+    """Record item activity on a cart after adding or removing (async)"""
+    Cart.touch(cart_id)
 
 
 @sync_to_async
@@ -124,6 +188,16 @@ def translate_text(text: str, language: str) -> str:
             "📝 Buyurtma berish": "📝 Buyurtma berish",
             "Ismingizni kiriting:": "Ismingizni kiriting:",
             "Tilni tanlang:": "Tilni tanlang:",
+            "🔍 Qidiruv natijalari:": "🔍 Qidiruv natijalari:",
+            "🔍 Hech narsa topilmadi": "🔍 Hech narsa topilmadi",
+            "❗️ Quyidagi mahsulotlar yetarli emas:\n": "❗️ Quyidagi mahsulotlar yetarli emas:\n",
+            "Kechirasiz, bu mahsulot tugagan.": "Kechirasiz, bu mahsulot tugagan.",
+            "🛒 Savatchangizda mahsulotlar qoldi:\n\n": "🛒 Savatchangizda mahsulotlar qoldi:\n\n",
+            "Buyurtmani yakunlash uchun «🛒 Savatcha» tugmasini bosing.":
+                "Buyurtmani yakunlash uchun «🛒 Savatcha» tugmasini bosing.",
+            "🛍 Do'kon": "🛍 Do'kon",
+            "❗️ Ba'zi mahsulotlar mavjud emas va qo'shilmadi.":
+                "❗️ Ba'zi mahsulotlar mavjud emas va qo'shilmadi.",
         },
         'ru': {
             "Iltimos, telefon raqamingizni yuboring:": "Пожалуйста, отправьте свой номер телефона:",
@@ -145,6 +219,16 @@ def translate_text(text: str, language: str) -> str:
             "📝 Buyurtma berish": "📝 Оформить заказ",
             "Ismingizni kiriting:": "Введите ваше имя:",
             "Tilni tanlang:": "Выберите язык:",
+            "🔍 Qidiruv natijalari:": "🔍 Результаты поиска:",
+            "🔍 Hech narsa topilmadi": "🔍 Ничего не найдено",
+            "❗️ Quyidagi mahsulotlar yetarli emas:\n": "❗️ Недостаточно на складе:\n",
+            "Kechirasiz, bu mahsulot tugagan.": "Извините, этот товар закончился.",
+            "🛒 Savatchangizda mahsulotlar qoldi:\n\n": "🛒 В вашей корзине остались товары:\n\n",
+            "Buyurtmani yakunlash uchun «🛒 Savatcha» tugmasini bosing.":
+                "Чтобы оформить заказ, нажмите «🛒 Корзина».",
+            "🛍 Do'kon": "🛍 Магазин",
+            "❗️ Ba'zi mahsulotlar mavjud emas va qo'shilmadi.":
+                "❗️ Некоторые товары недоступны и не были добавлены.",
         }
     }
 
@@ -179,4 +263,5 @@ def add_to_cart(user, product_color, quantity=1):
     if not created:
         item.quantity += quantity
         item.save()
+    Cart.touch(cart.id)
     return item
\ No newline at end of file
@@ -27,6 +27,8 @@ class UserAdmin(BaseUserAdmin):
 @admin.register(TelegramUserSession)
 class TelegramUserSessionAdmin(admin.ModelAdmin):
     list_display = ('user', 'current_state', 'current_category', 'current_product')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
     search_fields = ('user__username', 'user__telegram_id')
     readonly_fields = ('session_data',)
     list_filter = ('current_state',)
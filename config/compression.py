@@ -0,0 +1,73 @@
+"""
+Response compression for API payloads.
+
+Bodies of at least RESPONSE_COMPRESSION_MIN_SIZE bytes are compressed with
+Brotli when the client accepts it and the module is installed, otherwise
+with gzip. Below the threshold the framing overhead outweighs the saving.
+Only data formats are compressed: HTML pages carry the CSRF token, and
+compressing them would open them to BREACH. Streaming responses (exports,
+static files) are left as they are.
+"""
+import gzip
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # gzip only without it
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/csv')
+
+_accepts_br = re.compile(r'\bbr\b')
+_accepts_gzip = re.compile(r'\bgzip\b')
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.RESPONSE_GZIP_LEVEL, mtime=0)
+
+
+def choose_encoding(accept_encoding):
+    if brotli is not None and _accepts_br.search(accept_encoding):
+        return 'br'
+    if _accepts_gzip.search(accept_encoding):
+        return 'gzip'
+    return None
+
+
+class CompressionMiddleware:
+    """Brotli or gzip for JSON and CSV bodies above the size threshold"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE
+            or not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES)
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The encoded bytes differ from the identity ones, so a strong ETag becomes weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,98 @@
+"""
+Primary/replica database routing.
+
+Catalog models and order reporting reads go to one of the configured
+replicas, everything else (and every write) goes to ``default``. A caller
+that has just written is pinned to the primary for REPLICA_PIN_SECONDS so
+carts and orders stay read-your-writes despite replication lag. Writes
+only pin inside a ``pinning_scope`` (one request or bot update); outside
+one, say in a long-running background loop, they would pin that context
+for good.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+_pinned = ContextVar('db_primary_pinned', default=False)
+_wrote = ContextVar('db_primary_wrote', default=False)
+_in_scope = ContextVar('db_pinning_scope', default=False)
+
+
+def pin_primary():
+    """Send every read in the current context to the primary"""
+    _pinned.set(True)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def did_write():
+    """Whether a write was routed in the current context"""
+    return _wrote.get()
+
+
+@contextmanager
+def primary_pinned():
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+@contextmanager
+def pinning_scope(pinned=False):
+    """Fresh pin/write flags for one request or bot update"""
+    scope_token = _in_scope.set(True)
+    pin_token = _pinned.set(pinned)
+    write_token = _wrote.set(False)
+    try:
+        yield
+    finally:
+        _wrote.reset(write_token)
+        _pinned.reset(pin_token)
+        _in_scope.reset(scope_token)
+
+
+class PrimaryReplicaRouter:
+    def _replica_for(self, model):
+        replicas = getattr(settings, 'REPLICA_DATABASES', [])
+        if not replicas or _pinned.get():
+            return None
+        if model._meta.label_lower not in settings.REPLICA_READ_MODELS:
+            return None
+        return random.choice(replicas)
+
+    def db_for_read(self, model, **hints):
+        return self._replica_for(model) or 'default'
+
+    def db_for_write(self, model, **hints):
+        if _in_scope.get():
+            _wrote.set(True)
+            _pinned.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaPinningMiddleware:
+    """Keeps a client on the primary for a short window after it writes"""
+    cookie_name = 'db_pin'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = self.cookie_name in request.COOKIES or request.method not in ('GET', 'HEAD', 'OPTIONS')
+        with pinning_scope(pinned):
+            response = self.get_response(request)
+            if did_write():
+                response.set_cookie(self.cookie_name, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True)
+        return response
@@ -0,0 +1,43 @@
+"""
+Gunicorn settings for serving config.asgi with uvicorn workers:
+
+    gunicorn -c config/gunicorn.conf.py
+
+Under ASGI Django runs sync views on one thread per worker process, so
+throughput scales with the number of workers, not connections per worker.
+"""
+import multiprocessing
+import os
+
+# Imported as a module: gunicorn reads a top-level ``config`` as its own setting
+import decouple
+
+wsgi_app = 'config.asgi:application'
+worker_class = 'config.uvicorn_worker.UvicornWorker'
+bind = decouple.config('WEB_BIND', default='0.0.0.0:8000')
+workers = decouple.config('WEB_WORKERS', default=multiprocessing.cpu_count() * 2 + 1, cast=int)
+backlog = decouple.config('WEB_BACKLOG', default=2048, cast=int)
+
+# Idle keep-alive seconds; keep it above the idle timeout of the proxy in
+# front, so the proxy never reuses a connection this side already closed
+keepalive = decouple.config('WEB_KEEPALIVE', default=75, cast=int)
+timeout = decouple.config('WEB_TIMEOUT', default=60, cast=int)
+graceful_timeout = decouple.config('WEB_GRACEFUL_TIMEOUT', default=30, cast=int)
+
+# Recycle workers now and then, staggered, so slow leaks cannot pile up
+max_requests = decouple.config('WEB_MAX_REQUESTS', default=10000, cast=int)
+max_requests_jitter = max_requests // 10
+
+# Import Django once in the master; workers fork with it loaded
+preload_app = decouple.config('WEB_PRELOAD', default=True, cast=bool)
+
+accesslog = decouple.config('WEB_ACCESS_LOG', default=None)  # '-' logs to stdout
+errorlog = '-'
+
+
+def child_exit(server, worker):
+    # Drop the metrics files of a dead worker in Prometheus multiprocess mode
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
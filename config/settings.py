@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
-from decouple import config
+from decouple import config, Csv
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -26,11 +26,12 @@ SECRET_KEY = config('SECRET_KEY')
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = config('DEBUG', default=True, cast=bool)
 
-ALLOWED_HOSTS = ['*']
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='*', cast=Csv())
 
 # Application definition
 
 INSTALLED_APPS = [
+    'modeltranslation',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -43,18 +44,26 @@ INSTALLED_APPS = [
     'apps.products',
     'apps.users',
     'apps.telegram_bot',
+    'apps.monitoring',
+    'apps.analytics',
     # Installed packages
     'rest_framework',
 ]
 
 MIDDLEWARE = [
+    'apps.monitoring.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'config.storefront.StorefrontMiddleware',
+    'config.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'config.db_router.ReplicaPinningMiddleware',
+    'apps.products.cache.CatalogSnapshotMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -98,6 +107,31 @@ DATABASES = {
 #     }
 # }
 
+# Read replicas: one alias per host, same credentials as the primary
+REPLICA_DATABASES = []
+for index, host in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv())):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['config.db_router.PrimaryReplicaRouter']
+
+# Models whose reads may be served by a replica (catalog and order reporting)
+REPLICA_READ_MODELS = [
+    'products.category',
+    'products.product',
+    'products.productcolor',
+    'products.productcolorimage',
+    'orders.order',
+    'orders.orderitem',
+    'analytics.dailysales',
+    'analytics.dailyproductcolorsales',
+    'analytics.dailycategorysales',
+]
+
+# Seconds a client stays on the primary after writing
+REPLICA_PIN_SECONDS = config('DB_REPLICA_PIN_SECONDS', default=5, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -122,6 +156,11 @@ AUTH_PASSWORD_VALIDATORS = [
 
 LANGUAGE_CODE = 'uz'
 
+LANGUAGES = [
+    ('uz', 'Uzbek'),
+    ('ru', 'Russian'),
+]
+
 TIME_ZONE = 'Asia/Tashkent'
 USE_I18N = True
 USE_TZ = True
@@ -134,9 +173,28 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
+# Outside DEBUG, static files are served by WhiteNoise from collectstatic
+# output: hashed names cached for WHITENOISE_MAX_AGE, with gzip and Brotli
+# copies compressed once at collect time
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+WHITENOISE_MAX_AGE = config('WHITENOISE_MAX_AGE', default=60 * 60 * 24 * 365, cast=int)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Mini App storefront snapshot written by `manage.py build_storefront` and
+# served by config.storefront.StorefrontMiddleware, and the public https
+# URL of its index.html for the bot's menu button (empty hides the button)
+STOREFRONT_URL = config('STOREFRONT_URL', default='/storefront/')
+STOREFRONT_ROOT = config('STOREFRONT_ROOT', default=os.path.join(BASE_DIR, 'storefront'))
+STOREFRONT_WEBAPP_URL = config('STOREFRONT_WEBAPP_URL', default='')
+STOREFRONT_THUMBNAIL_SIZE = config('STOREFRONT_THUMBNAIL_SIZE', default=480, cast=int)
+
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -145,21 +203,167 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'apps.api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'apps.api.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    # Decimals reach the renderer as they are and are written as JSON numbers
+    'COERCE_DECIMAL_TO_STRING': False,
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 20
+    'PAGE_SIZE': 20,
+    'DEFAULT_THROTTLE_RATES': {
+        # Per client IP on the anonymous public catalog API
+        'public_catalog': config('PUBLIC_CATALOG_THROTTLE_RATE', default='600/min'),
+    },
 }
 
+# Seconds clients may reuse a catalog API response before revalidating its
+# ETag; 0 revalidates every time, which is answered with 304 when unchanged
+CATALOG_API_MAX_AGE = config('CATALOG_API_MAX_AGE', default=0, cast=int)
+# Public catalog API: seconds browsers, and shared caches such as a CDN, may
+# serve a response without revalidating it
+PUBLIC_CATALOG_MAX_AGE = config('PUBLIC_CATALOG_MAX_AGE', default=60, cast=int)
+PUBLIC_CATALOG_SHARED_MAX_AGE = config('PUBLIC_CATALOG_SHARED_MAX_AGE', default=300, cast=int)
+
+# JSON and CSV responses of at least this many bytes are compressed, with
+# Brotli when the client accepts it and gzip otherwise
+RESPONSE_COMPRESSION_MIN_SIZE = config('RESPONSE_COMPRESSION_MIN_SIZE', default=1024, cast=int)
+RESPONSE_BROTLI_QUALITY = config('RESPONSE_BROTLI_QUALITY', default=4, cast=int)
+RESPONSE_GZIP_LEVEL = config('RESPONSE_GZIP_LEVEL', default=6, cast=int)
+
 # Telegram Bot Settings
 BOT_TOKEN = config('BOT_TOKEN', default='')
 WEBHOOK_URL = config('WEBHOOK_URL', default='')
 
+# Query profiling: a request or bot update running the same SQL shape this
+# many times is logged as a possible N+1. Shapes are always tracked with
+# DEBUG and for the sampled fraction of traffic otherwise.
+N_PLUS_ONE_THRESHOLD = config('N_PLUS_ONE_THRESHOLD', default=5, cast=int)
+QUERY_PROFILE_SAMPLE_RATE = config('QUERY_PROFILE_SAMPLE_RATE', default=0.01, cast=float)
+
+# Query budgets by view name ('product-list') or bot handler
+# ('products.show_category_products'); exceeding one raises when strict
+QUERY_BUDGET_DEFAULT = config('QUERY_BUDGET_DEFAULT', default=50, cast=int)
+QUERY_BUDGETS = {
+    'category-list': 10,
+    'category-detail': 10,
+    'category-children': 10,
+    'category-tree': 10,
+    'category-flat': 10,
+    'product-list': 10,
+    'product-detail': 10,
+    'product-by-category': 10,
+    'product-search': 10,
+    'order-list': 10,
+    'cart-list': 10,
+    'cart-active-carts': 10,
+    'cart-abandoned': 5,
+    'analytics-list': 5,
+    'analytics-products': 5,
+    'analytics-categories': 5,
+}
+QUERY_BUDGET_STRICT = config('QUERY_BUDGET_STRICT', default=False, cast=bool)
+
+# Who may scrape the web /metrics endpoint outside DEBUG: clients in
+# METRICS_ALLOWED_IPS (addresses or networks, as the server sees them, so
+# not the proxy's address behind a reverse proxy) or sending
+# "Authorization: Bearer <METRICS_TOKEN>". Anyone else gets a 404
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='', cast=Csv())
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Port of the bot process's Prometheus exporter, 0 disables it
+BOT_METRICS_PORT = config('BOT_METRICS_PORT', default=9100, cast=int)
+
+# Outbound Bot API requests
+TELEGRAM_GLOBAL_RATE = config('TELEGRAM_GLOBAL_RATE', default=25, cast=float)
+TELEGRAM_SEND_WORKERS = config('TELEGRAM_SEND_WORKERS', default=8, cast=int)
+TELEGRAM_MAX_RETRIES = config('TELEGRAM_MAX_RETRIES', default=3, cast=int)
+TELEGRAM_CONNECTION_LIMIT = config('TELEGRAM_CONNECTION_LIMIT', default=32, cast=int)
+TELEGRAM_KEEPALIVE_TIMEOUT = config('TELEGRAM_KEEPALIVE_TIMEOUT', default=30, cast=int)
+
 # Redis Configuration
 REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/0')
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CACHE_REDIS_URL', default=REDIS_URL),
+    },
+    # Public catalog documents, keyed by catalog version; entries of
+    # superseded versions are left to expire after TIMEOUT seconds
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CATALOG_CACHE_REDIS_URL', default=config('CACHE_REDIS_URL', default=REDIS_URL)),
+        'KEY_PREFIX': 'catalog',
+        'TIMEOUT': config('CATALOG_CACHE_TIMEOUT', default=60 * 60 * 24, cast=int),
+    },
+}
+
+# FSM storage: several URLs shard state by user id; TTLs in seconds, 0 disables
+FSM_REDIS_URLS = config('FSM_REDIS_URLS', default=REDIS_URL, cast=Csv())
+FSM_STATE_TTL = config('FSM_STATE_TTL', default=60 * 60 * 24, cast=int)
+FSM_DATA_TTL = config('FSM_DATA_TTL', default=60 * 60 * 24, cast=int)
+
+# Bot flood control: sustained updates per second, burst size, and the window
+# in which identical callback presses are coalesced
+THROTTLE_RATE = config('THROTTLE_RATE', default=2.0, cast=float)
+THROTTLE_BURST = config('THROTTLE_BURST', default=6, cast=int)
+CALLBACK_DEBOUNCE_MS = config('CALLBACK_DEBOUNCE_MS', default=700, cast=int)
+
+# Update deduplication: seconds an update id stays claimed in Redis, and the
+# size and false positive rate of each in-process Bloom filter generation
+UPDATE_DEDUP_TTL = config('UPDATE_DEDUP_TTL', default=60 * 60 * 24, cast=int)
+UPDATE_DEDUP_CAPACITY = config('UPDATE_DEDUP_CAPACITY', default=100_000, cast=int)
+UPDATE_DEDUP_ERROR_RATE = config('UPDATE_DEDUP_ERROR_RATE', default=1e-6, cast=float)
+
+# Sharded bot workers (`run_aiogram_bot --sharded`): updates are spread over
+# BOT_SHARDS Redis streams by user id, and each shard is leased to one worker
+# for BOT_SHARD_LEASE_SECONDS at a time. Drain the streams before changing
+# BOT_SHARDS, as it remaps users to shards.
+BOT_STREAM_REDIS_URL = config('BOT_STREAM_REDIS_URL', default=REDIS_URL)
+BOT_SHARDS = config('BOT_SHARDS', default=32, cast=int)
+BOT_SHARD_LEASE_SECONDS = config('BOT_SHARD_LEASE_SECONDS', default=15, cast=int)
+BOT_SHARD_BATCH = config('BOT_SHARD_BATCH', default=50, cast=int)
+BOT_STREAM_MAXLEN = config('BOT_STREAM_MAXLEN', default=10000, cast=int)
+
 # Celery Configuration
 CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = REDIS_URL
 
+# Product search
+PRODUCT_SEARCH_LIMIT = config('PRODUCT_SEARCH_LIMIT', default=20, cast=int)
+# Searches slower than this are logged; the p95 target for both backends
+PRODUCT_SEARCH_TARGET_MS = config('PRODUCT_SEARCH_TARGET_MS', default=50, cast=int)
+
+# Inline mode
+INLINE_QUERY_PAGE_SIZE = config('INLINE_QUERY_PAGE_SIZE', default=20, cast=int)
+INLINE_QUERY_MAX_RESULTS = config('INLINE_QUERY_MAX_RESULTS', default=200, cast=int)
+INLINE_QUERY_CACHE_SIZE = config('INLINE_QUERY_CACHE_SIZE', default=5000, cast=int)
+# Seconds Telegram may cache an answer on its side
+INLINE_QUERY_CACHE_TIME = config('INLINE_QUERY_CACHE_TIME', default=300, cast=int)
+
+# Sales rollups: seconds the watermark trails the clock, to leave room for
+# open transactions and replica lag, and the trailing days every run
+# rebuilds so deleted orders and items drop out of them
+ANALYTICS_ROLLUP_LAG = config('ANALYTICS_ROLLUP_LAG', default=60, cast=int)
+ANALYTICS_ROLLUP_RECHECK_DAYS = config('ANALYTICS_ROLLUP_RECHECK_DAYS', default=7, cast=int)
+
+# Abandoned carts: idle hours before a reminder, carts fetched per chunk,
+# and seconds between the bot's reminder runs (0 turns them off)
+ABANDONED_CART_HOURS = config('ABANDONED_CART_HOURS', default=24, cast=int)
+ABANDONED_CART_CHUNK_SIZE = config('ABANDONED_CART_CHUNK_SIZE', default=500, cast=int)
+ABANDONED_CART_INTERVAL = config('ABANDONED_CART_INTERVAL', default=900, cast=int)
+
+# Stock: minutes a cart in checkout holds its items, and the available
+# quantity at or below which a color counts as low on stock
+STOCK_RESERVATION_MINUTES = config('STOCK_RESERVATION_MINUTES', default=15, cast=int)
+LOW_STOCK_THRESHOLD = config('LOW_STOCK_THRESHOLD', default=5, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,34 @@
+"""
+Serving the Mini App storefront snapshot.
+
+`manage.py build_storefront` writes the snapshot under STOREFRONT_ROOT
+while the servers run, so files are looked up on disk per request (one
+stat) rather than indexed at startup as static files are. Versioned
+catalog files and thumbnails never change and are cached for a year,
+index.html is revalidated on every load. Precompressed .br and .gz copies
+are served to clients that accept them.
+"""
+from django.conf import settings
+from whitenoise.base import WhiteNoise
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+IMMUTABLE_DIRECTORIES = ('catalog/', 'thumbs/')
+
+
+class StorefrontMiddleware(WhiteNoiseMiddleware):
+    """STOREFRONT_ROOT under STOREFRONT_URL, in every environment"""
+
+    def __init__(self, get_response=None):
+        self.get_response = get_response
+        WhiteNoise.__init__(self, application=None, autorefresh=True, max_age=0, index_file=True)
+        self.use_finders = False
+        self.prefix = settings.STOREFRONT_URL
+        self.add_files(settings.STOREFRONT_ROOT, prefix=self.prefix)
+
+    def __call__(self, request):
+        if not request.path_info.startswith(self.prefix):
+            return self.get_response(request)
+        return super().__call__(request)
+
+    def immutable_file_test(self, path, url):
+        return url[len(self.prefix):].startswith(IMMUTABLE_DIRECTORIES)
@@ -0,0 +1,7 @@
+from uvicorn.workers import UvicornWorker as BaseUvicornWorker
+
+
+class UvicornWorker(BaseUvicornWorker):
+    # Django does not implement the ASGI lifespan protocol; uvloop and
+    # httptools are picked up when installed
+    CONFIG_KWARGS = {'loop': 'auto', 'http': 'auto', 'lifespan': 'off'}
@@ -0,0 +1,9 @@
+#!/bin/sh
+# Production entry point of the web service: collect static files, refuse
+# to start on settings that are unsafe or unusable for serving, then hand
+# the process over to gunicorn.
+set -e
+
+python manage.py collectstatic --noinput -v0
+python manage.py check --deploy --fail-level ERROR
+exec gunicorn -c config/gunicorn.conf.py "$@"